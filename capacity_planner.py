@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Capacity planning for the podAct_* policy scheme of network_policy.py.
+
+Two steps:
+1. `calibrate` runs netns_bench.py in a local netns setup (root required) and fits
+   the forwarding cost per traversed rule and the install cost per rule.
+2. `plan` draws the same random policy as `network_policy.py initialized` offline,
+   counts the rules every node would carry (each node holds the chains of every pod
+   in the namespace), optionally aggregates them like `optimized --rule-budget`, and
+   predicts forwarding throughput and install time per node from the calibration.
+
+Usage:
+    python3 capacity_planner.py calibrate -o calibration.json
+    python3 capacity_planner.py plan --nodes 3 --pods-per-node 10 50 100 \
+        --calibration calibration.json --rule-budget 20000
+"""
+
+import argparse
+import ipaddress
+import json
+import random
+
+from netns_bench import MSS, run_benchmark
+from policy_plan import POD_CIDR, choose_aggregation_prefix, plan_subchain_rules
+
+
+def fit_line(xs, ys):
+    """Least-squares fit y = a + b * x, returns (a, b)."""
+    n = len(xs)
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return mean_y, 0.0
+    b = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    return mean_y - b * mean_x, b
+
+
+def calibrate(pod_counts, duration):
+    """Measure the stateless forwarding path in netns and fit per-rule costs."""
+    results = run_benchmark(pod_counts, modes=("stateless",), duration=duration)
+    base_ns, per_rule_ns = fit_line([r["rules"] for r in results], [r["ns_per_segment"] for r in results])
+    install_base_s, per_rule_install_s = fit_line([r["installed_rules"] for r in results],
+                                                  [r["install_s"] for r in results])
+    calibration = {
+        "base_ns_per_segment": base_ns,
+        "ns_per_rule": per_rule_ns,
+        "install_base_s": install_base_s,
+        "install_s_per_rule": per_rule_install_s,
+        "samples": results,
+    }
+    print(f"forwarding: {base_ns:.1f} ns/segment + {per_rule_ns:.2f} ns per traversed rule")
+    print(f"install:    {install_base_s:.3f} s + {per_rule_install_s * 1e6:.2f} us per rule")
+    return calibration
+
+
+def simulated_cluster(nodes, pods_per_node):
+    """Return (node networks, pod ips) laid out like a /24-per-node pod CIDR."""
+    cluster_net = ipaddress.ip_network(POD_CIDR)
+    networks = list(cluster_net.subnets(new_prefix=24))[1:nodes + 1]
+    pod_ips = []
+    for net in networks:
+        hosts = net.hosts()
+        next(hosts)  # .1 is the node's bridge address
+        pod_ips += [str(next(hosts)) for _ in range(pods_per_node)]
+    return networks, pod_ips
+
+
+def count_node_rules(nodes, pods_per_node, rule_budget=None, seed=0):
+    """
+    Draw the policy offline and count the rules of one node.
+
+    Returns a dict with the initialized and optimized rule counts, the aggregation
+    prefix and the average number of rules the first packet of a flow walks.
+    """
+    random.seed(seed)
+    networks, pod_ips = simulated_cluster(nodes, pods_per_node)
+    chain_lengths = []
+    chains = []
+    for is_ingress in (True, False):
+        peer_field = 'src' if is_ingress else 'dst'
+        for ip in pod_ips:
+            specs = plan_subchain_rules(ip, pod_ips, is_ingress)
+            chain_lengths.append(len(specs))
+            deny = sum(1 for spec in specs if spec['target'] in ["DROP", "REJECT"])
+            accepts = [(spec[peer_field], spec['protocol'], spec.get('dport'))
+                       for spec in specs if spec['target'] == "ACCEPT" and peer_field in spec]
+            chains.append((deny, accepts))
+
+    # One jump per chain plus the default ACCEPT of INGRESS and EGRESS
+    initialized = sum(chain_lengths) + len(chain_lengths) + 2
+    prefix, optimized = choose_aggregation_prefix(chains, networks, rule_budget)
+    optimized_chain = (optimized - len(chains)) / len(chains)
+    # A packet walks on average half of the INGRESS jump list and half of its pod's chain
+    jump_walk = (len(pod_ips) + 1) / 2
+    return {
+        "pods": len(pod_ips),
+        "initialized_rules": initialized,
+        "optimized_rules": optimized + 2,
+        "prefix": prefix,
+        "initialized_walk": jump_walk + sum(chain_lengths) / len(chain_lengths) / 2,
+        "optimized_walk": jump_walk + optimized_chain / 2,
+    }
+
+
+def predict(calibration, rules, walk):
+    """Predict (throughput in Mbps, install time in seconds) for one node."""
+    ns_per_segment = calibration["base_ns_per_segment"] + calibration["ns_per_rule"] * walk
+    mbps = MSS * 8 / ns_per_segment * 1e3
+    install_s = calibration["install_base_s"] + calibration["install_s_per_rule"] * rules
+    return mbps, install_s
+
+
+def plan(calibration, nodes, pods_per_node_list, rule_budget=None, seed=0):
+    print(f"{'pods/node':>9} {'pods':>6} {'rules':>9} {'Mbps':>9} {'install':>9} | "
+          f"{'prefix':>6} {'opt rules':>9} {'opt Mbps':>9} {'install':>9}")
+    rows = []
+    for pods_per_node in pods_per_node_list:
+        counts = count_node_rules(nodes, pods_per_node, rule_budget, seed)
+        init_mbps, init_install = predict(calibration, counts["initialized_rules"], counts["initialized_walk"])
+        opt_mbps, opt_install = predict(calibration, counts["optimized_rules"], counts["optimized_walk"])
+        print(f"{pods_per_node:>9} {counts['pods']:>6} {counts['initialized_rules']:>9} {init_mbps:>9.1f} "
+              f"{init_install:>8.2f}s | /{counts['prefix']:<5} {counts['optimized_rules']:>9} "
+              f"{opt_mbps:>9.1f} {opt_install:>8.2f}s")
+        rows.append(dict(counts, pods_per_node=pods_per_node, initialized_mbps=init_mbps,
+                         initialized_install_s=init_install, optimized_mbps=opt_mbps,
+                         optimized_install_s=opt_install))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule budget and capacity planner for the podAct_* scheme")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    cal_parser = sub.add_parser("calibrate", help="measure per-rule costs in a local netns setup")
+    cal_parser.add_argument("--pods", type=int, nargs="+", default=[0, 250, 1000, 2000])
+    cal_parser.add_argument("--duration", type=float, default=3.0)
+    cal_parser.add_argument("-o", "--output", default="calibration.json")
+
+    plan_parser = sub.add_parser("plan", help="predict rule counts, throughput and install time per node")
+    plan_parser.add_argument("--nodes", type=int, default=3)
+    plan_parser.add_argument("--pods-per-node", type=int, nargs="+", default=[10, 25, 50, 100, 200])
+    plan_parser.add_argument("--calibration", default="calibration.json")
+    plan_parser.add_argument("--rule-budget", type=int, default=None,
+                             help="rules per node the optimized policy has to fit into")
+    plan_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.cmd == "calibrate":
+        calibration = calibrate(args.pods, args.duration)
+        with open(args.output, "w") as f:
+            json.dump(calibration, f, indent=2)
+        print(f"Calibration written to {args.output}")
+    else:
+        with open(args.calibration) as f:
+            calibration = json.load(f)
+        plan(calibration, args.nodes, args.pods_per_node, args.rule_budget, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Per pod-pair byte accounting from the node's conntrack table.
+
+Used by node_counter_agent.py: every interval it dumps the conntrack table
+(`conntrack -L -o extended` over netlink, or /proc/net/nf_conntrack when the
+tool is missing), diffs the per-flow byte counters against the previous dump
+and pushes the bytes per (src IP, dst IP) pair. net_stat_monitor.py maps the IPs
+to pods, so edge bandwidths are measured instead of guessed from which
+candidate sender happens to have a non-zero TX rate.
+
+Byte counters need `net.netfilter.nf_conntrack_acct=1` (see enable_accounting).
+The real destination of a flow is the source of its reply direction, so traffic
+to a Service IP is attributed to the backend pod after DNAT.
+
+Limitation: bytes a flow moved between the last dump and its removal from the
+table are not seen.
+"""
+
+import ipaddress
+import os
+import subprocess
+
+ACCT_SYSCTL = "sys/net/netfilter/nf_conntrack_acct"
+
+
+def parse_conntrack_line(line):
+    """
+    Parse one conntrack entry (/proc/net/nf_conntrack or `conntrack -L -o extended`).
+
+    Returns (key, src, dst, orig_bytes, reply_bytes) where key identifies the flow
+    by its original-direction 5-tuple, or None for lines without both directions.
+    orig_bytes/reply_bytes are None when byte accounting is disabled.
+    """
+    tokens = line.split()
+    if not tokens:
+        return None
+    proto = tokens[2] if tokens[0] in ("ipv4", "ipv6") and len(tokens) > 2 else tokens[0]
+    orig = {}
+    reply = {}
+    for token in tokens:
+        name, sep, value = token.partition("=")
+        if not sep:
+            continue
+        # The first src/dst/sport/dport/bytes belong to the original direction
+        side = orig if name not in orig else reply
+        side.setdefault(name, value)
+    if "src" not in orig or "src" not in reply:
+        return None
+    key = (proto, orig["src"], orig.get("sport"), orig["dst"], orig.get("dport"))
+    try:
+        orig_bytes = int(orig["bytes"]) if "bytes" in orig else None
+        reply_bytes = int(reply["bytes"]) if "bytes" in reply else None
+    except ValueError:
+        return None
+    return key, orig["src"], reply["src"], orig_bytes, reply_bytes
+
+
+def read_conntrack(proc_root="/proc", conntrack="conntrack"):
+    """
+    Dump the conntrack table, {key: (src, dst, orig_bytes, reply_bytes)}.
+
+    Uses the conntrack tool (netlink) when available, /proc/net/nf_conntrack otherwise.
+    """
+    lines = None
+    if conntrack:
+        try:
+            output = subprocess.run([conntrack, "-L", "-o", "extended"], capture_output=True, text=True, check=True)
+            lines = output.stdout.splitlines()
+        except (OSError, subprocess.CalledProcessError):
+            lines = None
+    if lines is None:
+        with open(os.path.join(proc_root, "net", "nf_conntrack")) as f:
+            lines = f.read().splitlines()
+    flows = {}
+    for line in lines:
+        parsed = parse_conntrack_line(line)
+        if parsed is not None:
+            key, src, dst, orig_bytes, reply_bytes = parsed
+            flows[key] = (src, dst, orig_bytes, reply_bytes)
+    return flows
+
+
+def enable_accounting(proc_root="/proc"):
+    """Turn on conntrack byte accounting, returns False if it is off and cannot be enabled."""
+    path = os.path.join(proc_root, ACCT_SYSCTL)
+    try:
+        with open(path) as f:
+            if f.read().strip() == "1":
+                return True
+        with open(path, "w") as f:
+            f.write("1")
+        return True
+    except OSError as e:
+        print(f"Cannot enable conntrack byte accounting ({path}): {e}")
+        return False
+
+
+class FlowTracker:
+    """Diff successive conntrack dumps into bytes moved per (src, dst) IP pair."""
+
+    def __init__(self, cidr=None):
+        self.network = ipaddress.ip_network(cidr) if cidr else None
+        self.last = {}
+        self.last_ts = None
+        self.unaccounted = 0
+
+    def _tracked(self, src, dst):
+        if self.network is None:
+            return True
+        try:
+            return ipaddress.ip_address(src) in self.network and ipaddress.ip_address(dst) in self.network
+        except ValueError:
+            return False
+
+    def update(self, flows, ts):
+        """
+        Return ({(src, dst): bytes since the previous dump}, seconds since the previous dump).
+        The first dump is only the baseline and returns ({}, None).
+        """
+        first = self.last_ts is None
+        pair_bytes = {}
+        current = {}
+        self.unaccounted = 0
+        for key, (src, dst, orig_bytes, reply_bytes) in flows.items():
+            if not self._tracked(src, dst):
+                continue
+            if orig_bytes is None or reply_bytes is None:
+                self.unaccounted += 1
+                continue
+            current[key] = (orig_bytes, reply_bytes)
+            if first:
+                continue
+            previous = self.last.get(key)
+            if previous is None:
+                # Flow started since the last dump
+                sent, received = orig_bytes, reply_bytes
+            else:
+                sent, received = orig_bytes - previous[0], reply_bytes - previous[1]
+                if sent < 0 or received < 0:
+                    # Same 5-tuple reused by a new connection
+                    sent, received = orig_bytes, reply_bytes
+            if sent:
+                pair_bytes[(src, dst)] = pair_bytes.get((src, dst), 0) + sent
+            if received:
+                pair_bytes[(dst, src)] = pair_bytes.get((dst, src), 0) + received
+        interval = None if first else ts - self.last_ts
+        self.last = current
+        self.last_ts = ts
+        return pair_bytes, interval
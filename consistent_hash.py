@@ -0,0 +1,24 @@
+"""
+Consistent hashing of pods onto monitor shards.
+
+Every shard owns `replicas` points on a hash ring and a pod belongs to the first
+point at or after its own hash, so adding or removing a shard only moves the
+pods of the neighbouring ring segments.
+"""
+
+import bisect
+import hashlib
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, members, replicas=100):
+        self.ring = sorted((_hash(f"{member}#{i}"), member) for member in members for i in range(replicas))
+        self.points = [point for point, _ in self.ring]
+
+    def owner(self, key):
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.ring[index][1]
@@ -0,0 +1,260 @@
+"""
+Persistent exec sessions as counter source for net_stat_monitor.py (--source stream).
+
+For clusters where node_counter_agent.py cannot be deployed. Instead of opening a
+new exec websocket per pod per sample, one long-lived exec per pod runs a tiny
+shell loop that prints "<uptime> <eth0 line of /proc/net/dev>" every interval.
+Sessions are opened by a small pool of connect workers, so a slow or hanging
+exec handshake never stalls the others. One background thread multiplexes all
+connected sessions with a selector (epoll/poll, no FD_SETSIZE limit), keeps the
+latest counters per pod, reconnects broken sessions with backoff and tracks
+per-session lag: how far the arrival of the newest line trails the pod-side
+schedule.
+
+Samples are stamped on the monitor's time.monotonic() clock: the pod's uptime
+only gives the spacing of the lines within one session, anchored at the arrival
+of the session's first line. The uptime itself starts over when the pod's node
+reboots or the pod is rescheduled, it cannot be compared across sessions.
+"""
+
+import selectors
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kubernetes import stream
+
+MAX_BACKOFF = 30.0
+
+
+def counter_loop_command(interval):
+    # /proc/uptime is available in every image; it only orders the lines of one session,
+    # see ExecStreamSessions._consume
+    return [
+        '/bin/sh',
+        '-c',
+        f"while true; do echo \"$(cut -d' ' -f1 /proc/uptime) $(grep eth0 /proc/net/dev)\"; sleep {interval}; done"
+    ]
+
+
+def parse_counter_line(line):
+    """
+    Parse "<uptime> eth0: <rx_bytes> ... <tx_bytes> ..." into (ts, rx_bytes, tx_bytes).
+    Returns None for incomplete lines.
+    """
+    parts = line.replace(':', ' ').split()
+    if len(parts) < 11 or parts[1] != 'eth0':
+        return None
+    try:
+        return float(parts[0]), int(parts[2]), int(parts[10])
+    except ValueError:
+        return None
+
+
+class ExecSession:
+    def __init__(self, pod_name, namespace):
+        self.pod_name = pod_name
+        self.namespace = namespace
+        self.client = None
+        self.buffer = ""
+        # (ts, rx_bytes, tx_bytes) of the newest line, ts on the monitor clock
+        self.latest = None
+        self.lag_s = 0.0
+        self.last_arrival = None
+        # (monitor monotonic time, pod uptime) of the first line since (re)connect
+        self.origin = None
+        self.reconnects = 0
+        self.retry_at = 0.0
+        self.backoff = 1.0
+        # A connect worker is opening the session
+        self.connecting = False
+
+
+class ExecStreamSessions:
+    def __init__(self, api_instance, interval=1.0, connect_workers=8):
+        self.api_instance = api_instance
+        self.interval = interval
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.connector = ThreadPoolExecutor(max_workers=connect_workers)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.connector.shutdown(wait=False)
+        with self.lock:
+            for session in self.sessions.values():
+                self._close(session)
+
+    def sync(self, pods):
+        """Open sessions for new pods and close those of pods no longer listed ([(name, namespace)])."""
+        wanted = dict(pods)
+        with self.lock:
+            for pod_name in list(self.sessions):
+                if pod_name not in wanted:
+                    self._close(self.sessions.pop(pod_name))
+            for pod_name, namespace in wanted.items():
+                if pod_name not in self.sessions:
+                    self.sessions[pod_name] = ExecSession(pod_name, namespace)
+
+    def get_pod_net_stats(self, pod_name):
+        """Return (rx_bytes, tx_bytes, ts) of the newest line or (None, None, None)."""
+        with self.lock:
+            session = self.sessions.get(pod_name)
+            latest = session.latest if session else None
+        if latest is None:
+            return None, None, None
+        ts, rx, tx = latest
+        return rx, tx, ts
+
+    def session_lags(self):
+        """
+        {pod_name: lag in seconds} of the connected sessions. A session that stopped
+        delivering lines lags by the time since its last line minus one interval.
+        """
+        now = time.monotonic()
+        lags = {}
+        with self.lock:
+            for name, s in self.sessions.items():
+                if s.client is None or s.last_arrival is None:
+                    continue
+                lags[name] = max(s.lag_s, now - s.last_arrival - self.interval)
+        return lags
+
+    def reconnect_count(self):
+        with self.lock:
+            return sum(s.reconnects for s in self.sessions.values())
+
+    def _connect(self, session):
+        """Open the exec of a session on a connect worker and hand it to the multiplexer."""
+        try:
+            client = stream.stream(self.api_instance.connect_get_namespaced_pod_exec,
+                                   session.pod_name,
+                                   session.namespace,
+                                   command=counter_loop_command(self.interval),
+                                   stderr=True, stdin=False,
+                                   stdout=True, tty=False,
+                                   _preload_content=False)
+        except Exception as e:
+            print(f"Failed to open exec session for pod {session.pod_name}: {e}")
+            with self.lock:
+                session.retry_at = time.monotonic() + session.backoff
+                session.backoff = min(session.backoff * 2, MAX_BACKOFF)
+                session.connecting = False
+            return
+        with self.lock:
+            session.connecting = False
+            if self.sessions.get(session.pod_name) is not session or not self.running:
+                # Pod was removed while connecting
+                client.close()
+                return
+            session.buffer = ""
+            session.origin = None
+            # backoff is only reset by the first counter line, see _consume
+            session.client = client
+
+    def _close(self, session):
+        if session.client is not None:
+            try:
+                session.client.close()
+            except Exception:
+                pass
+            session.client = None
+
+    def _fail(self, session, reason):
+        print(f"Exec session for pod {session.pod_name} lost: {reason}, reconnecting")
+        self._close(session)
+        session.reconnects += 1
+        session.retry_at = time.monotonic() + session.backoff
+        session.backoff = min(session.backoff * 2, MAX_BACKOFF)
+
+    def _consume(self, session):
+        session.client.update(timeout=0)
+        if not session.client.is_open():
+            self._fail(session, "stream closed")
+            return
+        if not session.client.peek_stdout():
+            return
+        session.buffer += session.client.read_stdout()
+        *lines, session.buffer = session.buffer.split('\n')
+        now = time.monotonic()
+        for line in lines:
+            parsed = parse_counter_line(line)
+            if parsed is None:
+                continue
+            if session.origin is None:
+                session.origin = (now, parsed[0])
+                # The session works, a pod that connects and then dies keeps backing off
+                session.backoff = 1.0
+            uptime, rx, tx = parsed
+            # Emission time on the monitor clock, never before the previous session's samples
+            emitted = session.origin[0] + (uptime - session.origin[1])
+            session.latest = (emitted, rx, tx)
+            session.last_arrival = now
+            session.lag_s = max(0.0, now - emitted)
+
+    def _sync_selector(self, selector, registered, connected):
+        """Register the sockets of new sessions and drop those of closed or reconnected ones."""
+        sockets = {}
+        for session in connected:
+            try:
+                sockets[session] = session.client.sock.sock
+            except AttributeError:
+                pass
+        for session, sock in list(registered.items()):
+            if sockets.get(session) is not sock:
+                try:
+                    selector.unregister(sock)
+                except (KeyError, ValueError):
+                    pass
+                del registered[session]
+        for session, sock in sockets.items():
+            if session not in registered:
+                try:
+                    selector.register(sock, selectors.EVENT_READ, session)
+                except (KeyError, OSError, ValueError):
+                    # Closed under us, the consume pass finds it
+                    continue
+                registered[session] = sock
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        # session -> socket registered with the selector
+        registered = {}
+        last_sweep = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            with self.lock:
+                sessions = list(self.sessions.values())
+                for session in sessions:
+                    if session.client is None and not session.connecting and now >= session.retry_at:
+                        session.connecting = True
+                        self.connector.submit(self._connect, session)
+            connected = [s for s in sessions if s.client is not None]
+            self._sync_selector(selector, registered, connected)
+            if not connected:
+                time.sleep(0.1)
+                continue
+            unselectable = [s for s in connected if s not in registered]
+            try:
+                ready_sessions = [key.data for key, _ in selector.select(0.1)] + unselectable
+            except (OSError, ValueError):
+                # A socket was closed under us, let the consume pass find it
+                ready_sessions = connected
+            if time.monotonic() - last_sweep >= self.interval:
+                # Frames already decrypted into the TLS buffer do not wake the selector
+                ready_sessions = connected
+                last_sweep = time.monotonic()
+            with self.lock:
+                for session in ready_sessions:
+                    if session.client is None:
+                        continue
+                    try:
+                        self._consume(session)
+                    except Exception as e:
+                        self._fail(session, e)
+        selector.close()
@@ -0,0 +1,140 @@
+"""
+Non-blocking metric publisher for the serverless dashboard.
+
+publish() only puts the result into a bounded in-memory queue and returns; one
+background thread sends the queued results in batches over a keep-alive session
+to the dashboard's /update_data_batch endpoint. A slow or unreachable dashboard
+therefore never stalls the caller's sampling loop:
+  - with a coalesce_key (opt-in), a queued result is replaced by a newer one with
+    the same key, for results where only the latest state matters,
+  - when the queue is full the oldest queued result is dropped,
+  - a batch that cannot be delivered is dropped, not retried.
+stats() reports how many results were sent, coalesced and dropped.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+BATCH_PATH = "/update_data_batch"
+
+
+def batch_url(update_url):
+    """Batch endpoint next to a dashboard's /update_data URL."""
+    return update_url.rsplit("/", 1)[0] + BATCH_PATH
+
+
+def dashboard_key(result):
+    """
+    Coalesce key of the dashboard's latest-state results: per edge and mode.
+
+    Results from node 1 in mode 0/1 are also points of the dashboard's bandwidth
+    time series (apply_update in serverless_dashborad.py), they are never coalesced.
+    """
+    if result.get("optimized") in (0, 1) and int(result.get("from", 0)) == 1:
+        return None
+    return result.get("from"), result.get("to"), result.get("optimized")
+
+
+class MetricPublisher:
+    def __init__(self, url, max_queue=1000, batch_size=50, flush_interval=0.2, timeout=2.0, coalesce_key=None):
+        self.url = url
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.coalesce_key = coalesce_key
+        self.session = requests.Session()
+        self.pending = OrderedDict()
+        self.sequence = itertools.count()
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        self.healthy = True
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self, timeout=2.0):
+        """Stop the sender thread after one last attempt to flush the queue."""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def publish(self, result):
+        """Queue one result for the dashboard, never blocks on the network."""
+        with self.cond:
+            key = self.coalesce_key(result) if self.coalesce_key else None
+            if key is not None and key in self.pending:
+                self.pending[key] = result
+                self.coalesced += 1
+                return
+            if len(self.pending) >= self.max_queue:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+            self.pending[key if key is not None else ("seq", next(self.sequence))] = result
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'queued': len(self.pending),
+                'failed_batches': self.failed_batches,
+            }
+
+    def _take_batch(self):
+        batch = []
+        while self.pending and len(batch) < self.batch_size:
+            batch.append(self.pending.popitem(last=False)[1])
+        return batch
+
+    def _send(self, batch):
+        try:
+            response = self.session.post(self.url, json=batch, timeout=self.timeout)
+            ok = response.status_code == 200
+            reason = f"status code {response.status_code}"
+        except Exception as e:
+            ok = False
+            reason = e
+        with self.cond:
+            if ok:
+                self.sent += len(batch)
+            else:
+                self.dropped += len(batch)
+                self.failed_batches += 1
+        if ok != self.healthy:
+            # Only report transitions, an unreachable dashboard would flood the log
+            print(f"Dashboard {self.url} reachable again" if ok else f"Failed to send data to {self.url}: {reason}")
+            self.healthy = ok
+        return ok
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if self.running and len(self.pending) < self.batch_size:
+                    self.cond.wait(self.flush_interval)
+                batch = self._take_batch()
+                running = self.running
+            if batch and not self._send(batch) and running:
+                # Give a failing dashboard a moment before the next attempt
+                time.sleep(self.flush_interval)
+            if not running:
+                with self.cond:
+                    if not self.pending:
+                        return
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 # receiver.py
-import requests
 import json
 import socket
 import sys
@@ -10,16 +9,16 @@ import os
 import struct
 import argparse
 
+from metric_publisher import MetricPublisher, batch_url
 
-def send_data(current_data, server_url='http://47.94.80.218:8888/update_data'):
-    try:
-        response = requests.post(server_url, json=current_data)
-        if response.status_code == 200:
-            pass
-        else:
-            print("Failed to send data.")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+SERVER_URL = 'http://47.94.80.218:8888/update_data'
+# Progress reports go out from a background thread so a slow dashboard never stalls the download.
+# Nothing is coalesced, every report is a point of the dashboard's bandwidth time series.
+publisher = MetricPublisher(batch_url(SERVER_URL)).start()
+
+
+def send_data(current_data):
+    publisher.publish(current_data)
 
 
 def receive_file(algo, host='47.113.180.171', port=5000):
@@ -106,3 +105,5 @@ if __name__ == "__main__":
     algos = ['cubic', 'fastbts']
     receive_file(algos[0])
     receive_file(algos[1])
+    publisher.close()
+    print("[*] Dashboard: {}".format(publisher.stats()))
@@ -96,8 +96,23 @@ def run_tcp_server():
 
 @app.server.route('/update_data', methods=['POST'])
 def update_data():
+    apply_update(request.get_json())
+    return '', 200
+
+
+@app.server.route('/update_data_batch', methods=['POST'])
+def update_data_batch():
+    """A JSON list of /update_data payloads, applied in order (see metric_publisher.py)."""
+    batch = request.get_json()
+    if not isinstance(batch, list):
+        return 'expected a JSON list', 400
+    for data in batch:
+        apply_update(data)
+    return '', 200
+
+
+def apply_update(data):
     global transfer_data, time_usage_data, dialog_visible, dialog_hide_time, rotating_nodes, bandwidth_data
-    data = request.get_json()
     optimized = data.get('optimized', 1)
     from_node = int(data['from'])
     to_node = int(data['to'])
@@ -106,17 +121,17 @@ def update_data():
         latency = 7
         dialog_visible = True
         dialog_hide_time = datetime.datetime.now() + datetime.timedelta(seconds=latency)
-        return '', 200
+        return
     elif optimized == 3:
         dialog_visible = False
         dialog_hide_time = None
-        return '', 200
+        return
     elif optimized == 4:
         # rotating_nodes.add(from_node)
-        return '', 200
+        return
     elif optimized == 5:
         # rotating_nodes.discard(from_node)
-        return '', 200
+        return
 
     edge_key = (from_node, to_node)
     progress = data.get('progress', 0)
@@ -147,8 +162,6 @@ def update_data():
         timestamp = data.get('timeusage', 0)
         bandwidth_data[optimized].append((timestamp, bandwidth))
 
-    return '', 200
-
 ###########################################################################
 #                         PLOTLY GRAPHING FUNCTIONS
 ###########################################################################
@@ -0,0 +1,268 @@
+"""
+Framed NumPy wire format for the stage-to-stage transfers of ml_app.py.
+
+pickle.dumps({'data': ...}) copies every array into one big bytes object and
+pickle.loads copies it again. A frame instead carries the arrays as raw buffers
+behind a small header, so the sender writes memoryviews of the arrays themselves
+and the receiver reads straight into preallocated np.empty arrays:
+
+    MAGIC (4 bytes) | header length (u32) | JSON header | skeleton pickle | array buffers...
+
+The header lists every array as {"name", "dtype", "shape", "nbytes"}. The
+skeleton is the payload pickled (protocol 5) with those arrays replaced by
+persistent ids, so any picklable payload works (dicts of arrays, a fitted model)
+and only arrays of at least MIN_OUT_OF_BAND bytes are moved out of band.
+"""
+
+import io
+import json
+import pickle
+import struct
+
+import numpy as np
+
+MAGIC = b"NPW1"
+CONTENT_TYPE = "application/x-ndarray-frames"
+MIN_OUT_OF_BAND = 1 << 16
+_PREFIX = struct.Struct("!4sI")
+
+
+class _ArrayPickler(pickle.Pickler):
+    def __init__(self, file, arrays):
+        super().__init__(file, protocol=5)
+        self.arrays = arrays
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject and obj.nbytes >= MIN_OUT_OF_BAND:
+            self.arrays.append(obj)
+            return ("ndarray", len(self.arrays) - 1)
+        return None
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    def __init__(self, file, arrays):
+        super().__init__(file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+        kind, index = pid
+        if kind != "ndarray":
+            raise pickle.UnpicklingError(f"unknown persistent id {pid!r}")
+        return self.arrays[index]
+
+
+def _byte_view(array):
+    """Flat uint8 memoryview of a C-contiguous array, for any non-object dtype."""
+    return memoryview(array.reshape(-1).view(np.uint8))
+
+
+def _array_names(obj, prefix=""):
+    """Best-effort names of the arrays in nested dicts ({id(array): "data.X"}), for the header."""
+    names = {}
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            name = f"{prefix}.{key}" if prefix else str(key)
+            if isinstance(value, np.ndarray):
+                names[id(value)] = name
+            else:
+                names.update(_array_names(value, name))
+    return names
+
+
+def encode_frame(obj):
+    """
+    Encode `obj` as one frame. Returns a list of buffers (bytes and memoryviews of
+    the arrays, nothing copied) whose concatenation is the frame.
+    """
+    arrays = []
+    skeleton = io.BytesIO()
+    _ArrayPickler(skeleton, arrays).dump(obj)
+    names = _array_names(obj)
+    names = [names.get(id(array), f"array{i}") for i, array in enumerate(arrays)]
+    # Only non-contiguous arrays (e.g. strided slices) are copied
+    arrays = [array if array.flags.c_contiguous else np.ascontiguousarray(array) for array in arrays]
+    header = json.dumps({
+        "skeleton": skeleton.getbuffer().nbytes,
+        "arrays": [{"name": name,
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                    "nbytes": array.nbytes} for name, array in zip(names, arrays)],
+    }).encode()
+    buffers = [_PREFIX.pack(MAGIC, len(header)), header, skeleton.getbuffer()]
+    buffers += [_byte_view(array) for array in arrays if array.nbytes]
+    return buffers
+
+
+def frame_size(buffers):
+    return sum(memoryview(buffer).nbytes for buffer in buffers)
+
+
+def frame_chunks(buffers, times=1, chunk_size=8192):
+    """Yield the frame `times` times as memoryview slices of at most chunk_size bytes."""
+    for _ in range(times):
+        for buffer in buffers:
+            view = memoryview(buffer).cast("B")
+            for start in range(0, view.nbytes, chunk_size):
+                yield view[start:start + chunk_size]
+
+
+def read_exact(stream, size):
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise EOFError(f"stream ended after {len(data)} of {size} bytes")
+        data += more
+    return data
+
+
+def read_into(stream, view, chunk_size=1 << 20):
+    """Fill `view` from the stream, with readinto() when the stream supports it."""
+    filled = 0
+    readinto = getattr(stream, "readinto", None)
+    while filled < view.nbytes:
+        if readinto is not None:
+            n = readinto(view[filled:filled + chunk_size])
+        else:
+            data = stream.read(min(chunk_size, view.nbytes - filled))
+            n = len(data)
+            view[filled:filled + n] = data
+        if not n:
+            raise EOFError(f"stream ended after {filled} of {view.nbytes} bytes")
+        filled += n
+
+
+def decode_frame(stream):
+    """Read one frame from a file-like stream and return the payload object."""
+    magic, header_len = _PREFIX.unpack(read_exact(stream, _PREFIX.size))
+    if magic != MAGIC:
+        raise ValueError(f"not an array frame (magic {magic!r})")
+    header = json.loads(read_exact(stream, header_len))
+    skeleton = read_exact(stream, header["skeleton"])
+    arrays = []
+    for spec in header["arrays"]:
+        array = np.empty(spec["shape"], dtype=np.dtype(spec["dtype"]))
+        if array.nbytes:
+            read_into(stream, _byte_view(array))
+        arrays.append(array)
+    return _ArrayUnpickler(io.BytesIO(skeleton), arrays).load()
+
+
+def decode_frame_buffer(buffer):
+    """
+    Decode a frame held in memory (e.g. a mapped file) without copying: the
+    arrays are views of the buffer and read-only if it is.
+    """
+    view = memoryview(buffer).cast("B")
+    magic, header_len = _PREFIX.unpack(view[:_PREFIX.size])
+    if magic != MAGIC:
+        raise ValueError(f"not an array frame (magic {magic!r})")
+    offset = _PREFIX.size + header_len
+    header = json.loads(bytes(view[_PREFIX.size:offset]))
+    skeleton = view[offset:offset + header["skeleton"]]
+    offset += header["skeleton"]
+    arrays = []
+    for spec in header["arrays"]:
+        dtype = np.dtype(spec["dtype"])
+        if offset + spec["nbytes"] > view.nbytes:
+            raise EOFError(f"frame ends before array {spec['name']}")
+        array = np.frombuffer(view, dtype=dtype, count=spec["nbytes"] // dtype.itemsize,
+                              offset=offset).reshape(spec["shape"])
+        if not array.flags.aligned:
+            array = array.copy()
+        arrays.append(array)
+        offset += spec["nbytes"]
+    return _ArrayUnpickler(io.BytesIO(skeleton), arrays).load()
+
+
+# Row blocks: arrays sharing their first dimension streamed block by block, so
+# the receiver can work on the first rows while the rest is still in flight:
+#
+#     BLOCK_MAGIC | header length (u32) | JSON header | blocks... | end block
+#
+# The header is {"rows": n, "fields": {name: {"dtype", "shape"}}, "meta": {...}}
+# with the full shape of every field, "meta" carries plain values (e.g. a scale
+# factor). A block is BLOCK_MAGIC | start row (u64) | rows (u32) followed by the
+# raw rows of every field in header order; the end block has 0 rows.
+BLOCKS_CONTENT_TYPE = "application/x-ndarray-blocks"
+BLOCK_MAGIC = b"NPB1"
+_BLOCK = struct.Struct("!4sQI")
+
+
+def encode_block_header(fields, meta=None):
+    """Header buffers of a block stream; fields is {name: (dtype, full shape)}."""
+    rows = {shape[0] for _, shape in fields.values()}
+    if len(rows) != 1:
+        raise ValueError(f"fields differ in their number of rows: {rows}")
+    header = json.dumps({
+        "rows": rows.pop(),
+        "fields": {name: {"dtype": np.dtype(dtype).str, "shape": list(shape)} for name, (dtype, shape) in fields.items()},
+        "meta": meta or {},
+    }).encode()
+    return [_PREFIX.pack(BLOCK_MAGIC, len(header)), header]
+
+
+def encode_block(start, arrays):
+    """Buffers of one block; `arrays` are the rows start.. of every field, in header order."""
+    arrays = [array if array.flags.c_contiguous else np.ascontiguousarray(array) for array in arrays.values()]
+    buffers = [_BLOCK.pack(BLOCK_MAGIC, start, arrays[0].shape[0])]
+    return buffers + [_byte_view(array) for array in arrays if array.nbytes]
+
+
+def encode_block_end():
+    return [_BLOCK.pack(BLOCK_MAGIC, 0, 0)]
+
+
+def block_stream(arrays, block_rows, meta=None):
+    """Yield the buffers of `arrays` as a block stream of block_rows rows per block."""
+    yield from encode_block_header({name: (array.dtype, array.shape) for name, array in arrays.items()}, meta)
+    rows = next(iter(arrays.values())).shape[0]
+    for start in range(0, rows, block_rows):
+        yield from encode_block(start, {name: array[start:start + block_rows] for name, array in arrays.items()})
+    yield from encode_block_end()
+
+
+class BlockReader:
+    """Reads a block stream: the header on construction, then blocks() or read_all()."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        magic, header_len = _PREFIX.unpack(read_exact(stream, _PREFIX.size))
+        if magic != BLOCK_MAGIC:
+            raise ValueError(f"not a block stream (magic {magic!r})")
+        header = json.loads(read_exact(stream, header_len))
+        self.rows = header["rows"]
+        self.fields = {name: (np.dtype(spec["dtype"]), tuple(spec["shape"])) for name, spec in header["fields"].items()}
+        self.meta = header["meta"]
+
+    def _next_block(self):
+        magic, start, rows = _BLOCK.unpack(read_exact(self.stream, _BLOCK.size))
+        if magic != BLOCK_MAGIC:
+            raise ValueError(f"corrupt block stream (magic {magic!r})")
+        return start, rows
+
+    def blocks(self):
+        """Yield (start row, {name: rows}) per block, every block in new arrays."""
+        while True:
+            start, rows = self._next_block()
+            if not rows:
+                return
+            block = {}
+            for name, (dtype, shape) in self.fields.items():
+                array = np.empty((rows,) + shape[1:], dtype=dtype)
+                if array.nbytes:
+                    read_into(self.stream, _byte_view(array))
+                block[name] = array
+            yield start, block
+
+    def read_all(self):
+        """Read every block straight into preallocated full arrays, returns {name: array}."""
+        arrays = {name: np.empty(shape, dtype=dtype) for name, (dtype, shape) in self.fields.items()}
+        while True:
+            start, rows = self._next_block()
+            if not rows:
+                return arrays
+            for array in arrays.values():
+                rows_view = array[start:start + rows]
+                if rows_view.nbytes:
+                    read_into(self.stream, _byte_view(rows_view))
@@ -0,0 +1,103 @@
+"""
+Same-node fast path of the stage transfers of ml_app.py.
+
+Pods on the same node still send their payloads through the Service,
+kube-proxy and the network policy chains. When sender and receiver share a
+node (NODE_NAME, spec.nodeName from the downward API) and mount the same
+hostPath directory (LOCAL_TRANSFER_DIR, preferably a tmpfs like the host's
+/dev/shm), the sender writes the serialized payload once into a file there and
+POSTs only its name in X-Local-Payload. That request over the usual TCP
+connection is the control channel: it carries no body, and its response still
+tells the sender when the receiver is done. The receiver maps the file, decodes
+the payload from the mapping without copying the arrays, and unlinks it. The
+memory goes back once the arrays are released.
+
+Co-location is checked, not assumed: GET /local_transfer returns the receiver's
+locality in X-Local-Transfer ("<node>:<device>:<inode>" of its directory).
+Only an exact match with the sender's own locality enables the fast path, so
+a pod on another node or without the mount always gets the network path.
+"""
+
+import mmap
+import os
+import tempfile
+import threading
+
+LOCAL_HEADER = "X-Local-Payload"
+LOCALITY_HEADER = "X-Local-Transfer"
+FILE_PREFIX = "payload-"
+
+
+class LocalTransfer:
+    def __init__(self, directory, node):
+        self.directory = directory
+        self.node = node
+        self.lock = threading.Lock()
+        # peer -> locality the peer reported
+        self.peers = {}
+        self.locality = self._locality()
+
+    def _locality(self):
+        if not self.directory or not self.node:
+            return None
+        try:
+            stat = os.stat(self.directory)
+        except OSError:
+            return None
+        if not os.access(self.directory, os.W_OK):
+            return None
+        return f"{self.node}:{stat.st_dev}:{stat.st_ino}"
+
+    @property
+    def enabled(self):
+        return self.locality is not None
+
+    def is_local(self, peer, fetch):
+        """Whether a peer shares node and directory with us, asked once through fetch() and remembered."""
+        if not self.enabled:
+            return False
+        with self.lock:
+            if peer in self.peers:
+                return self.peers[peer] == self.locality
+        locality = fetch()
+        if locality is None:
+            # Ask again next time
+            return False
+        with self.lock:
+            self.peers[peer] = locality
+        return locality == self.locality
+
+    def write(self, buffers):
+        """Write a payload given as a list of buffers to a new file, returns its name."""
+        fd, path = tempfile.mkstemp(prefix=FILE_PREFIX, dir=self.directory)
+        try:
+            with open(fd, "wb", buffering=0) as file:
+                for buffer in buffers:
+                    view = memoryview(buffer).cast("B")
+                    while view.nbytes:
+                        view = view[file.write(view):]
+        except BaseException:
+            self.discard(os.path.basename(path))
+            raise
+        return os.path.basename(path)
+
+    def _path(self, name):
+        if os.path.basename(name) != name or not name.startswith(FILE_PREFIX):
+            raise ValueError(f"invalid local payload name {name!r}")
+        return os.path.join(self.directory, name)
+
+    def take(self, name):
+        """Map a payload file read-only and unlink it. Returns (memoryview of the mapping, size)."""
+        path = self._path(name)
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            mapping = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+        os.unlink(path)
+        return memoryview(mapping), size
+
+    def discard(self, name):
+        """Remove a payload file the receiver did not take (failed transfers)."""
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
@@ -1,17 +1,26 @@
-import json
 import os
 import pickle
-import tempfile
-from typing import Dict
+import queue
+import time
 
 import numpy as np
 from sklearn.linear_model import LogisticRegression
 from sklearn.datasets import fetch_openml
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 import threading
 import logging
 import requests
-import shutil
+from urllib.parse import urlsplit
+
+import array_wire
+from local_transfer import LOCAL_HEADER, LOCALITY_HEADER, LocalTransfer
+from payload_cache import CACHED_HEADER, DIGEST_HEADER, PayloadCache, offer_url, payload_digest
+from replica_control import ACK_HEADER, ReplicaProgress, TransferAcks, replayed_copies, send_ack
+from stream_receive import StreamReceive
+from striped_transfer import STRIPE_HEADER, StripeRegistry, parse_stripe, post_striped
+from transfer_codec import ACCEPT_HEADER, CODEC_HEADER, CodecSelector, compressed_copies
+from transport import Transport
+
 # ======================
 # Logging configuration
 # ======================
@@ -37,19 +46,32 @@ logger.addHandler(console_handler)
 # ===========================
 REPLICATION = 6  # Number of times to send data (if needed)
 DATA_SPLIT = 0.6  # Train/test split ratio
+# Wire format of stage transfers: 'frames' (array_wire.py, arrays as raw buffers) or 'pickle'
+WIRE_FORMAT = os.environ.get('WIRE_FORMAT', 'frames').lower()
+# Receivers acknowledge the first copy and senders skip the rest; 1 always sends all REPLICATION copies
+FORCE_FULL_REPLICATION = os.environ.get('FORCE_FULL_REPLICATION', '0') == '1'
+# Send images as uint8 plus a scale factor, consumers normalize on arrival; 0 sends float32
+COMPACT_IMAGES = os.environ.get('COMPACT_IMAGES', '1') == '1'
+IMAGE_SCALE = 1 / 255.0
+# Budget of the content-addressed payload cache, 0 disables the dedup of repeated transfers
+PAYLOAD_CACHE_MB = int(os.environ.get('PAYLOAD_CACHE_MB', '1024'))
+# Transfer compression: 'auto' (every available codec), 'none' or a list like 'zstd,zlib';
+# a codec is only used when it beats sending raw over the link bandwidth measured (initially LINK_MBPS)
+TRANSFER_CODECS = os.environ.get('TRANSFER_CODECS', 'auto').lower()
+LINK_MBPS = float(os.environ.get('LINK_MBPS', '1000'))
+# Chunk size of the streamed request bodies (transfer_bench.py chunks sweeps it)
+TRANSFER_CHUNK_KB = int(os.environ.get('TRANSFER_CHUNK_KB', '256'))
+# Parallel TCP connections one transfer is striped over (striped_transfer.py), 1 disables striping
+TRANSFER_STREAMS = int(os.environ.get('TRANSFER_STREAMS', '1'))
+# Stream row blocks through preprocess (array_wire.py block streams): forwarding starts with the
+# first block instead of after the whole dataset; codecs, striping and the payload cache do not apply
+STREAMING_PIPELINE = os.environ.get('STREAMING_PIPELINE', '0') == '1'
+BLOCK_ROWS = int(os.environ.get('BLOCK_ROWS', '4096'))
+# Same-node fast path (local_transfer.py): payloads for a pod on the same node (NODE_NAME) go through a file
+# in this shared hostPath directory and the request only carries its name; empty disables
+LOCAL_TRANSFER_DIR = os.environ.get('LOCAL_TRANSFER_DIR', '')
+ROLE_PORTS = {'download-0': 5000, 'preprocess-1': 5001, 'train-2': 5002, 'test-3': 5003}
 
-def get_env_vars_with_substring(substring: str) -> Dict[str, str]:
-    """
-    Return a dict of environment variables whose names contain the given substring.
-
-    :param substring: The substring to search for within environment variable names.
-    :return: A dict mapping variable names to their values.
-    """
-    return {
-        key: value
-        for key, value in os.environ.items()
-        if substring in key
-    }
 # ===========================
 # Data download and preprocess functions
 # ===========================
@@ -63,92 +85,291 @@ def download_data():
         mnist = fetch_openml('mnist_784', version=1, as_frame=False, parser="pandas")
         X, y = mnist.data, mnist.target.astype(np.int32)
         logger.info("Data prepared from openml")
-    X = X.reshape(-1, 28, 28)
+    X = compact_images(X.reshape(-1, 28, 28))
     return {'X': X, 'y': y}
 
 
-def jsonlog_send_operation(receivers):
-    FILE = "trans_metrics.json"
-    for receiver in receivers:
-        entry = {
-            "sender": os.environ.get('ROLE', '').lower(),
-            "receiver": receiver,
-        }
-        try:
-            with open(FILE, "w") as f:
-                f.write(json.dumps(entry) + "\n")
-        except Exception as e:
-            print(f"Log error: {str(e)}")
+def compact_images(X):
+    """uint8 copy of X when that is lossless (pixel values 0-255), otherwise X itself."""
+    if not COMPACT_IMAGES or X.dtype == np.uint8:
+        return X
+    compact = X.astype(np.uint8)
+    return compact if np.array_equal(compact, X) else X
 
 
-def log_send_operation(receivers):
-    FILE = "trans_metrics.pkl"
-    # 先收集所有条目
-    entry = { "sender": os.environ.get('ROLE', '').lower(), "receiver": receivers}
+def features(data, block_rows=8192):
+    """
+    X of a train/test payload as float32 in [0, 1]. Compact uint8 payloads are
+    scaled here, block by block into one preallocated array, without float64
+    temporaries.
+    """
+    X = data['X']
+    if 'scale' not in data:
+        return X
+    out = np.empty(X.shape, dtype=np.float32)
+    scale = np.float32(data['scale'])
+    for start in range(0, len(X), block_rows):
+        np.multiply(X[start:start + block_rows], scale, out=out[start:start + block_rows])
+    return out
 
-    try:
-        # 使用二进制写入模式，全量覆盖保存
-        with open(FILE, "wb") as f:
-            pickle.dump(entry, f)
-    except Exception as e:
-        print(f"Log error: {str(e)}")
 
 def preprocess_data(data):
     """
     Preprocess data: flatten images, normalize and split.
+    With COMPACT_IMAGES the uint8 pixels are only split and the consumers
+    normalize them with the 'scale' factor (see features()).
     """
-    X = data['X'].reshape((-1, 28 * 28)).astype('float32') / 255.0
+    X = compact_images(data['X'].reshape((-1, 28 * 28)))
     y = data['y']
     split = int(DATA_SPLIT * len(X))
+    if X.dtype == np.uint8:
+        return ({'X': X[:split], 'y': y[:split], 'scale': IMAGE_SCALE},
+                {'X': X[split:], 'y': y[split:], 'scale': IMAGE_SCALE})
+    X = X.astype('float32') / 255.0
     return {'X': X[:split], 'y': y[:split]}, {'X': X[split:], 'y': y[split:]}
 
 
 # =====================================================
 # Helpers for chunked (streaming) transmission and parse
 # =====================================================
-def chunked_data_generator(payload, times, chunk_size=8192):
+def prepare_payload(obj):
+    """
+    Serialize a payload once in the configured wire format.
+    Returns (buffers, content_type); the buffers are sent back to back.
+    """
+    if WIRE_FORMAT == 'frames':
+        return array_wire.encode_frame(obj), array_wire.CONTENT_TYPE
+    return [pickle.dumps(obj)], "application/octet-stream"
+
+
+transfer_acks = TransferAcks()
+payload_cache = PayloadCache(PAYLOAD_CACHE_MB << 20)
+codec_selector = CodecSelector(TRANSFER_CODECS, LINK_MBPS)
+transport = Transport(TRANSFER_CHUNK_KB << 10, pool_size=max(4, TRANSFER_STREAMS))
+stripe_registry = StripeRegistry()
+local_transfer = LocalTransfer(LOCAL_TRANSFER_DIR, os.environ.get('NODE_NAME'))
+
+
+def fetch_codecs(url):
+    """Codecs the server behind `url` accepts, None if it could not be asked."""
+    parts = urlsplit(url)
+    try:
+        response = transport.get(f"{parts.scheme}://{parts.netloc}/transfer_codecs", timeout=5)
+    except requests.RequestException:
+        return None
+    return [name for name in response.headers.get(ACCEPT_HEADER, '').split(',') if name]
+
+
+def fetch_locality(url):
+    """Locality (node and shared directory) the server behind `url` reports, None if it could not be asked."""
+    parts = urlsplit(url)
+    try:
+        response = transport.get(f"{parts.scheme}://{parts.netloc}/local_transfer", timeout=5)
+    except requests.RequestException:
+        return None
+    return response.headers.get(LOCALITY_HEADER, '')
+
+
+def post_local(url, buffers, headers):
     """
-    Generator function for streaming. It repeats the same payload 'times' times,
-    and splits each repetition into chunks of size 'chunk_size'.
+    Hand the payload to a receiver on the same node: it is written once to a
+    file in LOCAL_TRANSFER_DIR and the request only names it.
     """
-    # payload: bytes
-    # times: int
-    # chunk_size: int
-    for _ in range(times):
-        start = 0
-        while start < len(payload):
-            yield payload[start:start + chunk_size]
-            start += chunk_size
+    begin = time.perf_counter()
+    headers[LOCAL_HEADER] = name = local_transfer.write(buffers)
+    written = time.perf_counter()
+    try:
+        return transport.post(url, data=b"", headers=headers)
+    finally:
+        local_transfer.discard(name)
+        logger.info(f"Local transfer to {url}: {array_wire.frame_size(buffers)} bytes through {name}, "
+                    f"written in {written - begin:.3f}s, done after {time.perf_counter() - begin:.3f}s")
 
 
-def receive_first_object_from_request(flask_request, chunk_size=8192):
+def open_ack(headers):
+    """Register the transfer for the receiver's ack (X-Transfer-Ack), returns its cancel event or None."""
+    if FORCE_FULL_REPLICATION:
+        return None
+    port = ROLE_PORTS.get(os.environ.get('ROLE', '').lower())
+    headers[ACK_HEADER], cancelled = transfer_acks.open(os.environ.get('POD_IP'), port)
+    return cancelled
+
+
+def post_replicated(url, buffers, content_type):
     """
-    从Flask请求流中分块读取数据，逐步构建缓冲区，使用Unpickler正确解析首个完整对象。
-    解析成功后丢弃剩余数据，避免网络缓冲阻塞。
+    POST the payload REPLICATION times in one chunked request over the pooled
+    keep-alive connection to the receiver. Unless
+    FORCE_FULL_REPLICATION is set, the receiver acknowledges the first copy and
+    the remaining ones are not sent. A payload the receiver already has in its
+    payload cache is not sent at all, a receiver on the same node gets it
+    through LOCAL_TRANSFER_DIR.
     """
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_path = temp_file.name
+    headers = {"Content-Type": content_type}
+    if payload_cache.enabled:
+        headers[DIGEST_HEADER] = digest = payload_digest(buffers)
         try:
-            # 分块读取请求数据并写入临时文件
-            while True:
-                chunk = flask_request.stream.read(chunk_size)
-                if not chunk:
-                    break
-                temp_file.write(chunk)
-
-            # 重新以内存映射模式打开临时文件
-            with open(temp_path, 'rb') as file:
-                # 使用pickle的Unpickler流式解析
-                unpickler = pickle.Unpickler(file)
-                try:
-                    obj = unpickler.load()
-                except (EOFError, pickle.UnpicklingError) as e:
-                    raise ValueError("Invalid or incomplete pickle data") from e
-            return obj
-        finally:
-            # 清理临时文件
-            temp_file.close()
-            shutil.os.remove(temp_path)
+            offered = transport.post(offer_url(url, digest), timeout=10).status_code == 200
+        except requests.RequestException:
+            offered = False
+        if offered:
+            response = transport.post(url, data=b"", headers={**headers, CACHED_HEADER: "1"})
+            if response.status_code == 200:
+                logger.info(f"Transfer to {url}: receiver has payload {digest}, "
+                            f"skipped {array_wire.frame_size(buffers) * REPLICATION} bytes")
+                return response
+            # The offer is no reservation, the entry may have been evicted since
+            logger.warning(f"Transfer to {url}: cached payload {digest} refused ({response.status_code}), "
+                           f"sending it in full")
+    peer = urlsplit(url).netloc
+    if local_transfer.is_local(peer, lambda: fetch_locality(url)):
+        return post_local(url, buffers, headers)
+    codec = None
+    if codec_selector.codecs:
+        accepted = codec_selector.peer_codecs(peer, lambda: fetch_codecs(url))
+        codec, estimates = codec_selector.choose(peer, buffers, accepted)
+        logger.info(f"Transfer to {url}: codec {codec or 'none'} at {codec_selector.link(peer):.0f} Mbps, estimated "
+                    + ", ".join(f"{name or 'none'} {seconds:.2f}s" for name, seconds in estimates.items()))
+        if codec:
+            headers[CODEC_HEADER] = codec
+    cancelled = open_ack(headers)
+    body = ReplicaProgress(compressed_copies(buffers, REPLICATION, codec, transport.chunk_size), REPLICATION, cancelled)
+    try:
+        if TRANSFER_STREAMS > 1:
+            return post_striped(transport.post, url, headers, body, TRANSFER_STREAMS)
+        # The (small) response is read completely so the connection goes back to the pool
+        return transport.post(url, data=iter(body), headers=headers)
+    finally:
+        if cancelled is not None:
+            transfer_acks.close(headers[ACK_HEADER])
+        codec_selector.record(peer, body.sent, body.seconds, codec is not None)
+        logger.info(f"Transfer to {url}: {body.summary()}")
+
+
+def post_block_stream(url, buffers):
+    """
+    POST a block stream (array_wire.block_stream) REPLICATION times while it is
+    still being produced: the first copy goes out block by block as the buffers
+    come, the other copies resend them. Acks work as in post_replicated().
+    """
+    headers = {"Content-Type": array_wire.BLOCKS_CONTENT_TYPE}
+    cancelled = open_ack(headers)
+    chunks = array_wire.frame_chunks(buffers, 1, transport.chunk_size)
+    body = ReplicaProgress(replayed_copies(chunks, REPLICATION), REPLICATION, cancelled)
+    try:
+        return transport.post(url, data=iter(body), headers=headers)
+    finally:
+        if cancelled is not None:
+            transfer_acks.close(headers[ACK_HEADER])
+        logger.info(f"Block stream to {url}: {body.summary()}")
+
+
+class BlockForwarder:
+    """
+    Block stream to a downstream stage, sent by a background thread while the
+    blocks are put in. fields is {name: (dtype, full shape)} of the stream.
+    """
+    ABORT = object()
+
+    def __init__(self, url, fields, meta=None):
+        self.url = url
+        self.blocks = queue.Queue(maxsize=16)
+        self.result = None
+        self.ended = False
+        self.thread = threading.Thread(target=self._send, args=(self._buffers(fields, meta),), daemon=True)
+        self.thread.start()
+
+    def _buffers(self, fields, meta):
+        yield from array_wire.encode_block_header(fields, meta)
+        while True:
+            block = self.blocks.get()
+            self.ended = block is None or block is self.ABORT
+            if block is None:
+                break
+            if block is self.ABORT:
+                # Breaks the chunked body off, the receiver fails instead of taking a truncated stream
+                raise RuntimeError("block stream aborted")
+            yield from array_wire.encode_block(*block)
+        yield from array_wire.encode_block_end()
+
+    def _send(self, buffers):
+        try:
+            response = post_block_stream(self.url, buffers)
+            if response.status_code != 200:
+                logger.error(f"Failed to send to {self.url}: {response.text}")
+                self.result = (False, response.text)
+            else:
+                logger.info(f"Data sent to {self.url} successfully")
+                self.result = (True, None)
+        except Exception as e:
+            logger.error(f"Error sending to {self.url}: {str(e)}")
+            self.result = (False, str(e))
+        # Keep taking blocks so a failed transfer never blocks the producer
+        while not self.ended:
+            block = self.blocks.get()
+            self.ended = block is None or block is self.ABORT
+
+    def put(self, start, arrays):
+        self.blocks.put((start, arrays))
+
+    def end(self, abort=False):
+        """End the stream, or break it off."""
+        self.blocks.put(self.ABORT if abort else None)
+
+    def wait(self):
+        """(ok, error) of the transfer once the downstream stage answered."""
+        self.thread.join()
+        return self.result
+
+
+def receive_first_object_from_request(flask_request):
+    """
+    从请求流中直接解析首个完整对象（不再写临时文件），解析成功后立即返回，
+    剩余的重复数据由后台线程读取丢弃，请求结束前在 finish_receive 中等待其完成。
+    """
+    digest = flask_request.headers.get(DIGEST_HEADER)
+    g.payload_digest = digest
+    if digest and flask_request.headers.get(CACHED_HEADER):
+        obj = payload_cache.get(digest)
+        if obj is None:
+            raise ValueError(f"Payload {digest} is no longer cached")
+        logger.info(f"Payload {digest} taken from the cache")
+        return obj
+    local = flask_request.headers.get(LOCAL_HEADER)
+    if local:
+        # Same-node transfer, the arrays are read-only views of the mapped file
+        begin = time.perf_counter()
+        view, size = local_transfer.take(local)
+        if flask_request.mimetype == array_wire.CONTENT_TYPE:
+            obj = array_wire.decode_frame_buffer(view)
+        else:
+            obj = pickle.loads(view)
+        logger.info(f"Payload of {size} bytes taken from local file {local} in {time.perf_counter() - begin:.3f}s")
+        if digest and payload_cache.enabled:
+            payload_cache.put(digest, obj, size)
+        return obj
+    stream = flask_request.stream
+    stripe = flask_request.headers.get(STRIPE_HEADER)
+    if stripe:
+        # Stripe 0: read the payload from the reassembled segments of all stripes, this body included
+        stripe_id, _, count = parse_stripe(stripe)
+        stream = stripe_registry.open(stripe_id, count)
+        feeder = threading.Thread(target=stream.feed, args=(flask_request.stream,), daemon=True)
+        feeder.start()
+        g.stripe = (stripe_id, feeder)
+    receive = StreamReceive(stream, flask_request.mimetype, flask_request.headers.get(CODEC_HEADER))
+    g.stream_receive = receive
+    obj = receive.first_object()
+    if flask_request.mimetype == array_wire.BLOCKS_CONTENT_TYPE:
+        # Block streams carry the bare data dict
+        obj = {'data': obj}
+    logger.info(f"First object after {receive.first_object_s:.3f}s "
+                f"({receive.first_object_bytes} bytes), draining the remaining replicas")
+    ack = flask_request.headers.get(ACK_HEADER)
+    if ack:
+        send_ack(ack, flask_request.remote_addr, transport.post)
+    if digest and payload_cache.enabled:
+        payload_cache.put(digest, obj, receive.first_object_bytes)
+    return obj
 
 
 # def receive_first_object_from_request(flask_request, chunk_size=8192):
@@ -193,6 +414,63 @@ def receive_first_object_from_request(flask_request, chunk_size=8192):
 app = Flask(__name__)
 
 
+@app.before_request
+def feed_stripe():
+    # Stripes other than 0 only carry segments for the request of stripe 0
+    stripe = request.headers.get(STRIPE_HEADER)
+    if stripe:
+        stripe_id, index, count = parse_stripe(stripe)
+        if index:
+            stripe_registry.open(stripe_id, count).feed(request.stream)
+            return jsonify({"status": "stripe received"}), 200
+
+
+@app.teardown_request
+def finish_receive(exc=None):
+    # The remaining replicas must be consumed before the response goes out
+    receive = g.pop('stream_receive', None)
+    if receive is not None:
+        stats = receive.finish().stats()
+        logger.info(f"Request body done after {stats['total_s']:.3f}s, "
+                    f"{stats['drained_bytes']} replica bytes drained")
+    stripe = g.pop('stripe', None)
+    if stripe is not None:
+        stripe_id, feeder = stripe
+        feeder.join()
+        stripe_registry.release(stripe_id)
+
+
+@app.route('/payload_offer/<digest>', methods=['POST'])
+def payload_offer(digest):
+    # 200: the payload is cached here, the sender can skip the transfer
+    if digest in payload_cache:
+        return jsonify({"status": "cached", "cache": payload_cache.stats()}), 200
+    return jsonify({"status": "send"}), 404
+
+
+@app.route('/transfer_codecs', methods=['GET'])
+def transfer_codecs():
+    response = jsonify({"codecs": codec_selector.codecs})
+    response.headers[ACCEPT_HEADER] = ",".join(codec_selector.codecs)
+    return response
+
+
+@app.route('/local_transfer', methods=['GET'])
+def local_transfer_locality():
+    # Senders on the same node with the same shared directory report the same locality
+    response = jsonify({"locality": local_transfer.locality})
+    response.headers[LOCALITY_HEADER] = local_transfer.locality or ''
+    return response
+
+
+@app.route('/transfer_ack/<transfer_id>', methods=['POST'])
+def transfer_ack(transfer_id):
+    # The receiver has the first copy, stop sending the others
+    if transfer_acks.ack(transfer_id):
+        return jsonify({"status": "stopping"}), 200
+    return jsonify({"status": "unknown transfer"}), 404
+
+
 # ---------------------------
 # Download module (ROLE=download)
 # ---------------------------
@@ -204,27 +482,19 @@ def download_handler():
         next_host = os.environ['NEXT_HOST']  # e.g., "mlpipe-preprocess"
         next_port = os.environ['NEXT_PORT']  # e.g., "5001"
         url = f"http://{next_host}:{next_port}/receive"
-        log_send_operation([next_host])
-
-        # Serialize once
-        payload = pickle.dumps({'data': raw_data})
-        logger.info(f"Serializing data: {len(payload)} bytes total")
-
-        # Prepare generator for streaming repeated data
-        def stream_generator():
-            """Yield the same pickled payload REPLICATION times in chunks."""
-            yield from chunked_data_generator(payload, REPLICATION, 4096)
 
+        if not STREAMING_PIPELINE:
+            # Serialize once
+            payload, content_type = prepare_payload({'data': raw_data})
+            logger.info(f"Serializing data: {array_wire.frame_size(payload)} bytes total ({WIRE_FORMAT})")
 
         # Send data in a chunked (streamed) manner
         logger.info(f"Sending raw data to {url} in streaming mode, repeated {REPLICATION} times...")
         try:
-            response = requests.post(
-                url,
-                data=stream_generator(),
-                headers={"Content-Type": "application/octet-stream"},
-                stream=True  # This is for requests to also use chunked encoding
-            )
+            if STREAMING_PIPELINE:
+                response = post_block_stream(url, array_wire.block_stream(raw_data, BLOCK_ROWS))
+            else:
+                response = post_replicated(url, payload, content_type)
             if response.status_code == 200:
                 logger.info("Data sent successfully")
                 return jsonify({"status": "data sent successfully"}), 200
@@ -242,46 +512,104 @@ def download_handler():
 # ---------------------------
 # Preprocess module (ROLE=preprocess)
 # ---------------------------
+def preprocess_blocks(flask_request, url_train, url_test):
+    """
+    Cut-through preprocessing of a block stream: every block is flattened,
+    normalized (unless COMPACT_IMAGES) and forwarded to train or test while the
+    next one is still arriving. Returns the (ok, error) results of both transfers.
+    """
+    receive = StreamReceive(flask_request.stream, flask_request.mimetype)
+    g.stream_receive = receive
+    forwarders = []
+
+    def forward(stream):
+        reader = array_wire.BlockReader(stream)
+        x_dtype, x_shape = reader.fields['X']
+        y_dtype = reader.fields['y'][0]
+        split = int(DATA_SPLIT * reader.rows)
+        compact = COMPACT_IMAGES and x_dtype == np.uint8
+        out_dtype = np.uint8 if compact else np.float32
+        meta = {'scale': IMAGE_SCALE} if compact else {}
+        width = int(np.prod(x_shape[1:]))
+        for url, rows in ((url_train, split), (url_test, reader.rows - split)):
+            fields = {'X': (out_dtype, (rows, width)), 'y': (y_dtype, (rows,))}
+            forwarders.append(BlockForwarder(url, fields, meta))
+        train, test = forwarders
+        for start, block in reader.blocks():
+            X = block['X'].reshape((len(block['X']), width))
+            if not compact:
+                X = X.astype(np.float32) / np.float32(255.0)
+            cut = min(max(split - start, 0), len(X))
+            if cut:
+                train.put(start, {'X': X[:cut], 'y': block['y'][:cut]})
+            if cut < len(X):
+                test.put(start + cut - split, {'X': X[cut:], 'y': block['y'][cut:]})
+        train.end()
+        test.end()
+        return reader.rows
+
+    try:
+        rows = receive.first_object(parse=forward)
+    except Exception:
+        for forwarder in forwarders:
+            forwarder.end(abort=True)
+        raise
+    logger.info(f"Preprocessed {rows} rows block by block in {receive.first_object_s:.3f}s, "
+                f"draining the remaining replicas")
+    ack = flask_request.headers.get(ACK_HEADER)
+    if ack:
+        send_ack(ack, flask_request.remote_addr, transport.post)
+    return [forwarder.wait() for forwarder in forwarders]
+
+
 def preprocess_handler():
     @app.route('/receive', methods=['POST'])
     def receive_data():
         try:
+            if request.mimetype == array_wire.BLOCKS_CONTENT_TYPE:
+                train_host, test_host = os.environ['NEXT_HOST_TRAIN'], os.environ['NEXT_HOST_TEST']
+                logger.info("Receiving raw data as a block stream, preprocessing block by block...")
+                results = preprocess_blocks(request, f"http://{train_host}:{os.environ['TRAIN_PORT']}/receive",
+                                            f"http://{test_host}:{os.environ['TEST_PORT']}/receive_test")
+                errors = [f"{name}: {error}" for name, (ok, error) in zip(("Train", "Test"), results) if not ok]
+                if errors:
+                    return jsonify({"status": "error", "error": "Errors occurred: " + "; ".join(errors)}), 500
+                return jsonify({"status": "preprocessing complete and data sent"}), 200
+
             # Read and parse only the first data object from the stream
             logger.info("Receiving raw data in streaming mode...")
-            first_data_obj = receive_first_object_from_request(request, chunk_size=4096)
+            first_data_obj = receive_first_object_from_request(request)
             logger.info(f'received data length of the first object is {len(first_data_obj)}')
             raw_data = first_data_obj['data']
             logger.info(f"Data prepared with {len(raw_data)}")
 
-            logger.info("Received raw data (first object). Starting preprocessing...")
-            train_data, test_data = preprocess_data(raw_data)
-
             # Prepare URLs and payloads
             train_host = os.environ['NEXT_HOST_TRAIN']
             train_port = os.environ['TRAIN_PORT']
             url_train = f"http://{train_host}:{train_port}/receive"
-            payload_train = pickle.dumps({'data': train_data})
 
             test_host = os.environ['NEXT_HOST_TEST']
             test_port = os.environ['TEST_PORT']
             url_test = f"http://{test_host}:{test_port}/receive_test"
-            payload_test = pickle.dumps({'data': test_data})
-
-            payload_train = pickle.dumps({'data': train_data})
-            logger.info(f"Preparing to send train data: {len(payload_train)} bytes")
-            log_send_operation([train_host, test_host])
+            cache_key = f"preprocess:{g.payload_digest}"
+            cached = payload_cache.get(cache_key) if g.payload_digest else None
+            if cached is not None:
+                logger.info("Same raw data as an earlier run, reusing the preprocessed payloads")
+                payload_train, payload_test = cached
+            else:
+                logger.info("Received raw data (first object). Starting preprocessing...")
+                train_data, test_data = preprocess_data(raw_data)
+                payload_test = prepare_payload({'data': test_data})
+                payload_train = prepare_payload({'data': train_data})
+                if g.payload_digest:
+                    payload_cache.put(cache_key, (payload_train, payload_test),
+                                      array_wire.frame_size(payload_train[0]) + array_wire.frame_size(payload_test[0]))
+            logger.info(f"Preparing to send train data: {array_wire.frame_size(payload_train[0])} bytes")
             # Define send function with error handling
             def send_data(url, payload):
+                buffers, content_type = payload
                 try:
-                    def generator():
-                        yield from chunked_data_generator(payload, REPLICATION, 4096)
-
-                    response = requests.post(
-                        url,
-                        data=generator(),
-                        headers={"Content-Type": "application/octet-stream"},
-                        stream=True
-                    )
+                    response = post_replicated(url, buffers, content_type)
                     if response.status_code != 200:
                         logger.error(f"Failed to send to {url}: {response.text}")
                         return (False, response.text)
@@ -342,31 +670,31 @@ def train_handler():
     def receive_train_data():
         try:
             logger.info("Receiving training data in streaming mode...")
-            first_data_obj = receive_first_object_from_request(request, chunk_size=4096)
+            first_data_obj = receive_first_object_from_request(request)
             train_data = first_data_obj['data']
 
-            logger.info("Received training data (first object). Starting model training...")
-            model = LogisticRegression(max_iter=1000)
-            model.fit(train_data['X'], train_data['y'])
+            cache_key = f"train:{g.payload_digest}"
+            cached = payload_cache.get(cache_key) if g.payload_digest else None
+            if cached is not None:
+                logger.info("Same training data as an earlier run, reusing the trained model")
+                serialized_model, content_type = cached
+            else:
+                logger.info("Received training data (first object). Starting model training...")
+                model = LogisticRegression(max_iter=1000)
+                model.fit(features(train_data), train_data['y'])
 
-            serialized_model = pickle.dumps(model)
-            logger.info(f"Model trained. Serialized model size: {len(serialized_model)} bytes")
+                serialized_model, content_type = prepare_payload(model)
+                logger.info(f"Model trained. Serialized model size: {array_wire.frame_size(serialized_model)} bytes")
+                if g.payload_digest:
+                    payload_cache.put(cache_key, (serialized_model, content_type), array_wire.frame_size(serialized_model))
 
             # Send the model to test module in streaming form
             test_host = os.environ['NEXT_HOST_TEST']  # e.g., "mlpipe-test"
             model_port = os.environ['MODEL_PORT']
             url_model = f"http://{test_host}:{model_port}/receive_model"
-            log_send_operation([test_host])
-            def model_generator():
-                yield from chunked_data_generator(serialized_model, REPLICATION, 4096)
 
             logger.info(f"Sending trained model to {url_model}, repeated {REPLICATION} times...")
-            response = requests.post(
-                url_model,
-                data=model_generator(),
-                headers={"Content-Type": "application/octet-stream"},
-                stream=True
-            )
+            response = post_replicated(url_model, serialized_model, content_type)
             if response.status_code == 200:
                 logger.info("Model sent successfully")
                 return jsonify({"status": "model trained and sent"}), 200
@@ -397,9 +725,10 @@ def test_handler():
         global received_test_data
         try:
             logger.info("Receiving test data in streaming mode...")
-            first_data_obj = receive_first_object_from_request(request, chunk_size=4096)
+            first_data_obj = receive_first_object_from_request(request)
             with data_lock:
-                received_test_data = first_data_obj['data']
+                test_data = first_data_obj['data']
+                received_test_data = {'X': features(test_data), 'y': test_data['y']}
                 logger.info("Test data received (first object).")
                 # If model is already present, compute accuracy
                 if received_model is not None:
@@ -416,7 +745,7 @@ def test_handler():
         global received_model
         try:
             logger.info("Receiving model in streaming mode...")
-            first_data_obj = receive_first_object_from_request(request, chunk_size=4096)
+            first_data_obj = receive_first_object_from_request(request)
             with data_lock:
                 # Here, the 'first_data_obj' itself is raw bytes of the model, so we just store it.
                 # In the pipeline above, we sent the model as serialized bytes (not a dict).
@@ -457,8 +786,6 @@ def test_handler():
 if __name__ == "__main__":
     role = os.environ.get('ROLE', '').lower()
     logger.info(f"Starting module with role: {role}")
-    vars_found = get_env_vars_with_substring('NEXT_HOST')
-    log_send_operation(list(vars_found.values()))
     if role == 'download-0':
         download_handler()
     elif role == 'preprocess-1':
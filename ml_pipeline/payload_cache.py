@@ -0,0 +1,86 @@
+"""
+Content-addressed cache of stage payloads for ml_app.py.
+
+Before a transfer the sender offers the digest of the serialized payload
+(POST /payload_offer/<digest>). If the receiver still holds that payload from an
+earlier run, the transfer is sent with an empty body and the X-Payload-Cached
+header, and the receiver takes the object from its cache. Stages also keep the
+payloads they produced under the digest of their input, so a rerun on the same
+data skips the recompute as well.
+
+Entries are evicted least recently used first once their total size exceeds
+the budget. Cached objects are shared between requests and must not be
+modified in place.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+DIGEST_HEADER = "X-Payload-Digest"
+CACHED_HEADER = "X-Payload-Cached"
+
+
+def payload_digest(buffers):
+    """Digest of a serialized payload given as a list of buffers."""
+    digest = hashlib.blake2b(digest_size=20)
+    for buffer in buffers:
+        digest.update(buffer)
+    return digest.hexdigest()
+
+
+def offer_url(url, digest):
+    """/payload_offer URL of the server behind a receive URL."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/payload_offer/{digest}"
+
+
+class PayloadCache:
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return True
+            return False
+
+    def put(self, key, obj, nbytes):
+        if nbytes > self.budget:
+            return False
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (obj, nbytes)
+            self.size += nbytes
+            while self.size > self.budget:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "budget": self.budget,
+                    "hits": self.hits, "misses": self.misses}
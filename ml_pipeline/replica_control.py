@@ -0,0 +1,127 @@
+"""
+Receiver-driven early stop of the replicated stage transfers of ml_app.py.
+
+A sender registers every transfer and tells the receiver where to acknowledge
+it in the X-Transfer-Ack header ("<sender ip>:<port>/<transfer id>"; the ip is
+empty when POD_IP is not set, the receiver then uses the peer address). Once
+the receiver parsed the first copy it POSTs /transfer_ack/<id> to the sender,
+whose chunk generator returns at the next chunk boundary, so the chunked
+request body simply ends early and the remaining copies are never sent.
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+import requests
+
+ACK_HEADER = "X-Transfer-Ack"
+logger = logging.getLogger("MyLogger")
+
+
+class TransferAcks:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.ids = itertools.count(1)
+
+    def open(self, host, port):
+        """Register a transfer, returns (header value, cancel event)."""
+        transfer_id = f"{threading.get_ident():x}-{next(self.ids)}"
+        cancelled = threading.Event()
+        with self.lock:
+            self.pending[transfer_id] = cancelled
+        return f"{host or ''}:{port}/{transfer_id}", cancelled
+
+    def ack(self, transfer_id):
+        with self.lock:
+            cancelled = self.pending.get(transfer_id)
+        if cancelled is None:
+            return False
+        cancelled.set()
+        return True
+
+    def close(self, header_value):
+        with self.lock:
+            self.pending.pop(header_value.rsplit("/", 1)[-1], None)
+
+
+class ReplicaProgress:
+    """
+    Chunk generator over the copies of a payload (one iterable of chunks per
+    copy) that stops once the receiver acknowledged the first copy.
+    """
+
+    def __init__(self, copies, times, cancelled=None):
+        self.copies = copies
+        self.times = times
+        self.cancelled = cancelled
+        self.copy_bytes = 0
+        self.sent = 0
+        self.began = None
+        self.ended = None
+
+    def __iter__(self):
+        self.began = time.perf_counter()
+        for index, chunks in enumerate(self.copies):
+            for chunk in chunks:
+                # Never stop within the first copy
+                if index and self.cancelled is not None and self.cancelled.is_set():
+                    self.ended = time.perf_counter()
+                    return
+                nbytes = memoryview(chunk).nbytes
+                self.sent += nbytes
+                if not index:
+                    self.copy_bytes += nbytes
+                yield chunk
+        self.ended = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return (self.ended - self.began) if self.ended is not None else 0.0
+
+    @property
+    def saved(self):
+        return self.copy_bytes * self.times - self.sent
+
+    def summary(self):
+        copies = self.sent / self.copy_bytes if self.copy_bytes else 0
+        mbps = self.sent * 8 / 1e6 / self.seconds if self.seconds else 0.0
+        return (f"sent {self.sent} bytes ({copies:.2f} of {self.times} copies) in {self.seconds:.2f}s "
+                f"({mbps:.0f} Mbps), saved {self.saved} bytes")
+
+
+def replayed_copies(chunks, times):
+    """
+    Copies of a chunk stream that is still being produced: the first copy
+    passes the chunks through as they come and keeps them, the others resend them.
+    """
+    sent = []
+
+    def first_copy():
+        for chunk in chunks:
+            sent.append(chunk)
+            yield chunk
+
+    yield first_copy()
+    for _ in range(times - 1):
+        yield iter(sent)
+
+
+def send_ack(header_value, peer_addr, post=requests.post, timeout=5):
+    """Acknowledge a transfer to its sender in a background thread."""
+    address, transfer_id = header_value.rsplit("/", 1)
+    host, port = address.rsplit(":", 1)
+    url = f"http://{host or peer_addr}:{port}/transfer_ack/{transfer_id}"
+
+    def acknowledge():
+        try:
+            post(url, timeout=timeout)
+        except requests.RequestException as e:
+            # The sender just sends every copy then
+            logger.warning(f"Could not acknowledge transfer to {url}: {e}")
+
+    thread = threading.Thread(target=acknowledge, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,126 @@
+"""
+Incremental receive of the replicated stage transfers of ml_app.py.
+
+The sender streams the same payload REPLICATION times in one request body.
+StreamReceive parses the first copy straight from the request stream, without
+spooling the body anywhere, and returns it as soon as its last byte arrived;
+a background thread then reads and discards the remaining replicas while the
+stage already works on the object. finish() waits for the drain, the response
+must not be sent before the body has been consumed. Compressed bodies
+(transfer_codec.py) are decompressed for the first copy only.
+
+A block stream (array_wire.BLOCKS_CONTENT_TYPE) is read into full arrays and
+returned as {name: array, **meta}; callers that work on the blocks as they
+arrive pass their own parse function to first_object().
+"""
+
+import pickle
+import threading
+import time
+
+import array_wire
+from transfer_codec import CODECS, DecompressReader
+
+DRAIN_CHUNK = 1 << 20
+
+
+class ExactReader:
+    """
+    File-like wrapper whose read(n)/readinto(b) return exactly n bytes unless
+    the stream ended. Unpickler treats a short read as truncated data, while
+    request streams return whatever arrived.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.nbytes = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.stream.read()
+        else:
+            data = self.stream.read(size)
+            while 0 < len(data) < size:
+                more = self.stream.read(size - len(data))
+                if not more:
+                    break
+                data += more
+        self.nbytes += len(data)
+        return data
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        array_wire.read_into(self.stream, view)
+        self.nbytes += view.nbytes
+        return view.nbytes
+
+    def readline(self):
+        line = self.stream.readline()
+        self.nbytes += len(line)
+        return line
+
+
+class StreamReceive:
+    def __init__(self, stream, content_type=None, codec=None):
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f"Unsupported transfer codec {codec!r}")
+        self.stream = stream
+        self.reader = ExactReader(DecompressReader(stream, codec) if codec else stream)
+        self.content_type = content_type
+        self.started = time.perf_counter()
+        self.first_object_s = None
+        self.first_object_bytes = 0
+        self.drained_bytes = 0
+        self.total_s = None
+        self.drain_thread = None
+
+    def first_object(self, parse=None):
+        """Parse and return the first replica, then start draining the rest."""
+        try:
+            if parse is not None:
+                obj = parse(self.reader)
+            elif self.content_type == array_wire.CONTENT_TYPE:
+                obj = array_wire.decode_frame(self.reader)
+            elif self.content_type == array_wire.BLOCKS_CONTENT_TYPE:
+                reader = array_wire.BlockReader(self.reader)
+                obj = reader.read_all()
+                obj.update(reader.meta)
+            else:
+                try:
+                    obj = pickle.Unpickler(self.reader).load()
+                except (EOFError, pickle.UnpicklingError) as e:
+                    raise ValueError("Invalid or incomplete pickle data") from e
+            self.first_object_s = time.perf_counter() - self.started
+            self.first_object_bytes = self.reader.nbytes
+            return obj
+        finally:
+            self.drain_thread = threading.Thread(target=self._drain, daemon=True)
+            self.drain_thread.start()
+
+    def _drain(self):
+        scratch = bytearray(DRAIN_CHUNK)
+        readinto = getattr(self.stream, "readinto", None)
+        while True:
+            if readinto is not None:
+                n = readinto(scratch)
+            else:
+                n = len(self.stream.read(DRAIN_CHUNK))
+            if not n:
+                break
+            self.drained_bytes += n
+        self.total_s = time.perf_counter() - self.started
+
+    def finish(self):
+        """Wait until the remaining replicas are consumed."""
+        if self.drain_thread is not None:
+            self.drain_thread.join()
+            self.drain_thread = None
+        return self
+
+    def stats(self):
+        return {
+            "first_object_s": self.first_object_s,
+            "first_object_bytes": self.first_object_bytes,
+            "drained_bytes": self.drained_bytes,
+            "total_s": self.total_s,
+        }
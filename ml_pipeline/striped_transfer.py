@@ -0,0 +1,191 @@
+"""
+Striping of one stage transfer of ml_app.py over several TCP connections.
+
+With TRANSFER_STREAMS=N the sender opens N concurrent POSTs to the receiving
+service, all carrying the same headers plus X-Transfer-Stripe
+("<stripe id>/<index>/<count>"). The chunks of the logical body are numbered
+and pulled by whichever connection is ready next, so a slow connection just
+carries fewer of them. On every connection a segment is
+
+    sequence number (u64) | length (u32) | data
+
+The receiver collects the segments of all N requests in one StripeAssembler,
+a file-like object that returns them in sequence order. The request with
+index 0 runs the view and reads the payload from the assembler; the other
+requests only feed their segments in and are answered as soon as their body
+ended. A feeder holding segments ahead of the next expected one waits once
+MAX_BUFFERED bytes are queued out of order, the connection carrying the next
+segment is never blocked, so TCP flow control bounds the reassembly memory.
+"""
+
+import itertools
+import struct
+import threading
+import uuid
+
+from array_wire import read_exact
+
+STRIPE_HEADER = "X-Transfer-Stripe"
+SEGMENT = struct.Struct("!QI")
+MAX_BUFFERED = 64 << 20
+
+
+def parse_stripe(value):
+    """(stripe id, index, count) of an X-Transfer-Stripe header value."""
+    stripe_id, index, count = value.rsplit("/", 2)
+    return stripe_id, int(index), int(count)
+
+
+def striped_bodies(chunks, count):
+    """
+    Split one chunk iterable into `count` request bodies of numbered segments.
+    Returns (stripe id, bodies); each body must be consumed by its own thread.
+    """
+    lock = threading.Lock()
+    source = iter(chunks)
+    numbers = itertools.count()
+
+    def body():
+        while True:
+            with lock:
+                chunk = next(source, None)
+                if chunk is None:
+                    return
+                seq = next(numbers)
+            yield SEGMENT.pack(seq, memoryview(chunk).nbytes)
+            yield chunk
+
+    return uuid.uuid4().hex, [body() for _ in range(count)]
+
+
+def post_striped(post, url, headers, chunks, count, **kwargs):
+    """POST `chunks` striped over `count` concurrent requests, returns the response of stripe 0."""
+    stripe_id, bodies = striped_bodies(chunks, count)
+    responses = [None] * count
+    errors = []
+
+    def send(index):
+        stripe_headers = dict(headers)
+        stripe_headers[STRIPE_HEADER] = f"{stripe_id}/{index}/{count}"
+        try:
+            responses[index] = post(url, data=bodies[index], headers=stripe_headers, **kwargs)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=send, args=(index,)) for index in range(1, count)]
+    for thread in threads:
+        thread.start()
+    send(0)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    failed = [response for response in responses if response.status_code != 200]
+    return failed[0] if failed else responses[0]
+
+
+class StripeAssembler:
+    def __init__(self, count):
+        self.count = count
+        self.cond = threading.Condition()
+        self.segments = {}
+        self.buffered = 0
+        self.next_seq = 0
+        self.done = 0
+        self.current = memoryview(b"")
+        self.error = None
+
+    def feed(self, stream):
+        """Read the segments of one stripe body into the assembler until it ends."""
+        try:
+            while True:
+                header = stream.read(SEGMENT.size)
+                if not header:
+                    break
+                if len(header) < SEGMENT.size:
+                    header += read_exact(stream, SEGMENT.size - len(header))
+                seq, size = SEGMENT.unpack(header)
+                self._put(seq, read_exact(stream, size))
+        except Exception as e:
+            with self.cond:
+                self.error = e
+            raise
+        finally:
+            with self.cond:
+                self.done += 1
+                self.cond.notify_all()
+
+    def _put(self, seq, data):
+        with self.cond:
+            while seq != self.next_seq and self.buffered >= MAX_BUFFERED:
+                self.cond.wait()
+            self.segments[seq] = data
+            self.buffered += len(data)
+            self.cond.notify_all()
+
+    def _advance(self):
+        """Make the next in-order segment current, False at the end of the stream."""
+        with self.cond:
+            while self.next_seq not in self.segments:
+                if self.error is not None:
+                    raise EOFError(f"a stripe failed: {self.error}")
+                if self.done == self.count:
+                    return False
+                self.cond.wait()
+            data = self.segments.pop(self.next_seq)
+            self.buffered -= len(data)
+            self.next_seq += 1
+            self.cond.notify_all()
+        self.current = memoryview(data)
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < view.nbytes:
+            if not self.current.nbytes and not self._advance():
+                break
+            n = min(self.current.nbytes, view.nbytes - filled)
+            view[filled:filled + n] = self.current[:n]
+            self.current = self.current[n:]
+            filled += n
+        return filled
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [bytes(self.current)]
+            self.current = memoryview(b"")
+            while self._advance():
+                parts.append(bytes(self.current))
+                self.current = memoryview(b"")
+            return b"".join(parts)
+        buffer = bytearray(size)
+        return bytes(buffer[:self.readinto(buffer)])
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+        return bytes(line)
+
+
+class StripeRegistry:
+    """Assemblers of the striped transfers in progress, by stripe id."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.assemblers = {}
+
+    def open(self, stripe_id, count):
+        with self.lock:
+            assembler = self.assemblers.get(stripe_id)
+            if assembler is None:
+                assembler = self.assemblers[stripe_id] = StripeAssembler(count)
+            return assembler
+
+    def release(self, stripe_id):
+        with self.lock:
+            self.assemblers.pop(stripe_id, None)
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Loopback benchmarks of the ml_app.py stage transfers, without a cluster.
+
+    python3 transfer_bench.py wire --samples 70000 --dtype float64
+    python3 transfer_bench.py codec --link-mbps 100 1000 10000
+    python3 transfer_bench.py chunks --sizes-kb 4 16 64 256 1024 4096
+    python3 transfer_bench.py stripes --streams 1 2 4 8 --stream-mbps 0 500
+    python3 transfer_bench.py local --dir /dev/shm
+
+wire: sends an MNIST-shaped payload ({'data': {'X': (n, 28, 28), 'y': int32}}),
+REPLICATION times over a socketpair, the way the download stage does, and
+receives the first object. Compares the old pickle path (pickle.dumps, tempfile
+spool of the whole body, Unpickler) with pickle and array frames (array_wire.py)
+parsed incrementally from the stream (stream_receive.py), reporting the time to
+the first object and to the end of the body. Every method runs in its own
+process so the peak RSS (ru_maxrss) is not shared between them.
+
+codec: sends the uint8 train payload of preprocess once per transfer codec
+(transfer_codec.py) over a socketpair throttled to each --link-mbps, and
+reports the bytes sent, the compress/decompress CPU time and the wall time
+until the receiver has the object, plus the codec CodecSelector picks for that
+link. The images are synthetic with MNIST's sparsity unless --images points
+to a cached mnist_X.npy.
+
+chunks: POSTs the payload to a local HTTP server through the pooled
+Transport (transport.py) with every chunk size, and once per transfer with a
+new connection (plain requests.post, the former behaviour) for comparison.
+
+stripes: sends the payload striped over N connections (striped_transfer.py)
+to a local HTTP server that reassembles and decodes it, for every N. With
+--stream-mbps every connection is capped at that rate, like a per-flow limit
+(congestion window, policing) that a single stream cannot get past.
+
+local: hands the payload to a local HTTP server once over the connection and
+once through a file in --dir (local_transfer.py, the same-node fast path),
+and reports the latency until the receiver has the object and the CPU time
+of sender and receiver for both. On a node the network path also crosses
+the pod veth pair, kube-proxy and the policy chains, loopback is its lower
+bound.
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import pickle
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+import array_wire
+from local_transfer import LOCAL_HEADER, LocalTransfer
+from stream_receive import StreamReceive
+from striped_transfer import STRIPE_HEADER, StripeRegistry, parse_stripe, post_striped
+from transfer_codec import CODECS, CodecSelector, compressed_copies
+from transport import Transport
+
+WIRE_METHODS = ("pickle-spool", "pickle", "frames")
+
+
+def mnist_like(samples, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.integers(0, 256, size=(samples, 28, 28), dtype=np.uint8).astype(dtype, copy=False)
+    y = rng.integers(0, 10, size=samples, dtype=np.int32)
+    return {'data': {'X': X, 'y': y}}
+
+
+def mnist_sparse(samples, seed=0):
+    """uint8 images with roughly MNIST's sparsity: ~19% non-zero pixels, all in the central 20x20."""
+    rng = np.random.default_rng(seed)
+    X = np.zeros((samples, 28, 28), dtype=np.uint8)
+    centre = X[:, 4:24, 4:24]
+    mask = rng.random(centre.shape) < 0.37
+    centre[mask] = rng.integers(1, 256, size=int(mask.sum()), dtype=np.uint8)
+    return X.reshape(samples, 28 * 28)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def send_chunks(sock, chunks):
+    for chunk in chunks:
+        sock.sendall(chunk)
+    sock.shutdown(socket.SHUT_WR)
+
+
+def throttled_send(sock, chunks, mbps):
+    """send_chunks at no more than `mbps` (0: as fast as the socket goes)."""
+    begin = time.perf_counter()
+    sent = 0
+    for chunk in chunks:
+        sock.sendall(chunk)
+        sent += memoryview(chunk).nbytes
+        if mbps:
+            delay = sent * 8 / (mbps * 1e6) - (time.perf_counter() - begin)
+            if delay > 0:
+                time.sleep(delay)
+    sock.shutdown(socket.SHUT_WR)
+
+
+def codec_run(buffers, codec, mbps, chunk_size):
+    """One transfer of the frame with `codec`, returns its measurements."""
+    begin = time.thread_time()
+    wire_bytes = sum(len(chunk) if codec else memoryview(chunk).nbytes
+                     for chunk in next(compressed_copies(buffers, 1, codec, chunk_size)))
+    compress_cpu = time.thread_time() - begin if codec else 0.0
+
+    sender_sock, receiver_sock = socket.socketpair()
+    chunks = next(compressed_copies(buffers, 1, codec, chunk_size))
+    sender = threading.Thread(target=throttled_send, args=(sender_sock, chunks, mbps))
+    begin = time.perf_counter()
+    sender.start()
+    with receiver_sock.makefile('rb') as stream:
+        cpu = time.thread_time()
+        receive = StreamReceive(stream, array_wire.CONTENT_TYPE, codec)
+        receive.first_object()
+        receive_cpu = time.thread_time() - cpu
+        wall = time.perf_counter() - begin
+        receive.finish()
+    sender.join()
+    sender_sock.close()
+    receiver_sock.close()
+    return {"bytes": wire_bytes, "compress_cpu": compress_cpu, "receive_cpu": receive_cpu, "wall": wall}
+
+
+def run_codec(args):
+    if args.images:
+        X = np.load(args.images).reshape(-1, 28 * 28)[:args.samples].astype(np.uint8)
+    else:
+        X = mnist_sparse(args.samples)
+    y = np.zeros(len(X), dtype=np.int32)
+    buffers = array_wire.encode_frame({'data': {'X': X, 'y': y, 'scale': 1 / 255.0}})
+    size = array_wire.frame_size(buffers)
+    codecs = [None] + [name for name in CODECS if name in args.codecs]
+    print(f"{len(X)} images ({'from ' + args.images if args.images else 'synthetic'}), frame {size / 1e6:.1f} MB, "
+          f"{args.chunk_size}-byte chunks; receive CPU includes decoding the frame")
+    for mbps in args.link_mbps:
+        selector = CodecSelector(",".join(args.codecs), default_link_mbps=mbps or 1e5)
+        picked, _ = selector.choose("bench", buffers, args.codecs)
+        print(f"\nlink {mbps or 'unthrottled'} Mbps, CodecSelector picks {picked or 'none'}")
+        print(f"{'codec':<6} {'bytes sent':>12} {'ratio':>6} {'compress cpu s':>15} {'receive cpu s':>14} {'wall s':>7}")
+        for codec in codecs:
+            r = codec_run(buffers, codec, mbps, args.chunk_size)
+            print(f"{codec or 'none':<6} {r['bytes']:>12} {r['bytes'] / size:>6.3f} {r['compress_cpu']:>15.3f} "
+                  f"{r['receive_cpu']:>14.3f} {r['wall']:>7.2f}")
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    """Reads and discards a (chunked) request body, keeps the connection alive."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                remaining = size
+                while remaining:
+                    remaining -= len(self.rfile.read(min(remaining, 1 << 20)))
+                self.rfile.readline()
+        else:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ChunkedReader:
+    """read() of a chunked-encoded request body."""
+
+    def __init__(self, rfile):
+        self.rfile = rfile
+        self.left = 0
+        self.eof = False
+
+    def read(self, size=-1):
+        if self.eof:
+            return b""
+        if not self.left:
+            self.left = int(self.rfile.readline().split(b";")[0], 16)
+            if not self.left:
+                self.rfile.readline()
+                self.eof = True
+                return b""
+        data = self.rfile.read(self.left if size is None or size < 0 else min(size, self.left))
+        self.left -= len(data)
+        if not self.left:
+            self.rfile.readline()
+        return data
+
+
+class StripeHandler(BaseHTTPRequestHandler):
+    """Reassembles striped transfers like ml_app.py, stripe 0 decodes the frame."""
+    protocol_version = "HTTP/1.1"
+    registry = StripeRegistry()
+
+    def do_POST(self):
+        stripe_id, index, count = parse_stripe(self.headers[STRIPE_HEADER])
+        assembler = self.registry.open(stripe_id, count)
+        body = ChunkedReader(self.rfile)
+        first_object_s = 0.0
+        if index:
+            assembler.feed(body)
+        else:
+            feeder = threading.Thread(target=assembler.feed, args=(body,))
+            feeder.start()
+            receive = StreamReceive(assembler, array_wire.CONTENT_TYPE)
+            receive.first_object()
+            first_object_s = receive.first_object_s
+            receive.finish()
+            feeder.join()
+            self.registry.release(stripe_id)
+        self.send_response(200)
+        self.send_header("X-First-Object-Seconds", str(first_object_s))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def throttled(chunks, mbps):
+    begin = time.perf_counter()
+    sent = 0
+    for chunk in chunks:
+        yield chunk
+        sent += memoryview(chunk).nbytes
+        delay = sent * 8 / (mbps * 1e6) - (time.perf_counter() - begin)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_stripes(args):
+    X = mnist_sparse(args.samples)
+    buffers = array_wire.encode_frame({'data': {'X': X, 'y': np.zeros(len(X), dtype=np.int32)}})
+    size = array_wire.frame_size(buffers)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StripeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/receive"
+    print(f"{size / 1e6:.1f} MB frame striped over N connections to a local HTTP server, "
+          f"{args.chunk_kb} KB segments, best of {args.repeat}")
+    print(f"{'stream cap Mbps':>15} {'N':>3} {'wall s':>7} {'Mbps':>8}")
+    for cap in args.stream_mbps:
+        for count in args.streams:
+            transport = Transport(args.chunk_kb << 10, pool_size=count)
+
+            def post(url, data, **kwargs):
+                return transport.post(url, data=throttled(data, cap) if cap else data, **kwargs)
+
+            best = None
+            for _ in range(args.repeat):
+                chunks = next(compressed_copies(buffers, 1, None, transport.chunk_size))
+                begin = time.perf_counter()
+                post_striped(post, url, {"Content-Type": array_wire.CONTENT_TYPE}, chunks, count).raise_for_status()
+                seconds = time.perf_counter() - begin
+                best = seconds if best is None else min(best, seconds)
+            transport.close()
+            print(f"{cap or 'none':>15} {count:>3} {best:>7.2f} {size * 8 / 1e6 / best:>8.0f}")
+    server.shutdown()
+
+
+def run_chunks(args):
+    X = mnist_sparse(args.samples)
+    buffers = array_wire.encode_frame({'data': {'X': X, 'y': np.zeros(len(X), dtype=np.int32)}})
+    size = array_wire.frame_size(buffers)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/receive"
+    print(f"{args.transfers} transfers of a {size / 1e6:.1f} MB frame to a local HTTP server")
+    print(f"{'client':<12} {'chunk KB':>9} {'chunks':>8} {'Mbps':>8} {'client cpu s':>13}")
+    runs = [("pooled", kb) for kb in args.sizes_kb] + [("no pool", 4)]
+    for client, kb in runs:
+        chunk_size = kb << 10
+        transport = Transport(chunk_size)
+        post = transport.post if client == "pooled" else requests.post
+        chunks = 0
+        cpu = time.thread_time()
+        begin = time.perf_counter()
+        for _ in range(args.transfers):
+            body = list(next(compressed_copies(buffers, 1, None, chunk_size)))
+            chunks += len(body)
+            post(url, data=iter(body), headers={"Content-Type": array_wire.CONTENT_TYPE}).raise_for_status()
+        seconds = time.perf_counter() - begin
+        cpu = time.thread_time() - cpu
+        transport.close()
+        print(f"{client:<12} {kb:>9} {chunks // args.transfers:>8} {size * args.transfers * 8 / 1e6 / seconds:>8.0f} "
+              f"{cpu:>13.2f}")
+    # Offers, acks and codec queries are small requests where the connection setup dominates
+    transport = Transport()
+    for client, post in (("pooled", transport.post), ("no pool", requests.post)):
+        begin = time.perf_counter()
+        for _ in range(200):
+            post(url, data=b"").raise_for_status()
+        print(f"small request round trip, {client}: {(time.perf_counter() - begin) / 200 * 1e3:.2f} ms")
+    transport.close()
+    server.shutdown()
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    """Decodes a frame from the (chunked) body, or from the shared directory with X-Local-Payload."""
+    protocol_version = "HTTP/1.1"
+    local = None
+
+    def do_POST(self):
+        cpu = time.thread_time()
+        name = self.headers.get(LOCAL_HEADER)
+        if name:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            view, _ = self.local.take(name)
+            array_wire.decode_frame_buffer(view)
+        else:
+            receive = StreamReceive(ChunkedReader(self.rfile), array_wire.CONTENT_TYPE)
+            receive.first_object()
+            receive.finish()
+        self.send_response(200)
+        self.send_header("X-Receiver-Cpu-Seconds", str(time.thread_time() - cpu))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_local(args):
+    X = mnist_sparse(args.samples)
+    buffers = array_wire.encode_frame({'data': {'X': X, 'y': np.zeros(len(X), dtype=np.int32)}})
+    size = array_wire.frame_size(buffers)
+    local = LocalTransfer(args.dir, "bench")
+    LocalHandler.local = local
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/receive"
+    transport = Transport(args.chunk_kb << 10)
+    headers = {"Content-Type": array_wire.CONTENT_TYPE}
+    print(f"{args.transfers} transfers of a {size / 1e6:.1f} MB frame to a local HTTP server, one copy each")
+    print(f"{'path':<10} {'latency ms':>11} {'sender cpu ms':>14} {'receiver cpu ms':>16}")
+    for path in ("network", "local"):
+        latencies, sender_cpu, receiver_cpu = [], [], []
+        for _ in range(args.transfers):
+            cpu = time.thread_time()
+            begin = time.perf_counter()
+            if path == "local":
+                name = local.write(buffers)
+                response = transport.post(url, data=b"", headers={**headers, LOCAL_HEADER: name})
+                local.discard(name)
+            else:
+                response = transport.post(url, data=array_wire.frame_chunks(buffers, 1, transport.chunk_size),
+                                          headers=headers)
+            latencies.append(time.perf_counter() - begin)
+            sender_cpu.append(time.thread_time() - cpu)
+            response.raise_for_status()
+            receiver_cpu.append(float(response.headers["X-Receiver-Cpu-Seconds"]))
+        print(f"{path:<10} {np.median(latencies) * 1e3:>11.1f} {np.median(sender_cpu) * 1e3:>14.1f} "
+              f"{np.median(receiver_cpu) * 1e3:>16.1f}")
+    transport.close()
+    server.shutdown()
+
+
+def pickle_chunks(payload, times, chunk_size):
+    # Slicing of the former ml_app.chunked_data_generator
+    for _ in range(times):
+        for start in range(0, len(payload), chunk_size):
+            yield payload[start:start + chunk_size]
+
+
+def receive_spooled(stream, chunk_size):
+    """The former tempfile path of ml_app.receive_first_object_from_request."""
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_path = temp_file.name
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                temp_file.write(chunk)
+            temp_file.flush()
+            with open(temp_path, 'rb') as file:
+                return pickle.Unpickler(file).load()
+        finally:
+            temp_file.close()
+            shutil.os.remove(temp_path)
+
+
+def wire_child(method, samples, dtype, replication, chunk_size):
+    """Run one method in this process and print a JSON result line."""
+    obj = mnist_like(samples, dtype)
+    rss_data = peak_rss_mb()
+    begin = time.perf_counter()
+    if method == "frames":
+        buffers = array_wire.encode_frame(obj)
+        size = array_wire.frame_size(buffers)
+        chunks = array_wire.frame_chunks(buffers, replication, chunk_size)
+        content_type = array_wire.CONTENT_TYPE
+    else:
+        payload = pickle.dumps(obj)
+        size = len(payload)
+        chunks = pickle_chunks(payload, replication, chunk_size)
+        content_type = "application/octet-stream"
+    encode_s = time.perf_counter() - begin
+
+    sender_sock, receiver_sock = socket.socketpair()
+    sender = threading.Thread(target=send_chunks, args=(sender_sock, chunks))
+    begin = time.perf_counter()
+    sender.start()
+    with receiver_sock.makefile('rb') as stream:
+        if method == "pickle-spool":
+            received = receive_spooled(stream, chunk_size)
+            first_object_s = time.perf_counter() - begin
+        else:
+            receive = StreamReceive(stream, content_type)
+            received = receive.first_object()
+            first_object_s = time.perf_counter() - begin
+            receive.finish()
+    transfer_s = time.perf_counter() - begin
+    sender.join()
+    sender_sock.close()
+    receiver_sock.close()
+
+    ok = (np.array_equal(received['data']['X'], obj['data']['X'])
+          and np.array_equal(received['data']['y'], obj['data']['y']))
+    print(json.dumps({
+        "method": method,
+        "frame_mb": size / 1e6,
+        "encode_s": encode_s,
+        "first_object_s": first_object_s,
+        "transfer_s": transfer_s,
+        "throughput_mbps": size * replication * 8 / 1e6 / transfer_s,
+        "rss_data_mb": rss_data,
+        "rss_peak_mb": peak_rss_mb(),
+        "ok": bool(ok),
+    }))
+
+
+def run_wire(args):
+    print(f"{args.samples} samples of {args.dtype}, replication {args.replication}, "
+          f"{args.chunk_size}-byte chunks over a socketpair")
+    print(f"{'method':<12} {'frame MB':>9} {'encode s':>9} {'1st obj s':>10} {'transfer s':>11} {'Mbps':>8} "
+          f"{'data MB':>8} {'peak RSS MB':>12} {'overhead MB':>12}")
+    for method in args.methods:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "_wire-child", method,
+             "--samples", str(args.samples), "--dtype", args.dtype,
+             "--replication", str(args.replication), "--chunk-size", str(args.chunk_size)],
+            check=True, capture_output=True, text=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{r['method']:<12} {r['frame_mb']:>9.1f} {r['encode_s']:>9.3f} {r['first_object_s']:>10.2f} "
+              f"{r['transfer_s']:>11.2f} "
+              f"{r['throughput_mbps']:>8.0f} {r['rss_data_mb']:>8.0f} {r['rss_peak_mb']:>12.0f} "
+              f"{r['rss_peak_mb'] - r['rss_data_mb']:>12.0f}" + ("" if r['ok'] else "  MISMATCH"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback benchmarks of the ml_app.py stage transfers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    wire_parser = subparsers.add_parser("wire", help="pickle vs array frames: peak RSS, time to first object, throughput")
+    wire_parser.add_argument("--samples", type=int, default=70000)
+    wire_parser.add_argument("--dtype", default="float64", help="dtype of X (fetch_openml returns float64)")
+    wire_parser.add_argument("--replication", type=int, default=6)
+    wire_parser.add_argument("--chunk-size", type=int, default=4096)
+    wire_parser.add_argument("--methods", nargs="+", choices=WIRE_METHODS, default=list(WIRE_METHODS))
+    codec_parser = subparsers.add_parser("codec", help="bytes, CPU and wall time per transfer codec")
+    codec_parser.add_argument("--samples", type=int, default=42000, help="rows of the train payload")
+    codec_parser.add_argument("--images", help="cached mnist_X.npy to use instead of synthetic images")
+    codec_parser.add_argument("--link-mbps", type=float, nargs="+", default=[100, 1000, 10000],
+                              help="simulated link bandwidths, 0 for unthrottled loopback")
+    codec_parser.add_argument("--codecs", nargs="+", default=list(CODECS), choices=list(CODECS))
+    codec_parser.add_argument("--chunk-size", type=int, default=4096)
+    chunks_parser = subparsers.add_parser("chunks", help="throughput of the pooled transport per chunk size")
+    chunks_parser.add_argument("--samples", type=int, default=42000)
+    chunks_parser.add_argument("--transfers", type=int, default=5)
+    chunks_parser.add_argument("--sizes-kb", type=int, nargs="+", default=[4, 16, 64, 256, 1024, 4096])
+    stripes_parser = subparsers.add_parser("stripes", help="throughput of striped transfers per number of connections")
+    stripes_parser.add_argument("--samples", type=int, default=42000)
+    stripes_parser.add_argument("--streams", type=int, nargs="+", default=list(range(1, 9)))
+    stripes_parser.add_argument("--stream-mbps", type=float, nargs="+", default=[0, 500],
+                                help="per-connection rate caps to run, 0 for uncapped")
+    stripes_parser.add_argument("--chunk-kb", type=int, default=256)
+    stripes_parser.add_argument("--repeat", type=int, default=3)
+    local_parser = subparsers.add_parser("local", help="same-node file handoff vs the network path: latency and CPU")
+    local_parser.add_argument("--samples", type=int, default=42000)
+    local_parser.add_argument("--transfers", type=int, default=10)
+    local_parser.add_argument("--dir", default="/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+                              help="shared directory, like LOCAL_TRANSFER_DIR")
+    local_parser.add_argument("--chunk-kb", type=int, default=256)
+    child_parser = subparsers.add_parser("_wire-child")
+    child_parser.add_argument("method", choices=WIRE_METHODS)
+    child_parser.add_argument("--samples", type=int)
+    child_parser.add_argument("--dtype")
+    child_parser.add_argument("--replication", type=int)
+    child_parser.add_argument("--chunk-size", type=int)
+    args = parser.parse_args()
+
+    if args.command == "wire":
+        run_wire(args)
+    elif args.command == "codec":
+        run_codec(args)
+    elif args.command == "chunks":
+        run_chunks(args)
+    elif args.command == "stripes":
+        run_stripes(args)
+    elif args.command == "local":
+        run_local(args)
+    else:
+        wire_child(args.method, args.samples, args.dtype, args.replication, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Compression of the stage transfers of ml_app.py.
+
+Codecs: zlib and lzma from the standard library, zstd (zstandard) and lz4
+(lz4.frame) when those packages are installed. A receiver advertises what it
+can decode (GET /transfer_codecs -> X-Accept-Codecs), the sender names the
+codec of the body in X-Transfer-Codec.
+
+Every copy of a replicated transfer is one independent compressed stream. The
+first copy is compressed chunk by chunk while it is being sent and the
+compressed chunks are kept for the other copies, so the payload is compressed
+once and never held uncompressed a second time.
+
+CodecSelector decides per transfer: it compresses a sample of the payload with
+every usable codec to estimate ratio and speed, and compares the estimated
+time max(compress, send compressed) with sending raw over the link bandwidth
+measured on earlier transfers to the same peer. On a fast link a slow codec is
+a loss and the payload goes uncompressed.
+"""
+
+import lzma
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+CODEC_HEADER = "X-Transfer-Codec"
+ACCEPT_HEADER = "X-Accept-Codecs"
+SAMPLE_BYTES = 1 << 20
+# Transfers smaller than this mostly measure the socket buffers, not the link
+MIN_MEASURED_BYTES = 1 << 20
+
+
+class _Lz4Compressor:
+    def __init__(self):
+        self.compressor = lz4_frame.LZ4FrameCompressor()
+        self.header = self.compressor.begin()
+
+    def compress(self, data):
+        out = self.header + self.compressor.compress(data)
+        self.header = b""
+        return out
+
+    def flush(self):
+        return self.header + self.compressor.flush()
+
+
+# name -> (compressor factory, decompressor factory), in order of preference
+CODECS = {}
+if zstandard is not None:
+    CODECS["zstd"] = (lambda: zstandard.ZstdCompressor(level=1).compressobj(),
+                      lambda: zstandard.ZstdDecompressor().decompressobj())
+if lz4_frame is not None:
+    CODECS["lz4"] = (_Lz4Compressor, lz4_frame.LZ4FrameDecompressor)
+CODECS["zlib"] = (lambda: zlib.compressobj(1), zlib.decompressobj)
+CODECS["lzma"] = (lambda: lzma.LZMACompressor(preset=0), lzma.LZMADecompressor)
+
+
+def available_codecs(allowed=None):
+    """Codecs usable here, restricted to a comma separated allow list ("auto" or None: all)."""
+    if not allowed or allowed == "auto":
+        return list(CODECS)
+    if allowed == "none":
+        return []
+    return [name for name in allowed.split(",") if name in CODECS]
+
+
+def _views(buffers):
+    for buffer in buffers:
+        yield memoryview(buffer).cast("B")
+
+
+def compressed_copies(buffers, times, codec, chunk_size):
+    """
+    Iterables of chunks, one per copy. The first copy compresses the buffers
+    chunk by chunk, the following ones resend its compressed chunks.
+    """
+    if codec is None:
+        for _ in range(times):
+            yield (view[start:start + chunk_size] for view in _views(buffers)
+                   for start in range(0, view.nbytes, chunk_size))
+        return
+    compressed = []
+
+    def first_copy():
+        compressor = CODECS[codec][0]()
+        pending = bytearray()
+        for view in _views(buffers):
+            for start in range(0, view.nbytes, chunk_size):
+                pending += compressor.compress(view[start:start + chunk_size])
+                if len(pending) >= chunk_size:
+                    compressed.append(bytes(pending))
+                    pending.clear()
+                    yield compressed[-1]
+        pending += compressor.flush()
+        if pending:
+            compressed.append(bytes(pending))
+            yield compressed[-1]
+
+    yield first_copy()
+    for _ in range(times - 1):
+        yield iter(compressed)
+
+
+class DecompressReader:
+    """File-like reader of the decompressed first stream of a compressed body."""
+
+    def __init__(self, stream, codec, chunk_size=1 << 16):
+        self.stream = stream
+        self.decompressor = CODECS[codec][1]()
+        self.chunk_size = chunk_size
+        self.pending = bytearray()
+        self.pos = 0
+
+    def _fill(self, size):
+        while len(self.pending) - self.pos < size and not self.decompressor.eof:
+            raw = self.stream.read(self.chunk_size)
+            if not raw:
+                break
+            if self.pos:
+                del self.pending[:self.pos]
+                self.pos = 0
+            self.pending += self.decompressor.decompress(raw)
+
+    def _take(self, size):
+        self._fill(size)
+        end = min(len(self.pending), self.pos + size)
+        data = memoryview(self.pending)[self.pos:end]
+        self.pos = end
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = 1 << 62
+        with self._take(size) as data:
+            return bytes(data)
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        with self._take(view.nbytes) as data:
+            view[:data.nbytes] = data
+            return data.nbytes
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+        return bytes(line)
+
+
+class CodecSelector:
+    def __init__(self, allowed=None, default_link_mbps=1000.0):
+        self.codecs = available_codecs(allowed)
+        self.default_link_mbps = default_link_mbps
+        self.lock = threading.Lock()
+        # peer -> measured link Mbps
+        self.link_mbps = {}
+        # peer -> codecs the peer accepts
+        self.accepted = {}
+
+    def peer_codecs(self, peer, fetch):
+        """Codecs a peer accepts, asked once through fetch() and remembered."""
+        with self.lock:
+            if peer in self.accepted:
+                return self.accepted[peer]
+        accepted = fetch()
+        if accepted is None:
+            # Ask again next time
+            return []
+        with self.lock:
+            self.accepted[peer] = accepted
+        return accepted
+
+    def link(self, peer):
+        with self.lock:
+            return self.link_mbps.get(peer, self.default_link_mbps)
+
+    def record(self, peer, nbytes, seconds, compressed):
+        """Update the link estimate of a peer from a finished transfer."""
+        if nbytes < MIN_MEASURED_BYTES or seconds <= 0:
+            return
+        mbps = nbytes * 8 / 1e6 / seconds
+        with self.lock:
+            if compressed:
+                # Compression may have been the bottleneck, so this is only a lower bound
+                self.link_mbps[peer] = max(self.link_mbps.get(peer, 0.0), mbps)
+            else:
+                old = self.link_mbps.get(peer)
+                self.link_mbps[peer] = mbps if old is None else 0.5 * old + 0.5 * mbps
+
+    @staticmethod
+    def sample(buffers):
+        """Up to SAMPLE_BYTES from the middle of the largest buffer (the array data)."""
+        view = max(_views(buffers), key=lambda v: v.nbytes)
+        start = max(0, view.nbytes // 2 - SAMPLE_BYTES // 2)
+        return view[start:start + SAMPLE_BYTES]
+
+    @staticmethod
+    def measure(codec, sample):
+        """(compressed/raw ratio, compress MB/s) of a codec on a sample."""
+        compressor = CODECS[codec][0]()
+        begin = time.process_time()
+        size = len(compressor.compress(sample)) + len(compressor.flush())
+        seconds = max(time.process_time() - begin, 1e-6)
+        return size / max(sample.nbytes, 1), sample.nbytes / 1e6 / seconds
+
+    def choose(self, peer, buffers, accepted):
+        """Return (codec or None, {codec: estimated seconds}) for sending `buffers` to `peer`."""
+        size = sum(view.nbytes for view in _views(buffers))
+        link_bytes_s = self.link(peer) * 1e6 / 8
+        estimates = {None: size / link_bytes_s}
+        candidates = [name for name in self.codecs if name in accepted]
+        if candidates and size >= MIN_MEASURED_BYTES:
+            sample = self.sample(buffers)
+            for name in candidates:
+                ratio, mb_s = self.measure(name, sample)
+                estimates[name] = max(size / (mb_s * 1e6), size * ratio / link_bytes_s)
+        best = min(estimates, key=estimates.get)
+        return best, estimates
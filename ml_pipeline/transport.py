@@ -0,0 +1,47 @@
+"""
+Pooled HTTP transport of the stage transfers of ml_app.py.
+
+One requests.Session per peer (host:port) keeps its TCP connections alive
+between transfers, offers, acks and codec queries instead of opening a new
+connection for each, and large chunks (TRANSFER_CHUNK_KB) keep the number of
+chunked-encoding frames and send calls of a multi-hundred-MB body low. Chunks
+are memoryview slices of the payload buffers, nothing is copied to build them.
+"""
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Transport:
+    def __init__(self, chunk_size=1 << 18, pool_size=4):
+        self.chunk_size = chunk_size
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def session(self, url):
+        peer = urlsplit(url).netloc
+        with self.lock:
+            session = self.sessions.get(peer)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[peer] = session
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session(url).get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session(url).post(url, **kwargs)
+
+    def close(self):
+        with self.lock:
+            sessions, self.sessions = self.sessions, {}
+        for session in sessions.values():
+            session.close()
@@ -0,0 +1,55 @@
+"""
+Raw tick capture of net_stat_monitor.py (--capture FILE) for monitor_replay.py.
+
+One JSON line per monitor tick with everything MonitorPipeline consumes:
+
+    {"kind": "baseline" | "tick", "t": <monitor monotonic time>,
+     "events": [[kind, pod_name, namespace, receivers], ...],
+     "pods": [[pod_name, namespace], ...],
+     "counters": {pod_name: [rx_bytes, tx_bytes, ts], ...},
+     "edges": [[sender, receiver, mbps], ...]}
+
+Files ending in .gz are compressed.
+"""
+
+import gzip
+import json
+
+
+def _open(path, mode):
+    return gzip.open(path, mode + 't') if path.endswith('.gz') else open(path, mode)
+
+
+class TickCapture:
+    def __init__(self, path):
+        self.file = _open(path, 'w')
+
+    def write(self, kind, t, events, pods, counters, edge_mbps=None):
+        record = {
+            'kind': kind,
+            't': t,
+            'events': [list(event) for event in events],
+            'pods': [list(pod) for pod in pods],
+            'counters': {name: list(values) for name, values in counters.items()},
+            'edges': [[sender, receiver, mbps] for (sender, receiver), mbps in (edge_mbps or {}).items()],
+        }
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_ticks(path):
+    """Yield (kind, t, events, pods, counters, edge_mbps) in the form MonitorPipeline takes."""
+    with _open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield (record['kind'],
+                   record['t'],
+                   [tuple(event) for event in record['events']],
+                   [tuple(pod) for pod in record['pods']],
+                   {name: tuple(values) for name, values in record['counters'].items()},
+                   {(sender, receiver): mbps for sender, receiver, mbps in record['edges']})
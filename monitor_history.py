@@ -0,0 +1,115 @@
+"""
+Bounded per-pod counter history for net_stat_monitor.py.
+
+All pods share one preallocated 2-D ring buffer of shape (max_pods, capacity):
+each pod owns a row (slot) and every column holds one (ts, rx, tx) counter sample.
+Appending is O(1) and the queries below are vectorized over all slots, so a
+monitor iteration costs the same after a week as after a minute.
+"""
+
+import numpy as np
+
+SAMPLE_DTYPE = np.dtype([('ts', 'f8'), ('rx', 'f8'), ('tx', 'f8')])
+
+
+class PodHistory:
+    def __init__(self, max_pods=1024, capacity=600):
+        self.capacity = capacity
+        self.samples = np.zeros((max_pods, capacity), dtype=SAMPLE_DTYPE)
+        # Samples appended per slot since it was assigned (not capped at capacity)
+        self.count = np.zeros(max_pods, dtype=np.int64)
+        self.active = np.zeros(max_pods, dtype=bool)
+        self.slots = {}
+        self.names = [None] * max_pods
+        self.free_slots = list(range(max_pods - 1, -1, -1))
+
+    def slot(self, pod_name):
+        """Return the slot of a pod, assigning a free one on first use (None if full)."""
+        slot = self.slots.get(pod_name)
+        if slot is None:
+            if not self.free_slots:
+                print(f"History full, not tracking pod {pod_name}")
+                return None
+            slot = self.free_slots.pop()
+            self.slots[pod_name] = slot
+            self.names[slot] = pod_name
+            self.count[slot] = 0
+            self.active[slot] = True
+        return slot
+
+    def release(self, pod_name):
+        """Free the slot of a deleted pod."""
+        slot = self.slots.pop(pod_name, None)
+        if slot is not None:
+            self.active[slot] = False
+            self.names[slot] = None
+            self.count[slot] = 0
+            self.free_slots.append(slot)
+
+    def append(self, pod_name, rx, tx, ts):
+        slot = self.slot(pod_name)
+        if slot is None:
+            return
+        self.samples[slot, self.count[slot] % self.capacity] = (ts, rx, tx)
+        self.count[slot] += 1
+
+    def last(self, pod_name):
+        """Latest (ts, rx, tx) sample of a pod or None."""
+        slot = self.slots.get(pod_name)
+        if slot is None or self.count[slot] == 0:
+            return None
+        return self.samples[slot, (self.count[slot] - 1) % self.capacity]
+
+    def active_slots(self):
+        """Slots in use, in slot order; all query results are aligned with this."""
+        return np.flatnonzero(self.active)
+
+    def pod_names(self, slots=None):
+        slots = self.active_slots() if slots is None else slots
+        return [self.names[slot] for slot in slots]
+
+    def _column(self, slots, back):
+        """Column index of the sample `back` steps before the latest one, per slot."""
+        return (self.count[slots] - 1 - back) % self.capacity
+
+    def last_k(self, field, k, slots=None):
+        """
+        Last k values of `field` for every slot as a (len(slots), k) array, newest
+        first; entries older than the slot's first sample (or evicted) are NaN.
+        """
+        slots = self.active_slots() if slots is None else slots
+        back = np.arange(k)
+        columns = (self.count[slots, None] - 1 - back[None, :]) % self.capacity
+        values = self.samples[field][slots[:, None], columns]
+        valid = back[None, :] < np.minimum(self.count[slots], self.capacity)[:, None]
+        return np.where(valid, values, np.nan)
+
+    def last_k_mean(self, field, k, slots=None):
+        """Mean of the last k values of `field` per slot (NaN for empty slots)."""
+        values = self.last_k(field, k, slots)
+        n = np.sum(~np.isnan(values), axis=1)
+        with np.errstate(invalid='ignore'):
+            return np.where(n > 0, np.nansum(values, axis=1) / np.maximum(n, 1), np.nan)
+
+    def rate_mbps(self, field, k=1, slots=None):
+        """
+        Rate of the `rx`/`tx` byte counter over the last k sample intervals, in Mbps,
+        using the real timestamps. Slots with fewer than two samples give NaN.
+        """
+        slots = self.active_slots() if slots is None else slots
+        available = np.minimum(self.count[slots], self.capacity) - 1
+        back = np.minimum(k, available)
+        newest = self._column(slots, 0)
+        oldest = self._column(slots, np.maximum(back, 0))
+        counter = self.samples[field]
+        ts = self.samples['ts']
+        delta_bytes = counter[slots, newest] - counter[slots, oldest]
+        delta_t = ts[slots, newest] - ts[slots, oldest]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = delta_bytes * 8 / delta_t / 1e6
+        return np.where((back > 0) & (delta_t > 0), rate, np.nan)
+
+    def rate_samples(self, slots=None):
+        """Number of rate values per slot (counter samples minus the baseline)."""
+        slots = self.active_slots() if slots is None else slots
+        return np.maximum(self.count[slots] - 1, 0)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Replay captured monitor ticks through the monitor's processing without a cluster.
+
+    python3 net_stat_monitor.py --capture run.jsonl.gz          # record on a live cluster
+    python3 monitor_replay.py synth -o synth.jsonl.gz --pods 1000 --ticks 600
+    python3 monitor_replay.py replay synth.jsonl.gz --runs 2
+
+replay feeds every tick through the same MonitorPipeline as the live loop, as
+fast as possible (or at --speed times real time), and reports the processing
+throughput in samples/s. With --runs > 1 the results of all runs are hashed and
+compared, to check that processing is deterministic. --dashboard-url also pushes
+the results through the MetricPublisher to a running dashboard.
+"""
+
+import argparse
+import hashlib
+import json
+import time
+
+import numpy as np
+
+from frontend.metric_publisher import MetricPublisher, batch_url, dashboard_key
+from monitor_capture import TickCapture, read_ticks
+from net_stat_monitor import MonitorPipeline
+
+STAGES = ("download", "preprocess", "train", "test")
+# Edges of one pipeline in the order they transfer, as stage indices
+STAGE_EDGES = ((0, 1), (1, 2), (1, 3), (2, 3))
+
+
+def synth(path, pods, ticks, hz, seed=0):
+    """
+    Write a capture of `pods` pods grouped into download/preprocess/train/test
+    pipelines. Each pipeline runs its transfers one after another at 100-900 Mbps
+    on top of 0-1 Mbps idle traffic.
+    """
+    rng = np.random.default_rng(seed)
+    groups = pods // len(STAGES)
+    names = [f"{stage}-{g * len(STAGES) + i}" for g in range(groups) for i, stage in enumerate(STAGES)]
+    n = len(names)
+    interval = 1.0 / hz
+    # Per tick bytes received and sent by every pod
+    rx = rng.uniform(0, 1e6 / 8 * interval, size=(ticks, n))
+    tx = rng.uniform(0, 1e6 / 8 * interval, size=(ticks, n))
+    for g in range(groups):
+        t = int(rng.integers(hz, 10 * hz))
+        for sender, receiver in STAGE_EDGES:
+            length = int(rng.integers(2 * hz, 20 * hz))
+            if t + length >= ticks:
+                break
+            moved = rng.uniform(100, 900) * 1e6 / 8 * interval
+            rx[t:t + length, g * len(STAGES) + receiver] += moved
+            tx[t:t + length, g * len(STAGES) + sender] += moved
+            t += length + int(rng.integers(hz, 5 * hz))
+    rx = np.cumsum(rx, axis=0).astype(np.int64)
+    tx = np.cumsum(tx, axis=0).astype(np.int64)
+    pod_list = [(name, "default") for name in names]
+    events = []
+    for g in range(groups):
+        base = g * len(STAGES)
+        receivers = {0: [names[base + 1]], 1: [names[base + 2], names[base + 3]], 2: [names[base + 3]], 3: []}
+        for i in range(len(STAGES)):
+            events.append(("added", names[base + i], "default", receivers[i]))
+    capture = TickCapture(path)
+    for tick in range(ticks):
+        t = tick * interval
+        counters = {name: (int(rx[tick, i]), int(tx[tick, i]), t) for i, name in enumerate(names)}
+        capture.write("baseline" if tick == 0 else "tick", t, events if tick == 0 else [], pod_list, counters)
+    capture.close()
+    print(f"Wrote {ticks} ticks of {n} pods to {path}")
+
+
+def replay(ticks, publish, speed=0.0, max_pods=1024):
+    """Run captured ticks through a fresh MonitorPipeline, returns (results, samples, seconds)."""
+    pipeline = MonitorPipeline(publish, max_pods=max_pods, verbose=False)
+    results = []
+    samples = 0
+    begin = time.perf_counter()
+    first_t = ticks[0][1] if ticks else 0.0
+    for kind, t, events, pods, counters, edge_mbps in ticks:
+        if speed > 0:
+            delay = (t - first_t) / speed - (time.perf_counter() - begin)
+            if delay > 0:
+                time.sleep(delay)
+        pipeline.apply_events(events)
+        if kind == "baseline":
+            pipeline.baseline(t, pods, counters)
+        else:
+            results.append(pipeline.process(t, pods, counters, edge_mbps))
+        samples += len(counters)
+    return results, samples, time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay harness for net_stat_monitor.py")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="replay a capture through the monitor pipeline")
+    replay_parser.add_argument("capture")
+    replay_parser.add_argument("--speed", type=float, default=0.0, help="times real time, 0 for as fast as possible")
+    replay_parser.add_argument("--runs", type=int, default=2, help="replays to compare for determinism")
+    replay_parser.add_argument("--max-pods", type=int, default=1024)
+    replay_parser.add_argument("--dashboard-url", help="also publish the results to this dashboard /update_data URL")
+    synth_parser = subparsers.add_parser("synth", help="write a synthetic capture")
+    synth_parser.add_argument("-o", "--output", required=True)
+    synth_parser.add_argument("--pods", type=int, default=1000)
+    synth_parser.add_argument("--ticks", type=int, default=600)
+    synth_parser.add_argument("--hz", type=int, default=10)
+    synth_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "synth":
+        synth(args.output, args.pods, args.ticks, args.hz, args.seed)
+        return
+
+    ticks = list(read_ticks(args.capture))
+    publisher = None
+    if args.dashboard_url:
+        publisher = MetricPublisher(batch_url(args.dashboard_url), coalesce_key=dashboard_key).start()
+    digests = []
+    for run in range(args.runs):
+        publish = publisher.publish if publisher is not None and run == 0 else (lambda result: None)
+        results, samples, seconds = replay(ticks, publish, args.speed, args.max_pods)
+        digest = hashlib.sha256(json.dumps(results, sort_keys=True).encode()).hexdigest()
+        digests.append(digest)
+        print(f"run {run}: {len(ticks)} ticks, {samples} samples in {seconds:.2f}s "
+              f"({samples / seconds:,.0f} samples/s, {len(ticks) / seconds:,.1f} ticks/s), "
+              f"{sum(len(r) for r in results)} results, sha256 {digest[:16]}")
+    if len(digests) > 1:
+        print("deterministic" if len(set(digests)) == 1 else "NOT deterministic: results differ between runs")
+    if publisher is not None:
+        publisher.close()
+        print(f"Dashboard: {publisher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,30 @@
+import argparse
 import json
-import requests
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import time
 from kubernetes import client, config, stream
 import numpy as np
 
+from consistent_hash import HashRing
+from exec_stream_source import ExecStreamSessions
+from frontend.metric_publisher import MetricPublisher, batch_url, dashboard_key
+from monitor_history import PodHistory
+from pod_membership import PodMembershipSet
+from prometheus_metrics import MetricsExporter, MetricsSnapshot, start_metrics_server
+from monitor_capture import TickCapture
+from sample_store import SampleWriter
+from transfer_detector import TransferDetector
+
 # FRONTEND_URL = "http://47.107.243.93:8888/update_data"
 FRONTEND_URL = "http://127.0.0.1:8888/update_data"
-def send_data(current_data):
-    try:
-        response = requests.post(FRONTEND_URL, json=current_data)
-        if response.status_code == 200:
-            pass
-        else:
-            print(f"Failed to send data. Status code: {response.status_code}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+# Port on which node_counter_agent.py pushes its batches (--source agent)
+AGENT_PORT = 8899
+
 
 def get_pod_net_stats(api_instance, pod_name, namespace):
     """
@@ -47,114 +57,164 @@ def get_pod_net_stats(api_instance, pod_name, namespace):
         print("Error retrieving stats for pod {} in namespace {}: {}".format(pod_name, namespace, e))
         return None, None
 
-import base64  # 新增导入
-import pickle  # 新增导入
-
-def get_trans_pkl_metrics(api_instance, pod_name, namespace):
+class AgentSampleStore:
     """
-    从 Pod 的 /app 目录读取并解析 trans_metrics.pkl 文件
-    返回反序列化的 Python 对象
+    Latest per-pod counters pushed by node_counter_agent.py, keyed by pod name.
+    Replaces one exec per pod per sample with one HTTP batch per node.
     """
-    exec_command = [
-        '/bin/sh',
-        '-c',
-        "if [ -f /app/trans_metrics.pkl ]; then cat /app/trans_metrics.pkl | base64; fi"
-    ]
-    try:
-        resp = stream.stream(
-            api_instance.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=exec_command,
-            stderr=True, stdin=False,
-            stdout=True, tty=False
-        )
-        resp = resp.strip()
-        if not resp:
-            return None
-
-        try:
-            # Base64 解码二进制数据
-            decoded_data = base64.b64decode(resp)
-            # 反序列化 pickle 数据
-            return pickle.loads(decoded_data)
-        except (base64.binascii.Error, pickle.UnpicklingError) as e:
-            print(f"Data decoding failed for pod {pod_name}: {str(e)}")
-            return None
-        except Exception as e:
-            print(f"Unexpected parsing error in pod {pod_name}: {str(e)}")
-            return None
 
-    except Exception as e:
-        print(f"Error retrieving pkl metrics for pod {pod_name}: {str(e)}")
-        return None
-def get_trans_metrics(api_instance, pod_name, namespace):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.node_last_seen = {}
+        # node -> (monotonic arrival, {(src_ip, dst_ip): Mbps}) of the latest conntrack report
+        self.node_flows = {}
+
+    def update(self, node, samples, flows=None):
+        with self.lock:
+            for sample in samples:
+                self.counters[sample['pod']] = (sample['rx'], sample['tx'], sample['ts'])
+            self.node_last_seen[node] = time.time()
+            if flows is not None:
+                rates = {(flow['src'], flow['dst']): flow['bytes'] * 8 / flow['interval'] / 1e6 for flow in flows}
+                self.node_flows[node] = (time.monotonic(), rates)
+
+    def edge_rates(self, max_age):
+        """
+        {(src_ip, dst_ip): Mbps} from the conntrack reports of the last `max_age` seconds.
+        A flow between two nodes is seen by both, so the larger report wins instead of the sum.
+        """
+        now = time.monotonic()
+        edges = {}
+        with self.lock:
+            for arrival, rates in self.node_flows.values():
+                if now - arrival > max_age:
+                    continue
+                for pair, mbps in rates.items():
+                    edges[pair] = max(mbps, edges.get(pair, 0.0))
+        return edges
+
+    def get_pod_net_stats(self, pod_name):
+        """
+        Return (rx_bytes, tx_bytes, ts) of the latest batch or (None, None, None).
+        ts is the agent's read time, so rates use the node's own sampling interval.
+        """
+        with self.lock:
+            counters = self.counters.get(pod_name)
+        if counters is None:
+            return None, None, None
+        return counters
+
+
+def start_agent_receiver(store, port=AGENT_PORT):
+    """Serve POST /node_samples for node_counter_agent.py in a background thread."""
+
+    class AgentSampleHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/node_samples':
+                self.send_response(404)
+                self.end_headers()
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                batch = json.loads(self.rfile.read(length))
+                store.update(batch['node'], batch['samples'], batch.get('flows'))
+                self.send_response(200)
+            except (ValueError, KeyError) as e:
+                print(f"Invalid sample batch: {e}")
+                self.send_response(400)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            # One request per node per second, keep stdout for the rates
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), AgentSampleHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Receiving node agent samples on port {port}")
+    return server
+
+
+class CounterPoller:
     """
-    Execute a command in the pod to check if the trans_metrices.json file exists in /app.
-    If the file exists, read the content and parse each JSON entry (one per line).
+    Read the counters of all pods concurrently on a bounded thread pool.
 
-    Returns:
-        A list of parsed JSON objects if any are successfully parsed, or None if the file does not exist or is empty.
+    Every read is given `timeout` seconds; a pod whose previous read is still
+    running (e.g. a hanging exec) is skipped instead of queueing a second one, so
+    a slow pod cannot hold up the samples of the others.
     """
-    # Command to check existence and read the trans_metrices.json file in /app directory
-    exec_command = [
-        '/bin/sh',
-        '-c',
-        "if [ -f /app/trans_metrics.json ]; then cat /app/trans_metrics.json; fi"
-    ]
-    try:
-        # Execute the command in the specified pod
-        resp = stream.stream(api_instance.connect_get_namespaced_pod_exec,
-                             pod_name,
-                             namespace,
-                             command=exec_command,
-                             stderr=True, stdin=False,
-                             stdout=True, tty=False)
-        resp = resp.lstrip('\ufeff').strip()
-        if resp.strip() == "":
-            # File does not exist or is empty.
-            return None
-        # Process the file content line by line
-        entries = []
-        for line in resp.strip().splitlines():
-            line = line.strip()
-            line = line.replace("'", '"')
-            if line:
-                try:
-                    # Parse the JSON data from each line
-                    entry = json.loads(line)
-                    entries.append(entry)
-                except json.JSONDecodeError as e:
-                    # Print error details if the particular line fails to parse
-                    print("JSON decode error in line: {}. Error: {}".format(line, e))
-        return entries if entries else None
-    except Exception as e:
-        print("Error retrieving trans_metrices.json for pod {} in namespace {}: {}".format(pod_name, namespace, e))
-        return None
 
-def get_sender(pods_tx_history):
+    def __init__(self, read_net_stats, max_workers=16, timeout=0.8):
+        self.read_net_stats = read_net_stats
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.timeout = timeout
+        self.in_flight = {}
+        self.timeouts = 0
+        # Seconds from the start of the last poll until each pod's counters arrived
+        self.latencies = []
+
+    def _timed_read(self, pod_name, namespace):
+        return self.read_net_stats(pod_name, namespace), time.monotonic()
+
+    def poll(self, pods):
+        """
+        Read [(pod_name, namespace)] and return {pod_name: (rx_bytes, tx_bytes, ts)}
+        for the reads that succeeded within the timeout.
+        """
+        futures = {}
+        poll_start = time.monotonic()
+        for pod_name, namespace in pods:
+            previous = self.in_flight.get(pod_name)
+            if previous is not None and not previous.done():
+                continue
+            future = self.executor.submit(self._timed_read, pod_name, namespace)
+            self.in_flight[pod_name] = future
+            futures[future] = pod_name
+        done, not_done = wait(futures, timeout=self.timeout)
+        self.timeouts += len(not_done)
+        counters = {}
+        latencies = []
+        for future in done:
+            try:
+                (rx, tx, ts), finished = future.result()
+            except Exception as e:
+                print(f"Error polling pod {futures[future]}: {e}")
+                continue
+            latencies.append(finished - poll_start)
+            if rx is not None and tx is not None:
+                counters[futures[future]] = (rx, tx, ts)
+        self.latencies = latencies
+        return counters
+
+
+def get_sender(latest_tx):
+    """Pod with the highest latest TX rate; latest_tx maps pod name -> Mbps."""
     max_mean = -1
-    sender = list(pods_tx_history.keys())[-1]
-    for pod, rxs in pods_tx_history.items():
-        rxs = np.array(rxs)
-        c_m = rxs[-1:]
-        if c_m > max_mean:
-            max_mean = c_m
+    sender = list(latest_tx.keys())[-1]
+    for pod, tx in latest_tx.items():
+        if tx > max_mean:
+            max_mean = tx
             sender = pod
     return sender
 
 
-def get_sender_from_candidates(pods_tx_history, candidates):
+def get_sender_from_candidates(latest_tx, candidates):
     if len(candidates) == 1:
         return candidates[0]
     else:
         for c in candidates:
-            if c in pods_tx_history:
-                if pods_tx_history[c][-1]!=0:
+            if c in latest_tx:
+                if latest_tx[c] != 0:
                     return c
         return candidates[0]
 
 
+def pod_index(pod_name):
+    """Numeric suffix of a pipeline pod name ('train-2' -> 2), None for any other pod."""
+    suffix = pod_name.rsplit('-', 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
 def invert_dict(original_dict):
     """
     For each key in the original dictionary, traverse its value list.
@@ -178,178 +238,552 @@ def invert_dict(original_dict):
     return new_dict
 
 
+class MonitorPipeline:
+    """
+    Per-tick processing of the monitor: membership events -> counter history ->
+    transfer detection -> dashboard results. Shared by the live loop and
+    monitor_replay.py; nothing in here reads the clock, so the same ticks always
+    give the same results.
+    """
+
+    def __init__(self, publish, max_pods=1024, history=600, start_mbps=10.0, stop_mbps=5.0,
+                 recorder=None, verbose=True):
+        self.publish = publish
+        self.recorder = recorder
+        self.verbose = verbose
+        # Preallocated counter history of all pods, one slot per pod
+        self.history = PodHistory(max_pods=max_pods, capacity=history)
+        # Transfer start/end per history slot, for all pods in one vectorized step
+        self.detector = TransferDetector(max_pods=max_pods, start_mbps=start_mbps, stop_mbps=stop_mbps)
+        self.pods_interactions = {}
+        self.rec_send = {}
+        self.historical_sending = []
+        self.optimized = 0
+        # Last tick's view for the metrics endpoint
+        self.pod_rates = []
+        self.edges = []
+        self.transfers_completed = 0
+
+    def apply_events(self, events):
+        """Run per-pod setup/teardown once per added/deleted pod, return True on changes."""
+        for kind, pod_name, namespace, receivers in events:
+            if kind in ("added", "topology"):
+                if self.verbose:
+                    print(f"Pod {pod_name} {kind}: sends to {receivers}")
+                # Topology comes from the pod's annotation in the watch, no exec needed
+                if receivers is None:
+                    print("No topology annotation on pod {} in namespace {}".format(pod_name, namespace))
+                    self.pods_interactions.pop(pod_name, None)
+                else:
+                    self.pods_interactions[pod_name] = receivers
+            else:
+                if self.verbose:
+                    print(f"Pod {pod_name} deleted")
+                if pod_name in self.history.slots:
+                    self.detector.release(self.history.slots[pod_name])
+                self.history.release(pod_name)
+                self.pods_interactions.pop(pod_name, None)
+        if events:
+            self.rec_send = invert_dict(self.pods_interactions)
+        return bool(events)
+
+    def baseline(self, tick_time, pods, counters):
+        """Initial counters of every pod are its baseline."""
+        for pod_name, namespace in pods:
+            if pod_name in counters:
+                rx, tx, ts = counters[pod_name]
+                self.history.append(pod_name, rx, tx, ts)
+                if self.recorder is not None:
+                    self.recorder.append(tick_time, [pod_name], [ts], [rx], [tx])
+            else:
+                print("Failed to retrieve initial stats for pod {} in namespace {}".format(pod_name, namespace))
+
+    def process(self, tick_time, pods, counters, edge_mbps=None):
+        """
+        Take one tick of counters ({pod: (rx, tx, ts)}) and measured edge rates
+        ({(sender, receiver): Mbps}), publish and return the dashboard results.
+        """
+        return self.attribute(self.measure(tick_time, pods, counters), edge_mbps)
+
+    def measure(self, tick_time, pods, counters):
+        """
+        Per-pod half of a tick: append the counters to the history, compute the
+        rates and advance the transfer detector. Returns a picklable dict with
+        the pod rates, the receivers whose transfer started, the number of
+        completed transfers and the transfers in progress; sharded workers send
+        it to the coordinator, which runs attribute() over all shards.
+        """
+        history = self.history
+        detector = self.detector
+        recorded = []
+        appended = set()
+        for pod_name, namespace in pods:
+            if pod_name not in counters:
+                # Skip pod if data retrieval failed or timed out
+                continue
+            new_rx, new_tx, new_ts = counters[pod_name]
+            last = history.last(pod_name)
+            if last is not None and new_ts <= last['ts']:
+                # No newer counters than last time (e.g. agent batch not arrived yet)
+                continue
+            # The first counters of a pod are its baseline (e.g. no agent batch yet at startup)
+            history.append(pod_name, new_rx, new_tx, new_ts)
+            recorded.append((pod_name, new_ts, new_rx, new_tx))
+            appended.add(pod_name)
+        if self.recorder is not None and recorded:
+            recorded_names, recorded_ts, recorded_rx, recorded_tx = zip(*recorded)
+            self.recorder.append(tick_time, recorded_names, recorded_ts, recorded_rx, recorded_tx)
+
+        # Rates over the real interval between the last two reads, for all pods at once
+        slots = history.active_slots()
+        names = history.pod_names(slots)
+        rx_now = history.rate_mbps('rx', 1, slots)
+        tx_now = history.rate_mbps('tx', 1, slots)
+        rx_speed = history.rate_mbps('rx', 3, slots)
+        rate_samples = history.rate_samples(slots)
+        namespaces = dict(pods)
+        pod_rates = [(pod_name, namespaces.get(pod_name, ""), float(rx_mbps), float(tx_mbps))
+                     for pod_name, rx_mbps, tx_mbps in zip(names, rx_now, tx_now) if not np.isnan(rx_mbps)]
+        if self.verbose:
+            for pod_name, _, rx_mbps, tx_mbps in pod_rates:
+                # Print the transmission rate in Mbps
+                print("Pod {} : RX rate: {:.3f} Mbps, TX rate: {:.3f} Mbps".format(pod_name, rx_mbps, tx_mbps))
+            print('*' * 100)
+        # Only pods with a fresh sample advance the detector; their first rate is skipped as before
+        fresh = np.array([name in appended for name in names], dtype=bool)
+        sample_ts = history.last_k('ts', 2, slots)
+        detector_rates = np.where(fresh & (rate_samples > 1), rx_now, np.nan)
+        started = []
+        completed = 0
+        for event in detector.update(slots, sample_ts[:, 0], detector_rates, sample_ts[:, 0] - sample_ts[:, 1]):
+            pod = history.names[event['slot']]
+            if event['event'] == 'start':
+                started.append(pod)
+                continue
+            completed += 1
+            if self.verbose:
+                print(f"Transfer to {pod} ended: {event['bytes'] / 1e6:.1f} MB in {event['duration_s']:.2f}s")
+        slot_index = {slot: i for i, slot in enumerate(slots)}
+        active = []
+        for slot in detector.active_slots():
+            i = slot_index[slot]
+            active.append((names[i], float(rx_speed[i]), int(rate_samples[i]),
+                           float(sample_ts[i, 0] - detector.start_ts[slot])))
+        return {
+            'pod_rates': pod_rates,
+            'latest_tx': {name: float(tx) for name, tx in zip(names, np.nan_to_num(tx_now))},
+            'started': started,
+            'completed': completed,
+            # (receiver, rx Mbps over the last 3 samples, rate samples, seconds since the start)
+            'active': active,
+        }
+
+    def attribute(self, measurement, edge_mbps=None):
+        """
+        Pipeline half of a tick: attribute every transfer in progress to a sender,
+        toggle the optimized flag, publish and return the dashboard results.
+        """
+        edge_mbps = edge_mbps or {}
+        latest_tx = measurement['latest_tx']
+        self.pod_rates = measurement['pod_rates']
+        self.transfers_completed += measurement['completed']
+        for pod in measurement['started']:
+            index = pod_index(pod)
+            if index is not None:
+                self.historical_sending.append(index)
+        results = []
+        self.edges = []
+        for pod, speed, n_rates, time_usage in measurement['active']:
+            if pod not in self.rec_send:
+                # No annotated pod sends to it (e.g. a pod matched by --selector outside the pipeline)
+                continue
+            measured = {c: edge_mbps[(c, pod)] for c in self.rec_send[pod] if (c, pod) in edge_mbps}
+            if measured:
+                sending_pod = max(measured, key=measured.get)
+                speed = measured[sending_pod]
+            else:
+                sending_pod = get_sender_from_candidates(latest_tx, self.rec_send[pod])
+            self.edges.append((sending_pod, pod, float(speed), float(time_usage)))
+            send_index, recv_index = pod_index(sending_pod), pod_index(pod)
+            if send_index is None or recv_index is None:
+                # The dashboard only knows the numbered pipeline pods, the edge still goes to /metrics
+                continue
+            send_id = send_index + 1
+            recv_id = recv_index + 1
+            p = n_rates * 0.2
+            p = 1 if p > 1 else p
+            if self.historical_sending.count(1) >= 2:
+                self.optimized = 1 - self.optimized
+                self.historical_sending = [1]
+            result = {
+                "from": send_id,
+                "to": recv_id,
+                "bandwidth": round(float(speed), 3),
+                "latency": -1,
+                "progress": float(p),
+                "timeusage": round(float(time_usage), 3),
+                "optimized": self.optimized
+            }
+            if self.verbose:
+                print(f'{sending_pod} -> {pod}')
+                print(result)
+            # Send the result data to the frontend service
+            self.publish(result)
+            results.append(result)
+        return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Monitor the transmission rate of the ml-app pods.")
+    parser.add_argument("--source", choices=["exec", "stream", "agent"], default="exec",
+                        help="'exec' runs cat /proc/net/dev in every pod per sample, 'stream' keeps one "
+                             "long-lived exec per pod that prints its counters every interval, 'agent' "
+                             "uses the batches pushed by node_counter_agent.py")
+    parser.add_argument("--agent-port", type=int, default=AGENT_PORT)
+    parser.add_argument("--namespace", action="append", dest="namespaces", metavar="NAMESPACE",
+                        help="namespace to monitor, repeat for several (default: default)")
+    parser.add_argument("--all-namespaces", action="store_true", help="monitor matching pods in all namespaces")
+    parser.add_argument("--selector", default="app=ml-app", help="label selector of the monitored pods")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="worker processes that poll the pods, pods are assigned by consistent hash")
+    parser.add_argument("--interval", type=float, default=1.0, help="sampling interval in seconds")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent counter reads")
+    parser.add_argument("--timeout", type=float, default=0.8, help="per-pod read timeout in seconds")
+    parser.add_argument("--max-pods", type=int, default=1024, help="pod slots of the history buffer")
+    parser.add_argument("--history", type=int, default=600, help="samples kept per pod")
+    parser.add_argument("--start-mbps", type=float, default=10.0,
+                        help="RX rate above the idle baseline that starts a transfer")
+    parser.add_argument("--stop-mbps", type=float, default=5.0,
+                        help="a transfer ends after two samples within this rate of the idle baseline")
+    parser.add_argument("--record", metavar="RUN_DIR",
+                        help="append every counter sample to a sample_store.py run directory")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="write the raw counter reads and pod events of every tick for monitor_replay.py")
+    parser.add_argument("--metrics-port", type=int, default=9108,
+                        help="port of the Prometheus /metrics endpoint, 0 to disable")
+    parser.add_argument("--dashboard-url", default=FRONTEND_URL,
+                        help="/update_data URL of serverless_dashborad.py, results go to its batch endpoint")
+    parser.add_argument("--publish-queue", type=int, default=1000,
+                        help="results buffered for the dashboard before the oldest are dropped")
+    args = parser.parse_args()
+    if args.all_namespaces:
+        args.namespaces = None
+    elif not args.namespaces:
+        args.namespaces = ["default"]
+    if args.shards > 1 and args.source == "agent":
+        parser.error("--source agent already receives one batch per node, use it without --shards")
+    if args.shards > 1 and (args.record or args.capture):
+        parser.error("--record and --capture are not supported with --shards")
+    return args
+
+
+def make_counter_reader(args, api_instance):
+    """Return (read_net_stats, exec_sessions, agent_store) for the selected counter source."""
+    exec_sessions = None
+    agent_store = None
+    if args.source == "agent":
+        agent_store = AgentSampleStore()
+        start_agent_receiver(agent_store, args.agent_port)
+
+        def read_net_stats(pod_name, namespace):
+            return agent_store.get_pod_net_stats(pod_name)
+    elif args.source == "stream":
+        exec_sessions = ExecStreamSessions(api_instance, interval=args.interval)
+        exec_sessions.start()
+
+        def read_net_stats(pod_name, namespace):
+            return exec_sessions.get_pod_net_stats(pod_name)
+    else:
+        def read_net_stats(pod_name, namespace):
+            start = time.monotonic()
+            rx, tx = get_pod_net_stats(api_instance, pod_name, namespace)
+            # Stamp the middle of the exec round-trip
+            return rx, tx, (start + time.monotonic()) / 2
+    return read_net_stats, exec_sessions, agent_store
+
+
+def run_shard_worker(shard, args, event_queue, result_queue):
+    """
+    Worker process of a sharded monitor: polls the pods it owns and sends the
+    per-pod measurement of every tick (rates, transfer starts/ends, transfers in
+    progress, see MonitorPipeline.measure) to the coordinator. Sender
+    attribution needs the rates of all pods and is done by the coordinator.
+
+    event_queue carries (membership events, owned pods); the events release the
+    history of deleted pods.
+    """
+    config.load_kube_config()
+    api_instance = client.CoreV1Api()
+    read_net_stats, exec_sessions, _ = make_counter_reader(args, api_instance)
+    poller = CounterPoller(read_net_stats, max_workers=args.workers, timeout=args.timeout)
+    pipeline = MonitorPipeline(lambda result: None, max_pods=args.max_pods, history=args.history,
+                               start_mbps=args.start_mbps, stop_mbps=args.stop_mbps, verbose=False)
+    owned = []
+    interval = args.interval
+    next_tick = time.monotonic()
+    while True:
+        next_tick += interval
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+        tick_start = time.monotonic()
+        changed = False
+        while True:
+            try:
+                events, owned = event_queue.get_nowait()
+            except queue.Empty:
+                break
+            pipeline.apply_events(events)
+            changed = True
+        if changed and exec_sessions is not None:
+            exec_sessions.sync(owned)
+        # A pod's first counters are its baseline, see MonitorPipeline.measure
+        counters = poller.poll(owned)
+        measurement = pipeline.measure(tick_start, owned, counters)
+        stats = {'pods': len(owned), 'duration_s': time.monotonic() - tick_start, 'timeouts': poller.timeouts,
+                 'latencies': poller.latencies}
+        result_queue.put((shard, measurement, stats))
+        if time.monotonic() > next_tick + interval:
+            next_tick += int((time.monotonic() - next_tick) // interval) * interval
+
+
+def merge_measurements(latest, fresh):
+    """
+    One measurement over all shards. latest: {shard: newest measurement} for the
+    rates of every pod; fresh: the measurements that arrived this tick, whose
+    transfer events and transfers in progress are used.
+    """
+    latest_tx = {}
+    pod_rates = []
+    for measurement in latest.values():
+        latest_tx.update(measurement['latest_tx'])
+        pod_rates.extend(measurement['pod_rates'])
+    active = {}
+    for measurement in fresh:
+        # A shard that reported twice in one tick: its newest view wins
+        active.update((transfer[0], transfer) for transfer in measurement['active'])
+    return {
+        'pod_rates': pod_rates,
+        'latest_tx': latest_tx,
+        'started': [pod for measurement in fresh for pod in measurement['started']],
+        'completed': sum(measurement['completed'] for measurement in fresh),
+        'active': list(active.values()),
+    }
+
+
+def run_sharded(args):
+    """
+    Coordinator of a sharded monitor: watches the pods, assigns them to worker
+    processes by consistent hash, merges their per-pod measurements and does
+    sender attribution, the optimized toggle and the dashboard results once
+    for all shards.
+    """
+    ring = HashRing(range(args.shards))
+    result_queue = multiprocessing.Queue()
+    event_queues = {}
+    workers = {}
+
+    def start_worker(shard):
+        event_queues[shard] = multiprocessing.Queue()
+        workers[shard] = multiprocessing.Process(target=run_shard_worker, daemon=True,
+                                                 args=(shard, args, event_queues[shard], result_queue))
+        workers[shard].start()
+
+    # Fork the workers before any watch thread is running
+    for shard in range(args.shards):
+        start_worker(shard)
+    config.load_kube_config()
+    api_instance = client.CoreV1Api()
+    membership = PodMembershipSet(api_instance, args.namespaces, args.selector)
+    membership.start()
+    publisher = MetricPublisher(batch_url(args.dashboard_url), max_queue=args.publish_queue,
+                                coalesce_key=dashboard_key).start()
+    # Topology, sender attribution and dashboard state of all shards
+    pipeline = MonitorPipeline(publisher.publish, max_pods=args.max_pods, history=args.history,
+                               start_mbps=args.start_mbps, stop_mbps=args.stop_mbps, verbose=False)
+    # /metrics of the whole monitor, from the merged measurements and the stats the shards send along
+    exporter = MetricsExporter()
+    if args.metrics_port:
+        start_metrics_server(exporter, args.metrics_port)
+
+    def send_to(shard, events):
+        owned = [(pod_name, namespace) for pod_name, namespace in membership.pods() if ring.owner(pod_name) == shard]
+        event_queues[shard].put((events, owned))
+
+    membership.drain_events()
+    snapshot = membership.snapshot_events()
+    pipeline.apply_events(snapshot)
+    for shard in workers:
+        send_to(shard, snapshot)
+    shard_stats = {}
+    latest = {}
+    interval = args.interval
+    next_tick = time.monotonic() + interval
+    while True:
+        # Collect the shards' measurements until the next coordinator tick
+        fresh = []
+        while True:
+            try:
+                shard, measurement, stats = result_queue.get(timeout=max(0.0, next_tick - time.monotonic()))
+            except queue.Empty:
+                break
+            shard_stats[shard] = stats
+            latest[shard] = measurement
+            exporter.observe_latencies(stats['latencies'])
+            fresh.append(measurement)
+        next_tick += interval
+        if fresh:
+            pipeline.attribute(merge_measurements(latest, fresh))
+        events = membership.drain_events()
+        pipeline.apply_events(events)
+        for shard, worker in list(workers.items()):
+            if not worker.is_alive():
+                print(f"Shard {shard} exited with code {worker.exitcode}, restarting")
+                latest.pop(shard, None)
+                start_worker(shard)
+                send_to(shard, membership.snapshot_events())
+            elif events:
+                send_to(shard, events)
+        publish_stats = publisher.stats()
+        exporter.update(MetricsSnapshot(
+            pod_rates=pipeline.pod_rates,
+            edges=pipeline.edges,
+            latencies=[latency for stats in shard_stats.values() for latency in stats['latencies']],
+            loop={
+                # The slowest shard bounds the sampling of the whole monitor
+                'loop_duration_seconds': max((stats['duration_s'] for stats in shard_stats.values()), default=0.0),
+                'monitored_pods': sum(stats['pods'] for stats in shard_stats.values()),
+                'shards': len(shard_stats),
+            },
+            counters={
+                'read_timeouts': sum(stats['timeouts'] for stats in shard_stats.values()),
+                'transfers_completed': pipeline.transfers_completed,
+                'dashboard_sent': publish_stats['sent'],
+                'dashboard_dropped': publish_stats['dropped'],
+                'membership_api_calls': membership.api_calls,
+            }))
+        print("Shards: " + ", ".join(
+            f"{shard}: {stats['pods']} pods {stats['duration_s']:.3f}s" for shard, stats in sorted(shard_stats.items())))
+        print(f"Dashboard: sent {publish_stats['sent']}, coalesced {publish_stats['coalesced']}, "
+              f"dropped {publish_stats['dropped']}, queued {publish_stats['queued']} "
+              f"(membership API calls so far: {membership.api_calls})")
+
+
 def main():
     """
-    Main function to monitor the transmission rate of pods in the 'default' namespace every 1 second.
+    Main function to monitor the transmission rate of the selected pods every `--interval` seconds.
     The transmission rate is displayed in Mbps.
     """
+    args = parse_args()
+    if args.shards > 1:
+        run_sharded(args)
+        return
     # Load Kubernetes configuration from default location (e.g., ~/.kube/config)
     config.load_kube_config()
     api_instance = client.CoreV1Api()
 
-    # Retrieve the list of pods in the 'default' namespace
-    pods = api_instance.list_namespaced_pod(
-        namespace="default",
-        label_selector="app=ml-app",
-        watch=False
-    )
-
-    # Dictionary to store initial network statistics for each pod
-    pod_stats = {}
-    # Dictionary to store start time for each receiving candidate
-    recv_start_times = {}
-    pods_interactions = {}
-    # Initial collection of network statistics for each pod in the default namespace
-    for pod in pods.items:
-        namespace = pod.metadata.namespace
-        pod_name = pod.metadata.name
-        rx, tx = get_pod_net_stats(api_instance, pod_name, namespace)
-        trans_info = get_trans_pkl_metrics(api_instance, pod_name, namespace)
-        if trans_info is None:
-            print("Failed to retrieve trans_metrics for pod {} in namespace {}".format(pod_name, namespace))
-        else:
-            assert trans_info['sender'] == pod_name
-            pods_interactions[pod_name] = trans_info['receiver']
-
-        if rx is not None and tx is not None:
-            pod_stats[pod_name] = {'rx': rx, 'tx': tx}
-
-        else:
-            print("Failed to retrieve initial stats for pod {} in namespace {}".format(pod_name, namespace))
-    rec_send = invert_dict(pods_interactions)
-    # Continuous monitoring loop: update every 1 second
-    pods_tx_history = {}
-    pods_rx_history = {}
-    start_time = {}
-    historical_sending = []
-    optimized = 0
+    read_net_stats, exec_sessions, agent_store = make_counter_reader(args, api_instance)
+    poller = CounterPoller(read_net_stats, max_workers=args.workers, timeout=args.timeout)
+    # Results are pushed to the dashboard from a background thread, in batches
+    publisher = MetricPublisher(batch_url(args.dashboard_url), max_queue=args.publish_queue,
+                                coalesce_key=dashboard_key).start()
+
+    # Optional on-disk copy of every sample for offline analysis
+    recorder = SampleWriter(args.record) if args.record else None
+    pipeline = MonitorPipeline(publisher.publish, max_pods=args.max_pods, history=args.history,
+                               start_mbps=args.start_mbps, stop_mbps=args.stop_mbps, recorder=recorder)
+    # Optional capture of the raw ticks for monitor_replay.py
+    capture = TickCapture(args.capture) if args.capture else None
+    exporter = MetricsExporter()
+    if args.metrics_port:
+        start_metrics_server(exporter, args.metrics_port)
+
+    # Running pods come from one LIST plus a WATCH instead of a LIST every second
+    membership = PodMembershipSet(api_instance, args.namespaces, args.selector)
+    membership.start()
+
+    def apply_membership_events():
+        events = membership.drain_events()
+        if events and args.source == "stream":
+            exec_sessions.sync(membership.pods())
+        return events
+
+    events = apply_membership_events()
+    pipeline.apply_events(events)
+    pods = membership.pods()
+    counters = poller.poll(pods)
+    tick_start = time.monotonic()
+    pipeline.baseline(tick_start, pods, counters)
+    if capture is not None:
+        capture.write("baseline", tick_start, events, pods, counters)
+    # Continuous monitoring loop: one sample every `interval` seconds on a fixed-rate schedule
+    # Sampling jitter (wake-up delay vs. schedule) and loop duration of the last iteration
+    loop_metrics = {'jitter_s': 0.0, 'loop_duration_s': 0.0, 'timeouts': 0, 'skipped_ticks': 0}
+    interval = args.interval
+    next_tick = time.monotonic()
     while True:
-        time.sleep(1)
-        current_time = time.time()
-        # Retrieve the list of pods in the 'default' namespace in case there are changes
-        pods = api_instance.list_namespaced_pod(
-            namespace="default",
-            label_selector="app=ml-app",
-            watch=False
-        )
-        monitoring_data = []
-        for pod in pods.items:
-            namespace = pod.metadata.namespace
-            pod_name = pod.metadata.name
-            new_rx, new_tx = get_pod_net_stats(api_instance, pod_name, namespace)
-            if new_rx is None or new_tx is None:
-                # Skip pod if data retrieval fails
-                continue
-            key = pod_name
-            if key in pod_stats:
-                # Calculate the difference in bytes over the 1-second interval
-                old_rx = pod_stats[key]['rx']
-                old_tx = pod_stats[key]['tx']
-                delta_rx = new_rx - old_rx
-                delta_tx = new_tx - old_tx
-                # Convert bytes per second to Mbps: (B/s * 8) / 1e6
-                delta_rx_mbps = (delta_rx * 8) / 1e6
-                delta_tx_mbps = (delta_tx * 8) / 1e6
-                monitoring_data.append({
-                    'namespace': namespace,
-                    'pod_name': pod_name,
-                    'delta_rx_mbps': delta_rx_mbps,
-                    'delta_tx_mbps': delta_tx_mbps
-                })
-                pods_tx_history.setdefault(pod_name, []).append(delta_tx_mbps)
-                pods_rx_history.setdefault(pod_name, []).append(delta_rx_mbps)
-                # Update the stored statistics for next interval calculation
-                pod_stats[key] = {'rx': new_rx, 'tx': new_tx}
-                # Print the transmission rate in Mbps
-                print("Pod {} : RX rate: {:.3f} Mbps, TX rate: {:.3f} Mbps".format(pod_name,
-                                                                                    delta_rx_mbps,
-                                                                                    delta_tx_mbps))
-        print('*' * 100)
-        for pod, rxs in pods_rx_history.items():
-            rxs = np.array(rxs)
-            speed = np.mean(rxs[-3:])
-            if rxs[-1] > 10 and len(rxs) > 1:
-                if pod not in start_time.keys():
-                    time_usage = 0
-                    start_time[pod] = time.time()
-                    historical_sending.append(int(pod.split('-')[-1]))
-                else:
-                    time_usage = time.time() - start_time[pod]
-                sending_pod = get_sender_from_candidates(pods_tx_history, rec_send[pod])
-                send_id = int(sending_pod.split('-')[-1]) + 1
-                recv_id = int(pod.split('-')[-1]) + 1
-                print(f'{sending_pod} -> {pod}')
-                p = len(rxs) * 0.2
-                p = 1 if p > 1 else p
-                if historical_sending.count(1) >= 2:
-                    optimized = 1 - optimized
-                    historical_sending = [1]
-                result = {
-                    "from": send_id,
-                    "to": recv_id,
-                    "bandwidth": round(speed, 3),
-                    "latency": -1,
-                    "progress": p,
-                    "timeusage": round(time_usage, 3),
-                    "optimized": optimized
-                }
-                print(result)
-                # Send the result data to the frontend service
-                # send_data(result)
-            else:
-                if pod in start_time.keys():
-                    del start_time[pod]
-
-
-
-
-
-        # # Only consider pods with both tx and rx speeds > 0
-        # for data in monitoring_data:
-        #     if data['delta_tx_mbps'] > 0 and data['delta_rx_mbps'] > 0:
-        #         # If tx rate is more than five times the rx rate, consider it as a sending candidate
-        #         if data['delta_tx_mbps'] > 5 * data['delta_rx_mbps']:
-        #             sending_candidates.append(data)
-        #         else:
-        #             receiving_candidates.append(data)
-        #
-        # # Determine the sending node (only one allowed)
-        # sending_node = None
-        # if sending_candidates:
-        #     sending_node = max(sending_candidates, key=lambda x: x['delta_tx_mbps'] - x['delta_rx_mbps'])
-        #
-        # # Clean up recv_start_times: remove keys that are not in the current receiving_candidates
-        # current_recv_keys = {(item['namespace'], item['pod_name']) for item in receiving_candidates}
-        # for key in list(recv_start_times.keys()):
-        #     if key not in current_recv_keys:
-        #         del recv_start_times[key]
-        #
-        # # When a sending node and at least one receiving node are available, perform pairing
-        # if sending_node and receiving_candidates:
-        #     for recv in receiving_candidates:
-        #         key = (recv['namespace'], recv['pod_name'])
-        #         # If this is the first time we see this receiving candidate, record its start time
-        #         if key not in recv_start_times:
-        #             recv_start_times[key] = current_time
-        #         # Calculate the actual transmission time for the receiving node
-        #         timeusage = current_time - recv_start_times[key]
-        #         send_id = int(sending_node['pod_name'].split('-')[-1]) + 1
-        #         recv_id = int(recv['pod_name'].split('-')[-1]) + 1
-        #         result = {
-        #             "from": send_id,
-        #             "to": recv_id,
-        #             "bandwidth": round(recv['delta_rx_mbps'], 3),
-        #             "latency": -1,
-        #             "progress": -1,
-        #             "timeusage": round(timeusage, 3),
-        #             "optimized": 0
-        #         }
-        #         print(result)
-        #         # Send the result data to the frontend service
-        #         send_data(result)
-        # else:
-        #     # If no valid pairing detected, clear the receiving candidates' start times
-        #     recv_start_times.clear()
+        next_tick += interval
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+        tick_start = time.monotonic()
+        loop_metrics['jitter_s'] = tick_start - next_tick
+        events = apply_membership_events()
+        pipeline.apply_events(events)
+        pods = membership.pods()
+        counters = poller.poll(pods)
+        # Measured per-edge rates from conntrack, keyed by (sender pod, receiver pod)
+        edge_mbps = {}
+        if args.source == "agent":
+            pod_by_ip = membership.pods_by_ip()
+            for (src_ip, dst_ip), mbps in agent_store.edge_rates(max_age=2 * interval).items():
+                if src_ip in pod_by_ip and dst_ip in pod_by_ip:
+                    edge_mbps[(pod_by_ip[src_ip], pod_by_ip[dst_ip])] = mbps
+        if capture is not None:
+            capture.write("tick", tick_start, events, pods, counters, edge_mbps)
+        pipeline.process(tick_start, pods, counters, edge_mbps)
+
+        loop_metrics['loop_duration_s'] = time.monotonic() - tick_start
+        loop_metrics['timeouts'] = poller.timeouts
+        if time.monotonic() > next_tick + interval:
+            # Iteration overran the next tick: skip the missed ticks instead of bursting
+            missed = int((time.monotonic() - next_tick) // interval)
+            next_tick += missed * interval
+            loop_metrics['skipped_ticks'] += missed
+        loop_metrics['membership_api_calls'] = membership.api_calls
+        publish_stats = publisher.stats()
+        loop_metrics['published'] = publish_stats['sent']
+        loop_metrics['publish_dropped'] = publish_stats['dropped']
+        print(f"Loop: duration {loop_metrics['loop_duration_s']:.3f}s, "
+              f"jitter {loop_metrics['jitter_s'] * 1000:.1f} ms, read timeouts {loop_metrics['timeouts']}, "
+              f"skipped ticks {loop_metrics['skipped_ticks']}, pods {len(pods)} "
+              f"(membership API calls so far: {loop_metrics['membership_api_calls']})")
+        print(f"Dashboard: sent {publish_stats['sent']}, coalesced {publish_stats['coalesced']}, "
+              f"dropped {publish_stats['dropped']}, queued {publish_stats['queued']}")
+        if args.source == "stream":
+            session_lags = exec_sessions.session_lags()
+            for pod_name, lag in session_lags.items():
+                if lag > interval:
+                    print(f"Exec session for pod {pod_name} lags {lag:.2f}s")
+            loop_metrics['max_session_lag_s'] = max(session_lags.values(), default=0.0)
+            loop_metrics['session_reconnects'] = exec_sessions.reconnect_count()
+            print(f"Sessions: {len(session_lags)} connected, max lag {loop_metrics['max_session_lag_s']:.2f}s, "
+                  f"reconnects {loop_metrics['session_reconnects']}")
+        exporter.observe_latencies(poller.latencies)
+        exporter.update(MetricsSnapshot(
+            pod_rates=pipeline.pod_rates,
+            edges=pipeline.edges,
+            latencies=poller.latencies,
+            loop={
+                'loop_jitter_seconds': loop_metrics['jitter_s'],
+                'loop_duration_seconds': loop_metrics['loop_duration_s'],
+                'monitored_pods': len(pods),
+                'exec_session_max_lag_seconds': loop_metrics.get('max_session_lag_s', 0.0),
+            },
+            counters={
+                'read_timeouts': loop_metrics['timeouts'],
+                'skipped_ticks': loop_metrics['skipped_ticks'],
+                'transfers_completed': pipeline.transfers_completed,
+                'dashboard_sent': publish_stats['sent'],
+                'dashboard_dropped': publish_stats['dropped'],
+                'membership_api_calls': loop_metrics['membership_api_calls'],
+            }))
 
 
 if __name__ == "__main__":
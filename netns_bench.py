@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Local netns benchmark for the NETWORK-POLICY layout installed by network_policy.py.
+
+Three network namespaces are wired client <-> router <-> server with veth pairs.
+The router forwards between two subnets of POD_CIDR and carries a ruleset with the
+same shape as the one from `network_policy.py initialized`: FORWARD jumps to
+NETWORK-POLICY, which jumps to INGRESS/EGRESS, which hold one podAct_* jump per
+pod. The test pods are matched last in every list (worst case), so a packet walks
+`pods` jump rules plus `pods` rules inside its own podAct_* chain.
+
+A TCP bulk transfer then measures forwarding throughput and time per segment,
+once with the stateless layout and once with the stateful fast path
+(ESTABLISHED,RELATED accepted at the head of NETWORK-POLICY).
+
+Requires root, iproute2 and iptables-restore.
+
+Usage:
+    python3 netns_bench.py run --pods 0 100 1000 5000 --duration 5
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+from policy_plan import POD_CIDR
+
+NAMESPACES = {"client": "npb-client", "router": "npb-router", "server": "npb-server"}
+CLIENT_IP = "10.244.1.2"
+SERVER_IP = "10.244.2.2"
+FILLER_NET = "10.244.128.0/17"
+BENCH_PORT = 5201
+MSS = 1448  # TCP payload of a 1500 byte MTU segment with timestamps
+
+
+def sh(cmd, check=True, input_text=None):
+    """Run a command, returning its stdout."""
+    result = subprocess.run(cmd, input=input_text, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if check and result.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def in_ns(ns, *cmd):
+    return ["ip", "netns", "exec", ns, *cmd]
+
+
+def setup_topology():
+    teardown_topology()
+    client_ns, router_ns, server_ns = NAMESPACES["client"], NAMESPACES["router"], NAMESPACES["server"]
+    for ns in NAMESPACES.values():
+        sh(["ip", "netns", "add", ns])
+        sh(in_ns(ns, "ip", "link", "set", "lo", "up"))
+
+    sh(["ip", "link", "add", "npb-c", "netns", client_ns, "type", "veth", "peer", "name", "npb-rc", "netns", router_ns])
+    sh(["ip", "link", "add", "npb-s", "netns", server_ns, "type", "veth", "peer", "name", "npb-rs", "netns", router_ns])
+
+    sh(in_ns(client_ns, "ip", "addr", "add", f"{CLIENT_IP}/24", "dev", "npb-c"))
+    sh(in_ns(server_ns, "ip", "addr", "add", f"{SERVER_IP}/24", "dev", "npb-s"))
+    sh(in_ns(router_ns, "ip", "addr", "add", "10.244.1.1/24", "dev", "npb-rc"))
+    sh(in_ns(router_ns, "ip", "addr", "add", "10.244.2.1/24", "dev", "npb-rs"))
+    for ns, dev in ((client_ns, "npb-c"), (server_ns, "npb-s"), (router_ns, "npb-rc"), (router_ns, "npb-rs")):
+        sh(in_ns(ns, "ip", "link", "set", dev, "up"))
+        if shutil.which("ethtool"):
+            # Keep segments MSS-sized so that "per segment" really means per packet
+            sh(in_ns(ns, "ethtool", "-K", dev, "tso", "off", "gso", "off", "gro", "off"), check=False)
+    sh(in_ns(client_ns, "ip", "route", "add", "default", "via", "10.244.1.1"))
+    sh(in_ns(server_ns, "ip", "route", "add", "default", "via", "10.244.2.1"))
+    sh(in_ns(router_ns, "sysctl", "-qw", "net.ipv4.ip_forward=1"))
+
+
+def teardown_topology():
+    for ns in NAMESPACES.values():
+        sh(["ip", "netns", "del", ns], check=False)
+
+
+def build_policy_ruleset(pods, stateful):
+    """
+    Return an iptables-restore script with the NETWORK-POLICY layout for `pods`
+    filler pods in front of the client and server pods.
+    """
+    fillers = [str(ip) for _, ip in zip(range(pods), ipaddress.ip_network(FILLER_NET).hosts())]
+    lines = ["*filter"]
+    chains = ["NETWORK-POLICY", "NETWORK-POLICY/INGRESS", "NETWORK-POLICY/EGRESS"]
+    per_pod = []
+    for ip in fillers + [CLIENT_IP, SERVER_IP]:
+        suffix = ip.replace('.', '_')
+        per_pod.append((ip, f"podAct_in_{suffix}", f"podAct_out_{suffix}"))
+        chains += [f"podAct_in_{suffix}", f"podAct_out_{suffix}"]
+    lines += [f":{name} - [0:0]" for name in chains]
+
+    lines.append(f"-A FORWARD -s {POD_CIDR} -d {POD_CIDR} -j NETWORK-POLICY")
+    if stateful:
+        lines.append("-A NETWORK-POLICY -m conntrack --ctstate ESTABLISHED,RELATED -j ACCEPT")
+    lines.append(f"-A NETWORK-POLICY -d {POD_CIDR} -j NETWORK-POLICY/INGRESS")
+    lines.append(f"-A NETWORK-POLICY -s {POD_CIDR} -j NETWORK-POLICY/EGRESS")
+
+    for ip, in_chain, out_chain in per_pod:
+        lines.append(f"-A NETWORK-POLICY/INGRESS -d {ip} -j {in_chain}")
+        lines.append(f"-A NETWORK-POLICY/EGRESS -s {ip} -j {out_chain}")
+        if ip in (CLIENT_IP, SERVER_IP):
+            # One rule per other pod, the peer test pod last
+            peer = SERVER_IP if ip == CLIENT_IP else CLIENT_IP
+            for other in fillers + [peer]:
+                lines.append(f"-A {in_chain} -s {other} -p tcp -j ACCEPT")
+                lines.append(f"-A {out_chain} -d {other} -p tcp -j ACCEPT")
+        lines.append(f"-A {in_chain} -j ACCEPT")
+        lines.append(f"-A {out_chain} -j ACCEPT")
+    lines.append("-A NETWORK-POLICY/INGRESS -j ACCEPT")
+    lines.append("-A NETWORK-POLICY/EGRESS -j ACCEPT")
+    lines.append("COMMIT")
+    return "\n".join(lines) + "\n"
+
+
+def install_ruleset(pods, stateful):
+    """
+    Install the ruleset in the router namespace.
+
+    Returns (install time in seconds, number of rules installed).
+    """
+    ruleset = build_policy_ruleset(pods, stateful)
+    start = time.monotonic()
+    sh(in_ns(NAMESPACES["router"], "iptables-restore"), input_text=ruleset)
+    return time.monotonic() - start, ruleset.count("\n-A ")
+
+
+def run_sink(port, bind_ip):
+    """Accept one connection, read until EOF and print the byte count as JSON."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((bind_ip, port))
+    server.listen(1)
+    print("ready", flush=True)
+    conn, _ = server.accept()
+    buf = bytearray(1 << 20)
+    received = 0
+    start = time.monotonic()
+    while True:
+        n = conn.recv_into(buf)
+        if not n:
+            break
+        received += n
+    elapsed = time.monotonic() - start
+    conn.close()
+    server.close()
+    print(json.dumps({"bytes": received, "seconds": elapsed}), flush=True)
+
+
+def run_source(host, port, duration):
+    """Send as fast as possible for `duration` seconds."""
+    conn = socket.create_connection((host, port))
+    payload = memoryview(bytes(1 << 20))
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        conn.sendall(payload)
+    conn.close()
+
+
+def measure_throughput(duration):
+    """Run one bulk transfer client -> server through the router and return (bytes, seconds)."""
+    script = os.path.abspath(__file__)
+    sink = subprocess.Popen(in_ns(NAMESPACES["server"], sys.executable, script, "sink",
+                                  "--port", str(BENCH_PORT), "--bind", SERVER_IP),
+                            stdout=subprocess.PIPE, text=True)
+    sink.stdout.readline()  # wait for "ready"
+    sh(in_ns(NAMESPACES["client"], sys.executable, script, "source",
+             "--host", SERVER_IP, "--port", str(BENCH_PORT), "--duration", str(duration)))
+    out, _ = sink.communicate()
+    result = json.loads(out.strip().splitlines()[-1])
+    return result["bytes"], result["seconds"]
+
+
+def run_benchmark(pod_counts, modes=("stateless", "stateful"), duration=5.0):
+    """
+    Measure forwarding cost for every pod count and mode.
+
+    Returns a list of dicts with pods, mode, rules, installed_rules, install_s, mbps
+    and ns_per_segment.
+    """
+    results = []
+    setup_topology()
+    try:
+        for pods in pod_counts:
+            for mode in modes:
+                install_s, installed_rules = install_ruleset(pods, stateful=(mode == "stateful"))
+                nbytes, seconds = measure_throughput(duration)
+                segments = max(nbytes / MSS, 1)
+                results.append({
+                    "pods": pods,
+                    "mode": mode,
+                    # Rules walked by the first packet of a flow: jump list + own podAct chain
+                    "rules": (pods + 2) + (pods + 1),
+                    "installed_rules": installed_rules,
+                    "install_s": install_s,
+                    "mbps": nbytes * 8 / seconds / 1e6,
+                    "ns_per_segment": seconds * 1e9 / segments,
+                })
+                print("pods={pods:>6} mode={mode:<9} install={install_s:7.3f}s "
+                      "throughput={mbps:9.1f} Mbps per-segment={ns_per_segment:8.1f} ns".format(**results[-1]))
+    finally:
+        teardown_topology()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="netns forwarding benchmark for the NETWORK-POLICY chains")
+    sub = parser.add_subparsers(dest="cmd")
+
+    run_parser = sub.add_parser("run", help="run the benchmark sweep (default)")
+    run_parser.add_argument("--pods", type=int, nargs="+", default=[0, 100, 1000, 5000],
+                            help="number of filler pods in front of the test pods")
+    run_parser.add_argument("--modes", nargs="+", choices=["stateless", "stateful"],
+                            default=["stateless", "stateful"])
+    run_parser.add_argument("--duration", type=float, default=5.0, help="seconds per measurement")
+
+    sink_parser = sub.add_parser("sink")
+    sink_parser.add_argument("--port", type=int, default=BENCH_PORT)
+    sink_parser.add_argument("--bind", default="0.0.0.0")
+
+    source_parser = sub.add_parser("source")
+    source_parser.add_argument("--host", required=True)
+    source_parser.add_argument("--port", type=int, default=BENCH_PORT)
+    source_parser.add_argument("--duration", type=float, default=5.0)
+
+    args = parser.parse_args()
+    if args.cmd == "sink":
+        run_sink(args.port, args.bind)
+    elif args.cmd == "source":
+        run_source(args.host, args.port, args.duration)
+    else:
+        if args.cmd is None:
+            args = run_parser.parse_args([])
+        run_benchmark(args.pods, args.modes, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,14 @@ import iptc
 import ipaddress
 import random
 import string
+import subprocess
 import time
 
 from iptc import IPTCError
 from kubernetes import client, config
 
+from policy_plan import POD_CIDR, aggregate_accept_ips, choose_aggregation_prefix, plan_subchain_rules
 
-POD_CIDR = "10.244.0.0/16"
 
 def get_pod_ips_at(namespace):
     try:
@@ -121,11 +122,19 @@ def create_network_policy_chain():
     table.autocommit = True
 
 
-def redirect_pod_traffic(pod_cidr):
+def redirect_pod_traffic(pod_cidr, stateful=False):
     table = iptc.Table(iptc.Table.FILTER)
     main_chain = iptc.Chain(table, "NETWORK-POLICY")
     main_chain.flush()
 
+    if stateful:
+        # Only the first packet of a connection walks the per-pod chains, every
+        # later packet of the flow (e.g. the ml-app pickle streams) is accepted here
+        est_rule = iptc.Rule()
+        est_rule.create_match("conntrack").ctstate = "ESTABLISHED,RELATED"
+        est_rule.create_match("comment").comment = "Accept established flows"
+        est_rule.target = iptc.Target(est_rule, "ACCEPT")
+        main_chain.append_rule(est_rule)
 
     def add_jump_rule(chain_type, match_field, value):
         rule = iptc.Rule()
@@ -149,10 +158,46 @@ def redirect_pod_traffic(pod_cidr):
     table.refresh()
 
 
+def flush_conntrack_entries(pod_ips):
+    """
+    Delete the conntrack entries of the given pods so that flows accepted under an
+    older (looser) policy are re-evaluated against the current per-pod chains.
+    Only needed in stateful mode, where established flows bypass the chains.
+    """
+    flushed = 0
+    for ip in pod_ips:
+        for direction in ("-s", "-d"):
+            # conntrack exits with 1 when no entry matched, which is not an error here
+            result = subprocess.run(["conntrack", "-D", direction, ip],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if result.returncode == 0:
+                flushed += 1
+            elif "0 flow entries" not in result.stderr:
+                print(f"Failed to flush conntrack entries for {ip}: {result.stderr.strip()}")
+    print(f"Flushed conntrack entries of {len(pod_ips)} pods ({flushed} deletions)")
+
+
+def build_rule(spec):
+    """Turn a rule spec from plan_subchain_rules into an iptc.Rule."""
+    rule = iptc.Rule()
+    for field in ('src', 'dst'):
+        if field in spec:
+            setattr(rule, field, spec[field])
+    if spec.get('protocol'):
+        rule.protocol = spec['protocol']
+    if 'dport' in spec:
+        match = rule.create_match(spec['protocol'])
+        match.dport = spec['dport']
+    if 'string' in spec:
+        string_match = rule.create_match("string")
+        string_match.string = spec['string']
+        string_match.algo = "bm"
+    rule.target = iptc.Target(rule, spec['target'])
+    return rule
+
+
 def init_ingress_egress_rules(pod_ips):
     table = iptc.Table(iptc.Table.FILTER)
-    ports = [8081, 8443, 9999, 12345, 23456, 65530]
-    protocols = ["tcp", "udp", 'icmp']
 
     def create_per_pod_subchain(subchain_name):
         table.autocommit = False
@@ -165,78 +210,16 @@ def init_ingress_egress_rules(pod_ips):
         table.autocommit = True
         return sub_chain_obj
 
+    # Pods whose chains got at least one DROP/REJECT, i.e. whose policy got tighter
+    tightened_ips = set()
+
     def fill_subchain_rules(sub_chain_obj, current_pod_ip, all_pods, is_ingress):
 
         table.autocommit = False
-        for other_ip in all_pods:
-            if other_ip == current_pod_ip:
-                continue
-
-            r = random.random()
-            if 0.1 <= r < 0.2:
-                rule_reject = iptc.Rule()
-                setattr(rule_reject, 'src' if is_ingress else 'dst', other_ip)
-                setattr(rule_reject, 'dst' if is_ingress else 'src', current_pod_ip)
-
-                proto_choice = random.choice(protocols)
-                if proto_choice:
-                    rule_reject.protocol = proto_choice
-
-                if proto_choice in ["tcp", "udp"]:
-                    match = rule_reject.create_match(proto_choice)
-                    match.dport = str(random.choice(ports))
-
-                # Set the rule's target to REJECT
-                rule_reject.target = iptc.Target(rule_reject, "REJECT")
-                # Append the constructed rule to the sub-chain
-                sub_chain_obj.append_rule(rule_reject)
-
-            if 0.3 <= r < 0.4:
-                rule_drop = iptc.Rule()
-                # Set source and destination addresses according to the traffic direction
-                setattr(rule_drop, 'src' if is_ingress else 'dst', other_ip)
-                setattr(rule_drop, 'dst' if is_ingress else 'src', current_pod_ip)
-
-                # Randomly choose a protocol for this rule
-                proto_choice = random.choice(protocols)
-                if proto_choice:
-                    rule_drop.protocol = proto_choice
-
-                # Set the rule's target to DROP
-                rule_drop.target = iptc.Target(rule_drop, "DROP")
-                # Append the constructed rule to the sub-chain
-                sub_chain_obj.append_rule(rule_drop)
-
-            new_rule = iptc.Rule()
-            setattr(new_rule, 'src' if is_ingress else 'dst', other_ip)
-            # setattr(new_rule, 'dst' if is_ingress else 'src', current_pod_ip)
-            proto_choice = random.choice(protocols)
-            if proto_choice:
-                new_rule.protocol = proto_choice
-
-            r = random.random()
-            target_choice = "ACCEPT" if r < 0.9 else "DROP" if r < 0.95 else "REJECT"
-
-            if proto_choice in ["tcp", "udp"] and target_choice in ["DROP", "REJECT"]:
-                match = new_rule.create_match(proto_choice)
-                match.dport = str(random.choice(ports))
-
-            new_rule.target = iptc.Target(new_rule, target_choice)
-            sub_chain_obj.append_rule(new_rule)
-
-            if r > 0.85:
-                rule = iptc.Rule()
-                string_match = rule.create_match("string")
-                setattr(rule, 'dst' if is_ingress else 'src', current_pod_ip)
-                string_match.string = "0x4000"
-                string_match.algo = "bm"
-                # Set target to RETURN, so that processing continues in the parent chain
-                rule.target = iptc.Target(rule, "RETURN")
-                sub_chain_obj.append_rule(rule)
-
-        default_rule = iptc.Rule()
-        default_rule.target = iptc.Target(default_rule, "ACCEPT")
-        sub_chain_obj.append_rule(default_rule)
+        for spec in plan_subchain_rules(current_pod_ip, all_pods, is_ingress):
+            sub_chain_obj.append_rule(build_rule(spec))
+            if spec['target'] in ["DROP", "REJECT"]:
+                tightened_ips.add(current_pod_ip)
         table.commit()
         table.refresh()
         table.autocommit = True
@@ -278,40 +261,37 @@ def init_ingress_egress_rules(pod_ips):
 
     init_chain("INGRESS", "dst", is_ingress=True)
     init_chain("EGRESS", "src", is_ingress=False)
+    return sorted(tightened_ips)
 
 
-def simulation():
-    real_ips = list(set(get_pod_ips_at('default')))
+def simulation(stateful=False, namespace='default'):
+    real_ips = list(set(get_pod_ips_at(namespace)))
 
     create_network_policy_chain()
     print("chain created....")
     delete_all_custom_rules()
-    redirect_pod_traffic(POD_CIDR)
+    redirect_pod_traffic(POD_CIDR, stateful=stateful)
     print("inserting policy ....")
-    init_ingress_egress_rules(real_ips)
+    tightened_ips = init_ingress_egress_rules(real_ips)
+    if stateful:
+        # Established flows skip the new chains, so drop the ones that are now denied
+        flush_conntrack_entries(tightened_ips)
+
 
+def rule_dport(rule):
+    """Destination port of a tcp/udp match of the rule, None without one."""
+    for match in rule.matches:
+        if match.parameters.get("dport"):
+            return match.parameters["dport"]
+    return None
 
-def optimization():
+
+def optimization(rule_budget=None):
     # Get the FILTER table and refresh to obtain current chains
     table = iptc.Table(iptc.Table.FILTER)
     table.refresh()
 
-    networks = list(get_node_pod_subnets().values())
-
-    all_subnets = []
-
-    for net_str in networks:
-
-        net = ipaddress.ip_network(net_str)
-
-        subnets = list(net.subnets(new_prefix=30))
-
-        for s in subnets:
-            all_subnets.append(str(s))
-
-    all_subnets.sort()
-
-
+    networks = [ipaddress.ip_network(net_str) for net_str in get_node_pod_subnets().values()]
 
     custom_chain_names = [ch.name for ch in table.chains if ch.name.startswith("podAct_")]
 
@@ -345,41 +325,40 @@ def optimization():
             # Process each saved rule
     table.commit()
     table.refresh()
+
+    # Split every chain into DROP/REJECT rules and ACCEPT rules keyed by the peer address
+    chain_plans = {}
+    for chain_name, rules_saved in chain_rules.items():
+        direction = chain_direction[chain_name]
+        reject_drop_rules = []
+        accept_rules = []
+        for rule in rules_saved:
+            action_lower = rule.target.name.lower()
+            if action_lower in ['reject', 'drop']:
+                reject_drop_rules.append(rule)
+            elif action_lower == 'accept':
+                accept_rules.append(rule)
+        accepts = [(rule.dst if direction == 'src' else rule.src, rule.protocol, rule_dport(rule))
+                   for rule in accept_rules]
+        chain_plans[chain_name] = (reject_drop_rules, accept_rules, accepts)
+
+    prefix, rule_count = choose_aggregation_prefix(
+        [(len(deny), accepts) for deny, _, accepts in chain_plans.values()], networks, rule_budget)
+    print(f"aggregating ACCEPT rules into /{prefix} blocks, {rule_count} rules on this node")
+
     table = iptc.Table(iptc.Table.FILTER)
     table.autocommit = False
     table.refresh()
     for chain in table.chains:
-        if chain.name in chain_rules:
+        if chain.name in chain_plans:
             print(f'processing {chain.name}')
-            reject_drop_rules = []
-            accept_rules_grouped = {}
-            rules_saved = chain_rules[chain.name]
+            reject_drop_rules, accept_rules, accepts = chain_plans[chain.name]
             direction = chain_direction[chain.name]
-            for rule in rules_saved:
-                action_lower = rule.target.name.lower()
-                if action_lower in ['reject', 'drop']:
-                    reject_drop_rules.append(rule)
-                elif action_lower == 'accept':
-                    try:
-                        target_ip = rule.dst if direction == 'src' else rule.src
-                        rule_ip = ipaddress.ip_interface(target_ip)
-                    except ValueError:
-                        continue
-                    matched_subnet = None
-                    for subnet in all_subnets:
-                        network = ipaddress.ip_network(subnet)
-                        if rule_ip in network:
-                            matched_subnet = subnet
-                            break
-
-                    if matched_subnet:
-                        if matched_subnet not in accept_rules_grouped:
-                            accept_rules_grouped[matched_subnet] = []
-                        accept_rules_grouped[matched_subnet].append(rule)
 
             merged_accept_rules = []
-            for subnet, rules in accept_rules_grouped.items():
-                merged_rule = rules[0]
+            for (subnet, _, _), indices in aggregate_accept_ips(accepts, networks, prefix).items():
+                # All rules of a group share protocol and dport, only the address is widened
+                merged_rule = accept_rules[indices[0]]
                 if direction == 'src':
                     merged_rule.dst = subnet
                 else:
@@ -397,22 +376,39 @@ def optimization():
 
 def main():
     parser = argparse.ArgumentParser(description="Execute different functions based on input argument.")
-    parser.add_argument("mode", choices=["optimized", "initialized", "clear"],
-                        help="Choose between 'optimized' and 'initialized' modes.")
+    parser.add_argument("mode", nargs="?", default="initialized",
+                        choices=["optimized", "initialized", "clear", "flush-conntrack"],
+                        help="Choose between 'optimized' and 'initialized' modes. Without a mode the "
+                             "policy is initialized, as running the script without arguments always did.")
+    parser.add_argument("--namespace", default="default",
+                        help="Namespace of the pods whose policy is initialized, or whose conntrack entries "
+                             "are flushed in 'flush-conntrack' mode.")
+    parser.add_argument("--stateful", action="store_true",
+                        help="In 'initialized' mode, accept ESTABLISHED,RELATED traffic at the head of "
+                             "NETWORK-POLICY so that only new connections are checked against the per-pod chains.")
+    parser.add_argument("--rule-budget", type=int, default=None,
+                        help="In 'optimized' mode, widen the ACCEPT aggregation until the podAct_* rules "
+                             "on this node fit into this many rules.")
 
     args = parser.parse_args()
+    if args.stateful and args.mode != "initialized":
+        parser.error("--stateful only applies to 'initialized' mode")
+    if args.rule_budget is not None and args.mode != "optimized":
+        parser.error("--rule-budget only applies to 'optimized' mode")
 
     if args.mode == "optimized":
-        optimization()
+        optimization(rule_budget=args.rule_budget)
     elif args.mode == "initialized":
-        simulation()
+        simulation(stateful=args.stateful, namespace=args.namespace)
     elif args.mode == "clear":
         delete_all_custom_rules()
+    elif args.mode == "flush-conntrack":
+        flush_conntrack_entries(list(set(get_pod_ips_at(args.namespace))))
 
 
 
 if __name__ == "__main__":
-    # main()
+    main()
     # delete_all_custom_chains()
-    simulation()
+    # simulation()
     # optimization()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Node-level counter agent for net_stat_monitor.py.
+
+Instead of the monitor exec'ing `cat /proc/net/dev` into every pod every second, one
+agent per node reads the host side of every pod veth from
+/sys/class/net/*/statistics in a single pass and pushes the batch to the monitor
+(`net_stat_monitor.py --source agent`).
+
+veth -> pod mapping: the container runtime (crictl) gives the pid of every pod
+sandbox on the node; the pod's eth0 `iflink`, read through
+/proc/<pid>/root/sys/class/net/eth0/iflink, is the ifindex of its host-side veth.
+The mapping is cached and only rebuilt when an unmapped veth shows up.
+
+Host-side counters are mirrored: what the host veth receives is what the pod sent.
+
+Each batch also carries the bytes moved per (src IP, dst IP) pod pair since the
+previous batch, taken from the node's conntrack table (see conntrack_flows.py),
+so the monitor knows which pod sends to which instead of guessing.
+
+Usage:
+    ./node_exec.sh node_counter_agent.py --monitor-url http://<monitor>:8899/node_samples
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import time
+
+import requests
+
+from conntrack_flows import FlowTracker, enable_accounting, read_conntrack
+
+MONITOR_URL = "http://127.0.0.1:8899/node_samples"
+VETH_PREFIXES = ("veth", "cali", "lxc")
+RESYNC_INTERVAL = 10  # minimum seconds between two crictl lookups
+POD_CIDR = "10.244.0.0/16"
+
+
+def read_interface_counters(sysfs_root="/sys"):
+    """
+    Read ifindex and byte counters of every interface in one pass.
+
+    Returns {ifindex: (ifname, rx_bytes, tx_bytes)} as seen from the host.
+    """
+    counters = {}
+    net_dir = os.path.join(sysfs_root, "class", "net")
+    for ifname in os.listdir(net_dir):
+        if ifname == "lo":
+            continue
+        iface_dir = os.path.join(net_dir, ifname)
+        try:
+            with open(os.path.join(iface_dir, "ifindex")) as f:
+                ifindex = int(f.read())
+            with open(os.path.join(iface_dir, "statistics", "rx_bytes")) as f:
+                rx_bytes = int(f.read())
+            with open(os.path.join(iface_dir, "statistics", "tx_bytes")) as f:
+                tx_bytes = int(f.read())
+        except (OSError, ValueError):
+            # Interface went away between listdir and read
+            continue
+        counters[ifindex] = (ifname, rx_bytes, tx_bytes)
+    return counters
+
+
+def list_pod_sandboxes(crictl="crictl"):
+    """Return [(namespace, pod_name, pid)] for the ready pod sandboxes on this node."""
+    pods = json.loads(subprocess.check_output([crictl, "pods", "--state", "ready", "-o", "json"]))
+    sandboxes = []
+    for item in pods.get("items", []):
+        try:
+            info = json.loads(subprocess.check_output([crictl, "inspectp", "-o", "json", item["id"]]))
+            sandboxes.append((item["metadata"]["namespace"], item["metadata"]["name"], info["info"]["pid"]))
+        except (subprocess.CalledProcessError, OSError, KeyError, ValueError) as e:
+            # Sandbox went away since the listing, the others are still good
+            print(f"Failed to inspect pod sandbox {item.get('id')}: {e}")
+    return sandboxes
+
+
+def build_veth_map(sandboxes, proc_root="/proc"):
+    """Map host veth ifindex -> (namespace, pod_name) through each pod's eth0 iflink."""
+    veth_map = {}
+    for namespace, pod_name, pid in sandboxes:
+        iflink_path = os.path.join(proc_root, str(pid), "root", "sys", "class", "net", "eth0", "iflink")
+        try:
+            with open(iflink_path) as f:
+                veth_map[int(f.read())] = (namespace, pod_name)
+        except (OSError, ValueError):
+            # hostNetwork pods have no veth
+            continue
+    return veth_map
+
+
+def refresh_veth_map(veth_map, crictl="crictl", proc_root="/proc"):
+    """Rebuild the veth map from crictl, keep the previous one when crictl itself fails."""
+    try:
+        return build_veth_map(list_pod_sandboxes(crictl), proc_root)
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"Failed to list pod sandboxes, keeping {len(veth_map)} known veths: {e}")
+        return veth_map
+
+
+def collect_samples(veth_map, sysfs_root="/sys"):
+    """
+    Read all counters once and attribute them to pods.
+
+    Returns (samples, unmapped) where samples use the pod's point of view and
+    unmapped is the number of veths without a known pod.
+    """
+    now = time.time()
+    samples = []
+    unmapped = 0
+    for ifindex, (ifname, host_rx, host_tx) in read_interface_counters(sysfs_root).items():
+        pod = veth_map.get(ifindex)
+        if pod is None:
+            if ifname.startswith(VETH_PREFIXES):
+                unmapped += 1
+            continue
+        samples.append({
+            "namespace": pod[0],
+            "pod": pod[1],
+            "rx": host_tx,
+            "tx": host_rx,
+            "ts": now,
+        })
+    return samples, unmapped
+
+
+def collect_flows(tracker, proc_root="/proc", conntrack="conntrack"):
+    """Bytes per pod pair since the last call as [{"src", "dst", "bytes", "interval"}]."""
+    try:
+        flows = read_conntrack(proc_root, conntrack)
+    except OSError as e:
+        print(f"Failed to read conntrack table: {e}")
+        return []
+    pair_bytes, interval = tracker.update(flows, time.monotonic())
+    if tracker.unaccounted:
+        print(f"{tracker.unaccounted} flows without byte counters, is nf_conntrack_acct enabled?")
+    if not interval:
+        return []
+    return [{"src": src, "dst": dst, "bytes": n, "interval": interval} for (src, dst), n in pair_bytes.items()]
+
+
+def push_samples(session, url, node_name, samples, flows=None):
+    payload = {"node": node_name, "samples": samples}
+    if flows is not None:
+        payload["flows"] = flows
+    try:
+        response = session.post(url, json=payload, timeout=2)
+        if response.status_code != 200:
+            print(f"Failed to push samples. Status code: {response.status_code}")
+    except Exception as e:
+        print(f"Failed to push samples: {e}")
+
+
+def run_agent(monitor_url, interval, node_name, sysfs_root="/sys", proc_root="/proc", crictl="crictl",
+              conntrack="conntrack", flow_cidr=POD_CIDR):
+    session = requests.Session()
+    tracker = None
+    if flow_cidr:
+        enable_accounting(proc_root)
+        tracker = FlowTracker(flow_cidr)
+    veth_map = refresh_veth_map({}, crictl, proc_root)
+    last_resync = time.monotonic()
+    print(f"Mapped {len(veth_map)} pod veths on {node_name}")
+    next_tick = time.monotonic()
+    while True:
+        samples, unmapped = collect_samples(veth_map, sysfs_root)
+        if unmapped and time.monotonic() - last_resync >= RESYNC_INTERVAL:
+            # New pods since the last mapping, resolve them for the next round
+            veth_map = refresh_veth_map(veth_map, crictl, proc_root)
+            last_resync = time.monotonic()
+        flows = collect_flows(tracker, proc_root, conntrack) if tracker is not None else None
+        push_samples(session, monitor_url, node_name, samples, flows)
+        next_tick += interval
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push host-side pod veth counters to net_stat_monitor")
+    parser.add_argument("--monitor-url", default=MONITOR_URL)
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between two pushes")
+    parser.add_argument("--node-name", default=os.environ.get("NODE_NAME", socket.gethostname()))
+    parser.add_argument("--sysfs-root", default="/sys")
+    parser.add_argument("--proc-root", default="/proc")
+    parser.add_argument("--crictl", default="crictl")
+    parser.add_argument("--conntrack", default="conntrack",
+                        help="conntrack tool, empty to read <proc-root>/net/nf_conntrack instead")
+    parser.add_argument("--flow-cidr", default=POD_CIDR,
+                        help="only report flows between addresses of this CIDR, empty to disable flow reports")
+    args = parser.parse_args()
+
+    run_agent(args.monitor_url, args.interval, args.node_name, args.sysfs_root, args.proc_root, args.crictl,
+              args.conntrack, args.flow_cidr)
+
+
+if __name__ == "__main__":
+    main()
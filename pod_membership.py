@@ -0,0 +1,205 @@
+"""
+Watch-driven pod membership for net_stat_monitor.py.
+
+One LIST at startup, then a single long-lived WATCH on the label selector keeps
+the set of running pods current; the monitor no longer lists pods every second.
+Changes are queued as (kind, pod_name, namespace, receivers) events with kind
+"added", "topology" or "deleted" and drained by the monitor loop, so per-pod
+setup and teardown run on the loop thread exactly once per pod.
+
+The pipeline topology comes from the same watch: every sender pod carries the
+annotation
+
+    cn-optimize/topology: '{"receivers": ["train-2", "test-3"]}'
+
+so the whole DAG is known without exec'ing into any pod, and an edited
+annotation shows up as a "topology" event right away.
+
+namespace=None watches all namespaces; PodMembershipSet combines one watch per
+namespace for an arbitrary set. Pods are keyed by name, so names must be unique
+across the watched namespaces.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+TOPOLOGY_ANNOTATION = "cn-optimize/topology"
+
+
+def parse_topology(annotations):
+    """Receivers listed in the topology annotation, or None if the pod has none."""
+    raw = (annotations or {}).get(TOPOLOGY_ANNOTATION)
+    if raw is None:
+        return None
+    try:
+        return [str(receiver) for receiver in json.loads(raw)["receivers"]]
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Invalid {TOPOLOGY_ANNOTATION} annotation {raw!r}: {e}")
+        return None
+
+
+class PodMembership:
+    def __init__(self, api_instance, namespace="default", label_selector="app=ml-app"):
+        self.api_instance = api_instance
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.running = {}
+        self.pod_ips = {}
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.resource_version = None
+        self.api_calls = 0
+
+    def start(self):
+        self._relist()
+        threading.Thread(target=self._watch_loop, daemon=True).start()
+
+    def _list_call(self):
+        """The LIST call and its arguments for the namespace (or all namespaces)."""
+        if self.namespace is None:
+            return self.api_instance.list_pod_for_all_namespaces, {"label_selector": self.label_selector}
+        return self.api_instance.list_namespaced_pod, {"namespace": self.namespace,
+                                                        "label_selector": self.label_selector}
+
+    def pods(self):
+        """Current running pods as [(pod_name, namespace)]."""
+        with self.lock:
+            return [(pod_name, namespace) for pod_name, (namespace, _) in self.running.items()]
+
+    def pods_by_ip(self):
+        """{pod IP: pod_name} of the running pods."""
+        with self.lock:
+            return {ip: pod_name for pod_name, ip in self.pod_ips.items()}
+
+    def snapshot_events(self):
+        """"added" events for all running pods, to bring a fresh consumer up to date."""
+        with self.lock:
+            return [("added", pod_name, namespace, receivers)
+                    for pod_name, (namespace, receivers) in self.running.items()]
+
+    def drain_events(self):
+        """Return the membership changes since the last call, in order."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _apply(self, pod, deleted=False):
+        pod_name = pod.metadata.name
+        namespace = pod.metadata.namespace
+        is_running = (not deleted and pod.metadata.deletion_timestamp is None
+                      and pod.status is not None and pod.status.phase == "Running")
+        receivers = parse_topology(pod.metadata.annotations)
+        with self.lock:
+            if is_running and pod.status.pod_ip:
+                self.pod_ips[pod_name] = pod.status.pod_ip
+            else:
+                self.pod_ips.pop(pod_name, None)
+            was_running = pod_name in self.running
+            if is_running and not was_running:
+                self.running[pod_name] = (namespace, receivers)
+                self.events.put(("added", pod_name, namespace, receivers))
+            elif is_running and self.running[pod_name][1] != receivers:
+                self.running[pod_name] = (namespace, receivers)
+                self.events.put(("topology", pod_name, namespace, receivers))
+            elif not is_running and was_running:
+                del self.running[pod_name]
+                self.events.put(("deleted", pod_name, namespace, None))
+
+    def _relist(self):
+        list_pods, kwargs = self._list_call()
+        pod_list = list_pods(watch=False, **kwargs)
+        self.api_calls += 1
+        listed = {pod.metadata.name for pod in pod_list.items}
+        with self.lock:
+            gone = [(name, ns) for name, (ns, _) in self.running.items() if name not in listed]
+            for pod_name, namespace in gone:
+                del self.running[pod_name]
+                self.pod_ips.pop(pod_name, None)
+                self.events.put(("deleted", pod_name, namespace, None))
+        for pod in pod_list.items:
+            self._apply(pod)
+        self.resource_version = pod_list.metadata.resource_version
+
+    def _watch_loop(self):
+        need_relist = False
+        while True:
+            if need_relist:
+                try:
+                    self._relist()
+                    need_relist = False
+                except Exception as e:
+                    print(f"Pod list failed: {e}")
+                    time.sleep(1)
+                    continue
+            w = watch.Watch()
+            try:
+                self.api_calls += 1
+                list_pods, kwargs = self._list_call()
+                for event in w.stream(list_pods,
+                                      resource_version=self.resource_version,
+                                      timeout_seconds=300,
+                                      **kwargs):
+                    pod = event['object']
+                    self.resource_version = pod.metadata.resource_version
+                    self._apply(pod, deleted=(event['type'] == "DELETED"))
+            except ApiException as e:
+                if e.status == 410:
+                    # resourceVersion too old, start over from a fresh LIST
+                    need_relist = True
+                else:
+                    print(f"Pod watch failed: {e}")
+                    time.sleep(1)
+            except Exception as e:
+                print(f"Pod watch failed: {e}")
+                time.sleep(1)
+            finally:
+                w.stop()
+
+
+class PodMembershipSet:
+    """Several namespaces (or all of them) behind the PodMembership interface."""
+
+    def __init__(self, api_instance, namespaces=None, label_selector="app=ml-app"):
+        # namespaces=None watches all namespaces with a single watch
+        self.members = [PodMembership(api_instance, namespace, label_selector) for namespace in (namespaces or [None])]
+
+    @property
+    def api_calls(self):
+        return sum(member.api_calls for member in self.members)
+
+    def start(self):
+        for member in self.members:
+            member.start()
+
+    def pods(self):
+        pods = []
+        seen = {}
+        for member in self.members:
+            for pod_name, namespace in member.pods():
+                if pod_name in seen:
+                    print(f"Pod {pod_name} exists in namespaces {seen[pod_name]} and {namespace}, "
+                          f"only the first is monitored")
+                    continue
+                seen[pod_name] = namespace
+                pods.append((pod_name, namespace))
+        return pods
+
+    def pods_by_ip(self):
+        pods_by_ip = {}
+        for member in self.members:
+            pods_by_ip.update(member.pods_by_ip())
+        return pods_by_ip
+
+    def snapshot_events(self):
+        return [event for member in self.members for event in member.snapshot_events()]
+
+    def drain_events(self):
+        return [event for member in self.members for event in member.drain_events()]
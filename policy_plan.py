@@ -0,0 +1,107 @@
+"""
+Rule planning of the podAct_* policy scheme, without iptables or cluster access.
+
+network_policy.py installs what these helpers plan; capacity_planner.py and
+netns_bench.py use them offline, so they must not import iptc or kubernetes.
+"""
+
+import ipaddress
+import random
+
+POD_CIDR = "10.244.0.0/16"
+
+POLICY_PORTS = [8081, 8443, 9999, 12345, 23456, 65530]
+POLICY_PROTOCOLS = ["tcp", "udp", 'icmp']
+
+
+def plan_subchain_rules(current_pod_ip, all_pods, is_ingress):
+    """
+    Draw the random policy of one podAct_* chain without touching iptables.
+
+    Returns a list of rule specs (dicts with src/dst/protocol/dport/string/target keys)
+    in chain order, ending with the default ACCEPT. init_ingress_egress_rules installs
+    them, the capacity planner only counts them.
+    """
+    peer_field = 'src' if is_ingress else 'dst'
+    own_field = 'dst' if is_ingress else 'src'
+    specs = []
+    for other_ip in all_pods:
+        if other_ip == current_pod_ip:
+            continue
+
+        r = random.random()
+        if 0.1 <= r < 0.2:
+            proto_choice = random.choice(POLICY_PROTOCOLS)
+            spec = {peer_field: other_ip, own_field: current_pod_ip, 'protocol': proto_choice, 'target': "REJECT"}
+            if proto_choice in ["tcp", "udp"]:
+                spec['dport'] = str(random.choice(POLICY_PORTS))
+            specs.append(spec)
+
+        if 0.3 <= r < 0.4:
+            specs.append({peer_field: other_ip, own_field: current_pod_ip,
+                          'protocol': random.choice(POLICY_PROTOCOLS), 'target': "DROP"})
+
+        proto_choice = random.choice(POLICY_PROTOCOLS)
+        r = random.random()
+        target_choice = "ACCEPT" if r < 0.9 else "DROP" if r < 0.95 else "REJECT"
+        spec = {peer_field: other_ip, 'protocol': proto_choice, 'target': target_choice}
+        if proto_choice in ["tcp", "udp"] and target_choice in ["DROP", "REJECT"]:
+            spec['dport'] = str(random.choice(POLICY_PORTS))
+        specs.append(spec)
+
+        if r > 0.85:
+            # RETURN so that processing continues in the parent chain
+            specs.append({own_field: current_pod_ip, 'string': "0x4000", 'target': "RETURN"})
+
+    specs.append({'target': "ACCEPT"})
+    return specs
+
+
+def aggregate_accept_ips(accepts, networks, prefix):
+    """
+    Group ACCEPT rules into /prefix blocks of the node pod subnets.
+
+    `accepts` is a list of (peer address, protocol, dport) per ACCEPT rule. Only
+    rules with the same protocol and dport are merged, so a merged rule matches
+    exactly what its rules matched, just for more addresses. A block is never wider
+    than the node subnet it lies in, so a merged rule only ever covers pods of one
+    node. Addresses outside every node subnet are left out, like before.
+    Returns {(subnet, protocol, dport): [indices into accepts]} in first-seen order.
+    """
+    grouped = {}
+    for i, (ip, protocol, dport) in enumerate(accepts):
+        try:
+            rule_ip = ipaddress.ip_interface(ip).ip
+        except ValueError:
+            continue
+        for net in networks:
+            if rule_ip in net:
+                block = ipaddress.ip_network(f"{rule_ip}/{max(prefix, net.prefixlen)}", strict=False)
+                grouped.setdefault((str(block), protocol, dport), []).append(i)
+                break
+    return grouped
+
+
+def choose_aggregation_prefix(chains, networks, rule_budget=None, start_prefix=30):
+    """
+    Pick the longest prefix whose aggregated rule count fits into rule_budget.
+
+    `chains` is a list of (deny_rule_count, accepts) per podAct_* chain, accepts as
+    for aggregate_accept_ips. The count includes one jump rule per chain.
+
+    Widening is not equivalent to the drawn policy: a block also accepts the
+    addresses in it that had no ACCEPT rule of their own, e.g. pods started after
+    the policy was drawn. What stays true is that DROP/REJECT rules are installed
+    in front of the merged ACCEPTs, so every explicit deny still wins, and that a
+    block never reaches past its node subnet. Returns (prefix, rule_count); if the
+    budget cannot be met the widest prefix is returned.
+    """
+    min_prefix = min(net.prefixlen for net in networks)
+    total = None
+    for prefix in range(start_prefix, min_prefix - 1, -1):
+        total = len(chains) + sum(deny + len(aggregate_accept_ips(accepts, networks, prefix))
+                                  for deny, accepts in chains)
+        if rule_budget is None or total <= rule_budget:
+            return prefix, total
+    print(f"Rule budget {rule_budget} cannot be met, {total} rules left at /{min_prefix}")
+    return min_prefix, total
@@ -0,0 +1,140 @@
+"""
+Prometheus scrape endpoint of net_stat_monitor.py (--metrics-port, GET /metrics).
+
+The monitor loop builds a MetricsSnapshot of plain tuples once per tick and
+swaps it in with a single reference assignment; scrapes only read the current
+snapshot, so there is no lock between the sampling loop and the scraper and a
+scrape costs O(series). The text of a snapshot is rendered once and reused by
+every scrape until the next tick.
+
+The quantiles of cn_sample_latency_seconds are those of the last poll, its _sum
+and _count are running totals of every latency the exporter observed, so they
+only ever grow as Prometheus expects of a summary.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value):
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class MetricsSnapshot:
+    def __init__(self, pod_rates=(), edges=(), latencies=(), loop=None, counters=None):
+        # ((pod, namespace, rx_mbps, tx_mbps), ...)
+        self.pod_rates = tuple(pod_rates)
+        # ((sender, receiver, mbps, duration_s), ...) of the transfers in progress
+        self.edges = tuple(edges)
+        # Read latencies of the last poll in seconds, sorted
+        self.latencies = tuple(sorted(latencies))
+        # Totals of all latencies observed so far, set by MetricsExporter.update
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        # {name: seconds} gauges of the last iteration (jitter, duration, ...)
+        self.loop = dict(loop or {})
+        # {name: value} monotonically increasing totals
+        self.counters = dict(counters or {})
+        self.text = None
+
+    def render(self):
+        if self.text is not None:
+            return self.text
+        lines = [
+            "# HELP cn_pod_rx_mbps RX rate of the pod over the last sample interval.",
+            "# TYPE cn_pod_rx_mbps gauge",
+        ]
+        lines += [f'cn_pod_rx_mbps{{pod="{escape_label(pod)}",namespace="{escape_label(ns)}"}} {format_value(rx)}'
+                  for pod, ns, rx, _ in self.pod_rates]
+        lines += [
+            "# HELP cn_pod_tx_mbps TX rate of the pod over the last sample interval.",
+            "# TYPE cn_pod_tx_mbps gauge",
+        ]
+        lines += [f'cn_pod_tx_mbps{{pod="{escape_label(pod)}",namespace="{escape_label(ns)}"}} {format_value(tx)}'
+                  for pod, ns, _, tx in self.pod_rates]
+        lines += [
+            "# HELP cn_edge_bandwidth_mbps Bandwidth of the transfers in progress, per pipeline edge.",
+            "# TYPE cn_edge_bandwidth_mbps gauge",
+        ]
+        lines += [f'cn_edge_bandwidth_mbps{{src="{escape_label(src)}",dst="{escape_label(dst)}"}} {format_value(mbps)}'
+                  for src, dst, mbps, _ in self.edges]
+        lines += [
+            "# HELP cn_edge_transfer_seconds Time since the transfer on the edge started.",
+            "# TYPE cn_edge_transfer_seconds gauge",
+        ]
+        lines += [f'cn_edge_transfer_seconds{{src="{escape_label(src)}",dst="{escape_label(dst)}"}} '
+                  f'{format_value(duration)}' for src, dst, _, duration in self.edges]
+        lines += [
+            "# HELP cn_sample_latency_seconds Time from the start of a poll until a pod's counters arrived.",
+            "# TYPE cn_sample_latency_seconds summary",
+        ]
+        n = len(self.latencies)
+        for q in LATENCY_QUANTILES:
+            value = self.latencies[min(n - 1, int(q * n))] if n else float("nan")
+            lines.append(f'cn_sample_latency_seconds{{quantile="{q}"}} {format_value(value)}')
+        lines.append(f"cn_sample_latency_seconds_sum {format_value(self.latency_sum)}")
+        lines.append(f"cn_sample_latency_seconds_count {self.latency_count}")
+        for name, value in sorted(self.loop.items()):
+            lines += [f"# TYPE cn_{name} gauge", f"cn_{name} {format_value(value)}"]
+        for name, value in sorted(self.counters.items()):
+            lines += [f"# TYPE cn_{name}_total counter", f"cn_{name}_total {format_value(value)}"]
+        self.text = ("\n".join(lines) + "\n").encode()
+        return self.text
+
+
+class MetricsExporter:
+    def __init__(self):
+        self.snapshot = MetricsSnapshot()
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    def observe_latencies(self, latencies):
+        """Add read latencies to the summary totals, each latency must be observed once."""
+        self.latency_sum += sum(latencies)
+        self.latency_count += len(latencies)
+
+    def update(self, snapshot):
+        snapshot.latency_sum = self.latency_sum
+        snapshot.latency_count = self.latency_count
+        # A single reference swap, scrapes see either the old or the new snapshot
+        self.snapshot = snapshot
+
+    def render(self):
+        return self.snapshot.render()
+
+
+def start_metrics_server(exporter, port):
+    """Serve GET /metrics in a background thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = exporter.render()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving Prometheus metrics on port {port}")
+    return server
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Append-only columnar store of the monitor's per-pod counter samples.
+
+A run is a directory with one file per column, each a flat array of fixed-width
+little-endian records, plus the pod names:
+
+    ts.f8       monitor time.monotonic() of the iteration that read the sample
+    src_ts.f8   timestamp of the counters themselves (exec midpoint, agent read time or exec line)
+    pod.u4      pod id, line number in pods.txt
+    rx.u8       rx byte counter
+    tx.u8       tx byte counter
+    pods.txt    one pod name per line, append-only
+    meta.json   wall clock and monotonic clock at the start of the run
+
+`ts` never decreases, so a time range is two binary searches and the reader
+returns NumPy views of the memory-mapped columns without copying. A run that
+was killed mid-write is read up to the last complete record.
+
+Usage:
+    python3 net_stat_monitor.py --record runs/optimized
+    python3 sample_store.py summary runs/optimized
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+COLUMNS = {
+    'ts': np.dtype('<f8'),
+    'src_ts': np.dtype('<f8'),
+    'pod': np.dtype('<u4'),
+    'rx': np.dtype('<u8'),
+    'tx': np.dtype('<u8'),
+}
+# ts is written last, so it is never longer than the other columns
+WRITE_ORDER = ('pod', 'src_ts', 'rx', 'tx', 'ts')
+
+
+def column_path(run_dir, name):
+    return os.path.join(run_dir, f'{name}.{COLUMNS[name].str[1:]}')
+
+
+class SampleWriter:
+    def __init__(self, run_dir, flush_interval=1.0):
+        os.makedirs(run_dir, exist_ok=True)
+        self.run_dir = run_dir
+        self.flush_interval = flush_interval
+        self.pod_ids = {}
+        pods_path = os.path.join(run_dir, 'pods.txt')
+        if os.path.exists(pods_path):
+            # Appending to an existing run keeps its pod ids
+            with open(pods_path) as f:
+                self.pod_ids = {name: i for i, name in enumerate(f.read().splitlines())}
+        self.pods_file = open(pods_path, 'a')
+        self.last_ts = self._resume()
+        self.files = {name: open(column_path(run_dir, name), 'ab') for name in COLUMNS}
+        self.last_flush = time.monotonic()
+        self.count = 0
+        meta_path = os.path.join(run_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            with open(meta_path, 'w') as f:
+                json.dump({'wall_start': time.time(), 'monotonic_start': time.monotonic()}, f)
+
+    def _resume(self):
+        """
+        Prepare the columns of an existing run for appending, returns the last ts written.
+
+        Records a killed writer left incomplete are cut off, so all columns have the
+        same length again and the new records line up.
+        """
+        paths = {name: column_path(self.run_dir, name) for name in COLUMNS}
+        sizes = {name: os.path.getsize(path) if os.path.exists(path) else 0 for name, path in paths.items()}
+        n = min(sizes[name] // dtype.itemsize for name, dtype in COLUMNS.items())
+        for name, dtype in COLUMNS.items():
+            if sizes[name] > n * dtype.itemsize:
+                os.truncate(paths[name], n * dtype.itemsize)
+        if n == 0:
+            return -np.inf
+        dtype = COLUMNS['ts']
+        return float(np.fromfile(paths['ts'], dtype=dtype, count=1, offset=(n - 1) * dtype.itemsize)[0])
+
+    def pod_id(self, pod_name):
+        pod_id = self.pod_ids.get(pod_name)
+        if pod_id is None:
+            pod_id = len(self.pod_ids)
+            self.pod_ids[pod_name] = pod_id
+            self.pods_file.write(pod_name + '\n')
+            self.pods_file.flush()
+        return pod_id
+
+    def append(self, ts, pod_names, src_ts, rx, tx):
+        """Append the samples of one monitor iteration, all taken at monitor time `ts`."""
+        if not len(pod_names):
+            return
+        if ts < self.last_ts:
+            raise ValueError(f"timestamps must not decrease ({ts} < {self.last_ts})")
+        self.last_ts = ts
+        columns = {
+            'ts': np.full(len(pod_names), ts, dtype=COLUMNS['ts']),
+            'pod': np.fromiter((self.pod_id(name) for name in pod_names), dtype=COLUMNS['pod'], count=len(pod_names)),
+            'src_ts': np.asarray(src_ts, dtype=COLUMNS['src_ts']),
+            'rx': np.asarray(rx, dtype=COLUMNS['rx']),
+            'tx': np.asarray(tx, dtype=COLUMNS['tx']),
+        }
+        for name in WRITE_ORDER:
+            self.files[name].write(columns[name].tobytes())
+        self.count += len(pod_names)
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        for name in WRITE_ORDER:
+            self.files[name].flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.pods_file.close()
+
+
+class SampleReader:
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        with open(os.path.join(run_dir, 'pods.txt')) as f:
+            self.pod_names = f.read().splitlines()
+        self.pod_ids = {name: i for i, name in enumerate(self.pod_names)}
+        meta_path = os.path.join(run_dir, 'meta.json')
+        self.meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        self.columns = {}
+        self.refresh()
+
+    def refresh(self):
+        """Re-map the columns, e.g. to see what a running monitor appended since."""
+        paths = {name: column_path(self.run_dir, name) for name in COLUMNS}
+        n = min(os.path.getsize(paths[name]) // COLUMNS[name].itemsize for name in COLUMNS)
+        for name, dtype in COLUMNS.items():
+            if n == 0:
+                self.columns[name] = np.empty(0, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(paths[name], dtype=dtype, mode='r', shape=(n,))
+        return n
+
+    def __len__(self):
+        return len(self.columns['ts'])
+
+    def time_range(self):
+        ts = self.columns['ts']
+        return (float(ts[0]), float(ts[-1])) if len(ts) else (None, None)
+
+    def span(self, start=None, end=None):
+        """Record index range [lo, hi) of the samples with start <= ts < end."""
+        ts = self.columns['ts']
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side='left'))
+        return lo, hi
+
+    def read(self, start=None, end=None):
+        """{column: array} of all samples with start <= ts < end, as views of the mapped files."""
+        lo, hi = self.span(start, end)
+        return {name: column[lo:hi] for name, column in self.columns.items()}
+
+    def pod_samples(self, pod_name, start=None, end=None):
+        """Samples of one pod in a time range; this selection has to copy."""
+        window = self.read(start, end)
+        mask = window['pod'] == self.pod_ids[pod_name]
+        return {name: column[mask] for name, column in window.items() if name != 'pod'}
+
+    def wall_time(self, ts):
+        """Convert monitor monotonic timestamps to wall clock time."""
+        return np.asarray(ts) - self.meta['monotonic_start'] + self.meta['wall_start']
+
+
+def summary(run_dir):
+    reader = SampleReader(run_dir)
+    first, last = reader.time_range()
+    print(f"{len(reader)} samples of {len(reader.pod_names)} pods")
+    if first is None:
+        return
+    print(f"{last - first:.1f}s from {time.ctime(float(reader.wall_time(first)))}")
+    window = reader.read()
+    # Records are in time order, a stable sort by pod keeps each pod's samples in time order
+    order = np.argsort(window['pod'], kind='stable')
+    pods, first_idx, counts = np.unique(window['pod'][order], return_index=True, return_counts=True)
+    first = order[first_idx]
+    last = order[first_idx + counts - 1]
+    duration = window['src_ts'][last] - window['src_ts'][first]
+    rx_bytes = window['rx'][last].astype(np.int64) - window['rx'][first].astype(np.int64)
+    tx_bytes = window['tx'][last].astype(np.int64) - window['tx'][first].astype(np.int64)
+    for i, pod_id in enumerate(pods):
+        name = reader.pod_names[pod_id]
+        if counts[i] < 2 or duration[i] <= 0:
+            print(f"{name}: {counts[i]} samples")
+            continue
+        print(f"{name}: {counts[i]} samples, RX {rx_bytes[i] / 1e6:.1f} MB, TX {tx_bytes[i] / 1e6:.1f} MB, "
+              f"mean RX rate {rx_bytes[i] * 8 / duration[i] / 1e6:.3f} Mbps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a run recorded with net_stat_monitor.py --record")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="samples and traffic per pod")
+    summary_parser.add_argument("run_dir")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        summary(args.run_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scripts are not a package, import them the way they import each other
+for path in (ROOT, os.path.join(ROOT, "ml_pipeline")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,88 @@
+import os
+
+from conntrack_flows import FlowTracker, parse_conntrack_line, read_conntrack
+from node_counter_agent import collect_flows
+
+CIDR = "10.244.0.0/16"
+
+
+def entry(sport, orig_bytes=None, reply_bytes=None, src="10.244.1.5", service="10.96.0.10", backend="10.244.2.7"):
+    """One /proc/net/nf_conntrack line, without [ACCOUNTING] fields when the byte counts are None."""
+    orig_acct = f" packets=1 bytes={orig_bytes}" if orig_bytes is not None else ""
+    reply_acct = f" packets=1 bytes={reply_bytes}" if reply_bytes is not None else ""
+    return (f"ipv4     2 tcp      6 431999 ESTABLISHED src={src} dst={service} sport={sport} dport=80{orig_acct} "
+            f"src={backend} dst={src} sport=8080 dport={sport}{reply_acct} [ASSURED] mark=0 zone=0 use=2")
+
+
+def flows(*lines):
+    parsed = (parse_conntrack_line(line) for line in lines)
+    return {key: (src, dst, orig_bytes, reply_bytes) for key, src, dst, orig_bytes, reply_bytes in parsed}
+
+
+def test_parse_attributes_service_traffic_to_the_backend():
+    key, src, dst, orig_bytes, reply_bytes = parse_conntrack_line(entry(40000, 1000, 5000))
+    assert key == ("tcp", "10.244.1.5", "40000", "10.96.0.10", "80")
+    assert (src, dst, orig_bytes, reply_bytes) == ("10.244.1.5", "10.244.2.7", 1000, 5000)
+
+
+def test_update_diffs_byte_counters():
+    tracker = FlowTracker(CIDR)
+    assert tracker.update(flows(entry(40000, 1000, 5000)), 10.0) == ({}, None)
+    pair_bytes, interval = tracker.update(flows(entry(40000, 1500, 9000)), 11.0)
+    assert interval == 1.0
+    assert pair_bytes == {("10.244.1.5", "10.244.2.7"): 500, ("10.244.2.7", "10.244.1.5"): 4000}
+
+
+def test_update_counter_reset_counts_from_zero():
+    tracker = FlowTracker(CIDR)
+    tracker.update(flows(entry(40000, 1000, 5000)), 10.0)
+    # Same 5-tuple, new connection: the counters start over below the previous values
+    pair_bytes, _ = tracker.update(flows(entry(40000, 200, 300)), 11.0)
+    assert pair_bytes == {("10.244.1.5", "10.244.2.7"): 200, ("10.244.2.7", "10.244.1.5"): 300}
+    pair_bytes, _ = tracker.update(flows(entry(40000, 250, 300)), 12.0)
+    assert pair_bytes == {("10.244.1.5", "10.244.2.7"): 50}
+
+
+def test_update_flow_disappearing_between_reads():
+    tracker = FlowTracker(CIDR)
+    tracker.update(flows(entry(40000, 1000, 5000), entry(40001, 10, 10)), 10.0)
+    # 40000 left the table: nothing is reported for it, and never a negative value
+    pair_bytes, _ = tracker.update(flows(entry(40001, 30, 10)), 11.0)
+    assert pair_bytes == {("10.244.1.5", "10.244.2.7"): 20}
+    # A flow that shows up is counted from zero
+    pair_bytes, _ = tracker.update(flows(entry(40001, 30, 10), entry(40002, 70, 0)), 12.0)
+    assert pair_bytes == {("10.244.1.5", "10.244.2.7"): 70}
+
+
+def test_update_without_accounting():
+    tracker = FlowTracker(CIDR)
+    lines = flows(entry(40000), entry(40001))
+    assert tracker.update(lines, 10.0) == ({}, None)
+    assert tracker.unaccounted == 2
+    pair_bytes, interval = tracker.update(lines, 11.0)
+    assert (pair_bytes, interval) == ({}, 1.0)
+    assert tracker.unaccounted == 2
+
+
+def test_update_ignores_flows_outside_the_cidr():
+    tracker = FlowTracker(CIDR)
+    outside = entry(40000, 1000, 5000, src="192.168.0.4")
+    tracker.update(flows(outside), 10.0)
+    assert tracker.update(flows(entry(40000, 2000, 6000, src="192.168.0.4")), 11.0)[0] == {}
+
+
+def test_collect_flows_from_proc(tmp_path):
+    def dump(*lines):
+        path = tmp_path / "net" / "nf_conntrack"
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_text("\n".join(lines) + "\n")
+
+    tracker = FlowTracker(CIDR)
+    dump(entry(40000, 1000, 5000), entry(40001))
+    assert len(read_conntrack(str(tmp_path), "")) == 2
+    assert collect_flows(tracker, str(tmp_path), "") == []
+    dump(entry(40000, 1500, 5000), entry(40001))
+    (report,) = collect_flows(tracker, str(tmp_path), "")
+    assert (report["src"], report["dst"], report["bytes"]) == ("10.244.1.5", "10.244.2.7", 500)
+    assert report["interval"] > 0
+    assert tracker.unaccounted == 1
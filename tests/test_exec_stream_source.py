@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("kubernetes")
+
+import exec_stream_source
+from exec_stream_source import ExecSession, ExecStreamSessions, parse_counter_line
+
+
+class FakeClient:
+    def __init__(self, output):
+        self.output = output
+
+    def update(self, timeout=0):
+        pass
+
+    def is_open(self):
+        return True
+
+    def peek_stdout(self):
+        return bool(self.output)
+
+    def read_stdout(self):
+        output, self.output = self.output, ""
+        return output
+
+
+def line(uptime, rx, tx):
+    return f"{uptime} eth0: {rx} 10 0 0 0 0 0 0 {tx} 20 0 0 0 0 0 0\n"
+
+
+def test_parse_counter_line():
+    assert parse_counter_line(line(12.5, 1000, 2000).strip()) == (12.5, 1000, 2000)
+    assert parse_counter_line("12.5 eth0: 1000") is None
+
+
+def test_samples_stay_monotonic_when_the_pod_uptime_starts_over(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(exec_stream_source.time, "monotonic", lambda: clock[0])
+    sessions = ExecStreamSessions(api_instance=None, interval=1.0)
+    session = ExecSession("train-2", "default")
+
+    session.client = FakeClient(line(5000.0, 100, 10))
+    sessions._consume(session)
+    assert session.latest == (100.0, 100, 10)
+    clock[0] = 101.2
+    session.client.output = line(5001.0, 200, 20)
+    sessions._consume(session)
+    assert session.latest == (101.0, 200, 20)
+    assert session.lag_s == pytest.approx(0.2)
+
+    # Rescheduled: the reconnected session sees a much smaller uptime
+    session.origin = None
+    clock[0] = 110.0
+    session.client = FakeClient(line(3.0, 50, 5) + line(4.0, 60, 6))
+    sessions._consume(session)
+    assert session.latest == (111.0, 60, 6)
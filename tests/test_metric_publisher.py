@@ -0,0 +1,30 @@
+from frontend.metric_publisher import MetricPublisher, dashboard_key
+
+
+def result(from_node, to_node, bandwidth, optimized=0):
+    return {"from": from_node, "to": to_node, "bandwidth": bandwidth, "optimized": optimized}
+
+
+def queued(publisher):
+    return list(publisher.pending.values())
+
+
+def test_no_coalescing_by_default():
+    # Not started: results stay queued
+    publisher = MetricPublisher("http://127.0.0.1:1/update_data_batch")
+    series = [result(1, 2, bandwidth) for bandwidth in (10, 20, 30)]
+    for item in series:
+        publisher.publish(item)
+    assert queued(publisher) == series
+    assert publisher.stats()["coalesced"] == 0
+
+
+def test_dashboard_key_keeps_the_bandwidth_time_series():
+    publisher = MetricPublisher("http://127.0.0.1:1/update_data_batch", coalesce_key=dashboard_key)
+    for bandwidth in (10, 20):
+        publisher.publish(result(1, 2, bandwidth))
+        publisher.publish(result(2, 3, bandwidth))
+    publisher.publish({"from": 1, "to": 1, "optimized": 2})
+    publisher.publish({"from": 1, "to": 1, "optimized": 2})
+    assert queued(publisher) == [result(1, 2, 10), result(2, 3, 20), result(1, 2, 20), {"from": 1, "to": 1, "optimized": 2}]
+    assert publisher.stats()["coalesced"] == 2
@@ -0,0 +1,51 @@
+import importlib
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("sklearn")
+
+
+@pytest.fixture(scope="module")
+def ml_app(tmp_path_factory):
+    # ml_app opens app.log in the working directory on import
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("ml_app"))
+    try:
+        yield importlib.import_module("ml_app")
+    finally:
+        os.chdir(cwd)
+
+
+def images(n=300, seed=0):
+    """MNIST-like float64 pixels, integral values 0-255 like fetch_openml returns."""
+    return np.random.default_rng(seed).integers(0, 256, size=(n, 28 * 28)).astype(np.float64)
+
+
+def test_features_of_compact_payload_match_float_division(ml_app):
+    X = images()
+    train, test = ml_app.preprocess_data({'X': X, 'y': np.zeros(len(X), dtype=np.int32)})
+    assert train['X'].dtype == np.uint8
+    # Small blocks so the blockwise path is exercised as well
+    result = np.concatenate([ml_app.features(train, block_rows=7), ml_app.features(test)])
+    expected = X.astype('float32') / 255.0
+    assert result.dtype == np.float32
+    assert np.all(np.abs(result - expected) <= np.spacing(expected))
+
+    # Every pixel value, not only those the random images happen to contain
+    every_value = np.arange(256, dtype=np.uint8)
+    result = ml_app.features({'X': every_value, 'scale': ml_app.IMAGE_SCALE})
+    expected = every_value.astype('float32') / 255.0
+    assert np.all(np.abs(result - expected) <= np.spacing(expected))
+
+
+def test_non_integral_images_keep_the_float_path(ml_app):
+    X = images() / 3.0
+    assert ml_app.compact_images(X) is X
+    train, test = ml_app.preprocess_data({'X': X, 'y': np.zeros(len(X), dtype=np.int32)})
+    assert 'scale' not in train and 'scale' not in test
+    assert train['X'].dtype == np.float32
+    assert ml_app.features(train) is train['X']
+    np.testing.assert_array_equal(np.concatenate([train['X'], test['X']]), X.astype('float32') / 255.0)
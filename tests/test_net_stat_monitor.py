@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("kubernetes")
+
+from net_stat_monitor import MonitorPipeline, merge_measurements
+
+NAMESPACE = "default"
+# download-0 -> preprocess-1 -> train-2, test-3; metrics-agent matches the selector but is not in the pipeline
+TOPOLOGY = {
+    "download-0": ["preprocess-1"],
+    "preprocess-1": ["train-2", "test-3"],
+    "train-2": ["test-3"],
+    "test-3": [],
+    "metrics-agent": None,
+}
+SHARDS = {"download-0": 0, "preprocess-1": 0, "train-2": 1, "test-3": 2, "metrics-agent": 2}
+MB = 1_000_000
+
+
+def events():
+    return [("added", pod, NAMESPACE, receivers) for pod, receivers in TOPOLOGY.items()]
+
+
+def run_sharded(ticks, traffic):
+    """Feed shard workers and a coordinator like run_sharded does, return the published results per tick."""
+    published = []
+    coordinator = MonitorPipeline(published.append, verbose=False)
+    coordinator.apply_events(events())
+    workers = {shard: MonitorPipeline(lambda result: None, verbose=False) for shard in set(SHARDS.values())}
+    for worker in workers.values():
+        worker.apply_events(events())
+    rx = dict.fromkeys(SHARDS, 0)
+    tx = dict.fromkeys(SHARDS, 0)
+    latest = {}
+    per_tick = []
+    for tick in range(ticks):
+        for sender, receiver, mbytes in traffic:
+            tx[sender] += mbytes * MB
+            rx[receiver] += mbytes * MB
+        fresh = []
+        for shard, worker in workers.items():
+            pods = [(pod, NAMESPACE) for pod, owner in SHARDS.items() if owner == shard]
+            counters = {pod: (rx[pod], tx[pod], float(tick)) for pod, _ in pods}
+            if tick == 0:
+                worker.baseline(tick, pods, counters)
+                continue
+            latest[shard] = worker.measure(tick, pods, counters)
+            fresh.append(latest[shard])
+        if tick % 3 == 2:
+            # A shard whose report of the previous tick arrived late
+            fresh.append(latest[1])
+        published.clear()
+        if fresh:
+            coordinator.attribute(merge_measurements(latest, fresh))
+        per_tick.append((list(published), list(coordinator.edges)))
+    return per_tick
+
+
+def test_sharded_attribution_reports_each_edge_once():
+    traffic = [("preprocess-1", "train-2", 50), ("preprocess-1", "test-3", 20), ("download-0", "metrics-agent", 30)]
+    per_tick = run_sharded(8, traffic)
+
+    seen = set()
+    for results, edges in per_tick:
+        result_edges = [(result["from"], result["to"]) for result in results]
+        assert len(result_edges) == len(set(result_edges))
+        metric_edges = [(sender, receiver) for sender, receiver, _, _ in edges]
+        assert len(metric_edges) == len(set(metric_edges))
+        assert all(receiver != "metrics-agent" for _, receiver in metric_edges)
+        seen.update(result_edges)
+    # preprocess-1 (2) sends to train-2 (3) and test-3 (4)
+    assert seen == {(2, 3), (2, 4)}
+    results, edges = per_tick[-1]
+    assert {(sender, receiver) for sender, receiver, _, _ in edges} == {
+        ("preprocess-1", "train-2"), ("preprocess-1", "test-3")}
+    bandwidth = {result["to"]: result["bandwidth"] for result in results}
+    assert bandwidth == {3: pytest.approx(400.0), 4: pytest.approx(160.0)}
@@ -0,0 +1,92 @@
+import os
+
+from node_counter_agent import build_veth_map, collect_samples, list_pod_sandboxes, refresh_veth_map
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def add_interface(sysfs, ifname, ifindex, rx_bytes, tx_bytes):
+    iface = os.path.join(sysfs, "class", "net", ifname)
+    write(os.path.join(iface, "ifindex"), f"{ifindex}\n")
+    write(os.path.join(iface, "statistics", "rx_bytes"), f"{rx_bytes}\n")
+    write(os.path.join(iface, "statistics", "tx_bytes"), f"{tx_bytes}\n")
+
+
+def add_pod(proc, pid, iflink):
+    write(os.path.join(proc, str(pid), "root", "sys", "class", "net", "eth0", "iflink"), f"{iflink}\n")
+
+
+def fake_crictl(tmp_path, failing_id=None):
+    """A crictl that lists sandboxes a and b, inspectp of failing_id exits non-zero."""
+    script = tmp_path / "crictl"
+    script.write_text(f"""#!/bin/sh
+if [ "$1" = pods ]; then
+    echo '{{"items": [{{"id": "a", "metadata": {{"namespace": "default", "name": "download-0"}}}},
+                     {{"id": "b", "metadata": {{"namespace": "default", "name": "train-3"}}}}]}}'
+    exit 0
+fi
+id=$4
+[ "$id" = "{failing_id}" ] && exit 1
+[ "$id" = a ] && echo '{{"info": {{"pid": 100}}}}'
+[ "$id" = b ] && echo '{{"info": {{"pid": 200}}}}'
+exit 0
+""")
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_build_veth_map_and_collect_samples(tmp_path):
+    sysfs, proc = str(tmp_path / "sys"), str(tmp_path / "proc")
+    add_interface(sysfs, "lo", 1, 5, 5)
+    add_interface(sysfs, "eth0", 2, 1000, 2000)
+    add_interface(sysfs, "veth1a", 7, 300, 400)
+    add_interface(sysfs, "veth2b", 8, 10, 20)
+    add_interface(sysfs, "cali9", 9, 1, 1)
+    add_pod(proc, 100, 7)
+    add_pod(proc, 200, 8)
+    # hostNetwork pod, no eth0 in its own namespace
+    os.makedirs(os.path.join(proc, "300", "root"))
+
+    veth_map = build_veth_map([("default", "download-0", 100), ("default", "train-3", 200),
+                               ("kube-system", "kube-proxy-x", 300)], proc)
+    assert veth_map == {7: ("default", "download-0"), 8: ("default", "train-3")}
+
+    samples, unmapped = collect_samples(veth_map, sysfs)
+    by_pod = {sample["pod"]: sample for sample in samples}
+    assert set(by_pod) == {"download-0", "train-3"}
+    # What the host veth receives the pod sent
+    assert (by_pod["download-0"]["rx"], by_pod["download-0"]["tx"]) == (400, 300)
+    assert (by_pod["train-3"]["rx"], by_pod["train-3"]["tx"]) == (20, 10)
+    # cali9 has no pod yet, eth0 and lo are not pod veths
+    assert unmapped == 1
+
+
+def test_list_pod_sandboxes_skips_failed_inspect(tmp_path):
+    crictl = fake_crictl(tmp_path, failing_id="a")
+    assert list_pod_sandboxes(crictl) == [("default", "train-3", 200)]
+
+
+def test_refresh_veth_map_keeps_previous_map_when_crictl_fails(tmp_path):
+    proc = str(tmp_path / "proc")
+    add_pod(proc, 100, 7)
+    add_pod(proc, 200, 8)
+    previous = {5: ("default", "old-0")}
+
+    assert refresh_veth_map(previous, str(tmp_path / "missing-crictl"), proc) is previous
+
+    failing = tmp_path / "failing-crictl"
+    failing.write_text("#!/bin/sh\nexit 1\n")
+    failing.chmod(0o755)
+    assert refresh_veth_map(previous, str(failing), proc) is previous
+
+    garbage = tmp_path / "garbage-crictl"
+    garbage.write_text("#!/bin/sh\necho not json\n")
+    garbage.chmod(0o755)
+    assert refresh_veth_map(previous, str(garbage), proc) is previous
+
+    assert refresh_veth_map(previous, fake_crictl(tmp_path), proc) == {
+        7: ("default", "download-0"), 8: ("default", "train-3")}
@@ -0,0 +1,52 @@
+import ipaddress
+import random
+
+from capacity_planner import count_node_rules
+from policy_plan import aggregate_accept_ips, choose_aggregation_prefix, plan_subchain_rules
+
+NETWORKS = [ipaddress.ip_network("10.244.1.0/24"), ipaddress.ip_network("10.244.2.0/24")]
+
+
+def test_aggregate_only_merges_same_protocol_and_port():
+    accepts = [
+        ("10.244.1.4", "tcp", None),
+        ("10.244.1.5", "tcp", None),
+        ("10.244.1.6", "udp", None),
+        ("10.244.1.7", "tcp", "8081"),
+        ("10.244.2.4", "tcp", None),
+        ("0.0.0.0/0.0.0.0", None, None),
+    ]
+    assert aggregate_accept_ips(accepts, NETWORKS, 29) == {
+        ("10.244.1.0/29", "tcp", None): [0, 1],
+        ("10.244.1.0/29", "udp", None): [2],
+        ("10.244.1.0/29", "tcp", "8081"): [3],
+        ("10.244.2.0/29", "tcp", None): [4],
+    }
+    # Never wider than the node subnet
+    assert {block for block, _, _ in aggregate_accept_ips(accepts, NETWORKS, 16)} == {"10.244.1.0/24", "10.244.2.0/24"}
+
+
+def test_choose_aggregation_prefix_widens_until_the_budget_fits():
+    accepts = [(f"10.244.1.{host}", "tcp", None) for host in range(2, 66)]
+    chains = [(1, accepts)]
+    # One jump, one deny and one ACCEPT per /30 of the 64 addresses
+    assert choose_aggregation_prefix(chains, NETWORKS) == (30, 2 + 17)
+    prefix, total = choose_aggregation_prefix(chains, NETWORKS, rule_budget=6)
+    assert (prefix, total) == (27, 2 + 3)
+    assert choose_aggregation_prefix(chains, NETWORKS, rule_budget=1) == (24, 3)
+
+
+def test_plan_subchain_rules_ends_with_default_accept():
+    random.seed(1)
+    pods = ["10.244.1.2", "10.244.1.3", "10.244.2.2"]
+    specs = plan_subchain_rules("10.244.1.2", pods, is_ingress=True)
+    assert specs[-1] == {'target': "ACCEPT"}
+    assert all(spec.get('src') != "10.244.1.2" for spec in specs)
+    assert all('dport' not in spec for spec in specs if spec['target'] == "ACCEPT")
+
+
+def test_count_node_rules_runs_offline():
+    counts = count_node_rules(nodes=2, pods_per_node=5, rule_budget=200)
+    assert counts["pods"] == 10
+    assert counts["optimized_rules"] <= counts["initialized_rules"]
+    assert counts["optimized_rules"] - 2 <= 200 or counts["prefix"] == 24
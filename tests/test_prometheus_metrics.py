@@ -0,0 +1,91 @@
+import math
+import re
+import urllib.error
+import urllib.request
+
+import pytest
+
+from prometheus_metrics import CONTENT_TYPE, MetricsExporter, MetricsSnapshot, start_metrics_server
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_exposition(text):
+    """{(name, ((label, value), ...)): value} of a text exposition; every line must be valid."""
+    samples = {}
+    types = {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("gauge", "counter", "summary")
+            types[name] = kind
+            continue
+        if line.startswith("# HELP "):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        base = re.sub(r'_(sum|count)$', '', name)
+        assert name in types or base in types, f"{name} without # TYPE"
+        labels = tuple(LABEL.findall(labels or ""))
+        key = (name, labels)
+        assert key not in samples, f"duplicate sample {key}"
+        samples[key] = float(value)
+    return samples
+
+
+def scrape(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        assert response.headers["Content-Type"] == CONTENT_TYPE
+        return response.read().decode()
+
+
+def snapshot(latencies, completed):
+    return MetricsSnapshot(
+        pod_rates=[("train-2", "default", 12.5, 0.5), ('we"ird', "default", float("nan"), 0.0)],
+        edges=[("download-0", "train-2", 12.5, 3.0)],
+        latencies=latencies,
+        loop={"loop_duration_seconds": 0.02},
+        counters={"transfers_completed": completed})
+
+
+def test_scrape_metrics_server():
+    exporter = MetricsExporter()
+    server = start_metrics_server(exporter, 0)
+    port = server.server_address[1]
+    try:
+        exporter.observe_latencies([0.1, 0.2, 0.3])
+        exporter.update(snapshot([0.1, 0.2, 0.3], 1))
+        first = parse_exposition(scrape(port))
+        exporter.observe_latencies([0.4])
+        exporter.update(snapshot([0.4], 2))
+        second = parse_exposition(scrape(port))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert first[("cn_pod_rx_mbps", (("pod", "train-2"), ("namespace", "default")))] == 12.5
+    assert math.isnan(first[("cn_pod_rx_mbps", (("pod", 'we\\"ird'), ("namespace", "default")))])
+    assert first[("cn_edge_bandwidth_mbps", (("src", "download-0"), ("dst", "train-2")))] == 12.5
+    assert first[("cn_sample_latency_seconds", (("quantile", "0.5"),))] == 0.2
+    assert first[("cn_loop_duration_seconds", ())] == 0.02
+    assert first[("cn_transfers_completed_total", ())] == 1
+
+    # The summary's _sum and _count cover every poll, not only the last one
+    assert first[("cn_sample_latency_seconds_count", ())] == 3
+    assert second[("cn_sample_latency_seconds_count", ())] == 4
+    assert math.isclose(first[("cn_sample_latency_seconds_sum", ())], 0.6)
+    assert math.isclose(second[("cn_sample_latency_seconds_sum", ())], 1.0)
+    assert second[("cn_sample_latency_seconds", (("quantile", "0.5"),))] == 0.4
+
+
+def test_unknown_path_is_not_found():
+    server = start_metrics_server(MetricsExporter(), 0)
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from sample_store import SampleReader, SampleWriter, column_path
+
+
+def write_run(run_dir, rows):
+    writer = SampleWriter(str(run_dir))
+    for ts, pods, src_ts, rx, tx in rows:
+        writer.append(ts, pods, src_ts, rx, tx)
+    writer.close()
+
+
+def test_reopened_run_keeps_timestamps_ordered(tmp_path):
+    write_run(tmp_path, [(10.0, ["a", "b"], [9.9, 9.8], [1, 2], [3, 4])])
+
+    writer = SampleWriter(str(tmp_path))
+    assert writer.last_ts == 10.0
+    with pytest.raises(ValueError):
+        writer.append(5.0, ["a"], [5.0], [1], [1])
+    writer.append(11.0, ["b", "c"], [10.9, 10.8], [5, 6], [7, 8])
+    writer.close()
+
+    reader = SampleReader(str(tmp_path))
+    assert reader.pod_names == ["a", "b", "c"]
+    window = reader.read(10.5)
+    assert window["pod"].tolist() == [1, 2]
+    assert window["rx"].tolist() == [5, 6]
+
+
+def test_reopened_run_drops_incomplete_records(tmp_path):
+    write_run(tmp_path, [(10.0, ["a"], [10.0], [1], [2])])
+    # Killed after writing pod and src_ts of the next iteration, before ts
+    for name, value in (("pod", np.uint32(0)), ("src_ts", np.float64(11.0))):
+        with open(column_path(str(tmp_path), name), "ab") as f:
+            f.write(value.tobytes())
+
+    write_run(tmp_path, [(12.0, ["a"], [12.0], [3], [4])])
+
+    reader = SampleReader(str(tmp_path))
+    window = reader.read()
+    assert window["ts"].tolist() == [10.0, 12.0]
+    assert window["src_ts"].tolist() == [10.0, 12.0]
+    assert window["rx"].tolist() == [1, 3]
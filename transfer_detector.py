@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Streaming transfer-phase detection over all pods at once.
+
+TransferDetector keeps a few state arrays per pod slot (aligned with the slots
+of monitor_history.PodHistory) and advances all of them with one vectorized
+update per sampling tick:
+
+  - start: the RX rate exceeds the pod's idle baseline by `start_mbps` for
+    `min_on` consecutive samples. The baseline is an EWMA of the idle rate, so
+    steady background traffic does not count as a transfer.
+  - end (hysteresis): the rate stays within `stop_mbps` of the baseline for
+    `min_off` consecutive samples.
+  - end (change point): a one-sided CUSUM on the rate relative to the transfer's
+    own level fires when the rate has clearly dropped, e.g. from 900 Mbps back
+    to a 50 Mbps background that never falls below the stop threshold.
+
+update() returns start/end events with the transfer's start/end time, bytes and
+duration. Bytes are integrated from rate x interval while the transfer is active.
+
+Usage:
+    python3 transfer_detector.py bench --pods 1000 --hz 10 --seconds 60
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+
+class TransferDetector:
+    def __init__(self, max_pods=1024, start_mbps=10.0, stop_mbps=5.0, min_on=1, min_off=2,
+                 baseline_alpha=0.1, level_alpha=0.2, cusum_drift=0.5, cusum_threshold=1.0):
+        self.start_mbps = start_mbps
+        self.stop_mbps = stop_mbps
+        self.min_on = min_on
+        self.min_off = min_off
+        self.baseline_alpha = baseline_alpha
+        self.level_alpha = level_alpha
+        self.cusum_drift = cusum_drift
+        self.cusum_threshold = cusum_threshold
+        self.active = np.zeros(max_pods, dtype=bool)
+        self.baseline = np.zeros(max_pods)
+        self.level = np.zeros(max_pods)
+        self.on_count = np.zeros(max_pods, dtype=np.int64)
+        self.off_count = np.zeros(max_pods, dtype=np.int64)
+        self.cusum = np.zeros(max_pods)
+        self.start_ts = np.full(max_pods, np.nan)
+        self.pending_start_ts = np.full(max_pods, np.nan)
+        self.last_high_ts = np.full(max_pods, np.nan)
+        self.bytes = np.zeros(max_pods)
+        self.pending_bytes = np.zeros(max_pods)
+        self.samples = np.zeros(max_pods, dtype=np.int64)
+
+    def release(self, slot):
+        """Forget a slot, e.g. when its pod is deleted."""
+        for array, value in ((self.active, False), (self.baseline, 0.0), (self.level, 0.0), (self.on_count, 0),
+                             (self.off_count, 0), (self.cusum, 0.0), (self.start_ts, np.nan),
+                             (self.pending_start_ts, np.nan), (self.last_high_ts, np.nan), (self.bytes, 0.0),
+                             (self.pending_bytes, 0.0), (self.samples, 0)):
+            array[slot] = value
+
+    def active_slots(self):
+        return np.flatnonzero(self.active)
+
+    def update(self, slots, ts, rate_mbps, interval_s):
+        """
+        Advance the detector with one sample per slot.
+
+        slots, ts, rate_mbps and interval_s are aligned arrays (ts/interval_s may be
+        scalars); slots whose rate is NaN have no new sample and keep their state.
+        Returns a list of event dicts (slot, event "start"/"end", start_ts, end_ts,
+        bytes, duration_s).
+        """
+        slots = np.asarray(slots)
+        ts = np.broadcast_to(np.asarray(ts, dtype=float), slots.shape)
+        rate = np.asarray(rate_mbps, dtype=float)
+        interval = np.broadcast_to(np.asarray(interval_s, dtype=float), slots.shape)
+        valid = ~np.isnan(rate)
+        slots, ts, rate, interval = slots[valid], ts[valid], rate[valid], interval[valid]
+        moved = rate * 1e6 / 8 * interval
+
+        active = self.active[slots]
+        above = rate - self.baseline[slots]
+        high = above > self.start_mbps
+        low = above < self.stop_mbps
+
+        # Idle pods: count consecutive high samples, remember where the run began
+        idle = ~active
+        run_begins = idle & high & (self.on_count[slots] == 0)
+        self.pending_start_ts[slots[run_begins]] = ts[run_begins] - interval[run_begins]
+        self.pending_bytes[slots[idle & ~high]] = 0.0
+        self.pending_bytes[slots[idle & high]] += moved[idle & high]
+        self.on_count[slots] = np.where(idle & high, self.on_count[slots] + 1, 0)
+        quiet = idle & ~high
+        self.baseline[slots[quiet]] += self.baseline_alpha * (rate[quiet] - self.baseline[slots[quiet]])
+        starting = idle & (self.on_count[slots] >= self.min_on)
+
+        # Active pods: integrate bytes, track the transfer level and the drop statistic
+        self.bytes[slots[active]] += moved[active]
+        self.off_count[slots] = np.where(active & low, self.off_count[slots] + 1, 0)
+        still_high = active & ~low
+        self.last_high_ts[slots[still_high]] = ts[still_high]
+        level = self.level[slots]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.where(level > 0, rate / level, 1.0)
+        cusum = np.maximum(0.0, self.cusum[slots] + (1.0 - self.cusum_drift) - relative)
+        self.cusum[slots] = np.where(active, cusum, 0.0)
+        steady = active & (relative > 1.0 - self.cusum_drift)
+        self.level[slots[steady]] += self.level_alpha * (rate[steady] - self.level[slots[steady]])
+        self.samples[slots[active]] += 1
+        ending = active & ((self.off_count[slots] >= self.min_off) | (self.cusum[slots] > self.cusum_threshold))
+
+        events = []
+        for slot, end_ts in zip(slots[ending], ts[ending]):
+            last_high = self.last_high_ts[slot]
+            end_ts = last_high if not np.isnan(last_high) else end_ts
+            events.append({
+                'slot': int(slot),
+                'event': 'end',
+                'start_ts': float(self.start_ts[slot]),
+                'end_ts': float(end_ts),
+                'bytes': float(self.bytes[slot]),
+                'duration_s': float(end_ts - self.start_ts[slot]),
+            })
+        ended = slots[ending]
+        self.active[ended] = False
+        self.off_count[ended] = 0
+        self.cusum[ended] = 0.0
+        # Whatever the pod still receives after the transfer is its new idle level
+        self.baseline[ended] = rate[ending]
+
+        started = slots[starting]
+        self.active[started] = True
+        self.on_count[started] = 0
+        self.start_ts[started] = self.pending_start_ts[started]
+        self.last_high_ts[started] = ts[starting]
+        self.level[started] = rate[starting]
+        self.bytes[started] = self.pending_bytes[started]
+        self.samples[started] = 1
+        self.cusum[started] = 0.0
+        for slot, now in zip(started, ts[starting]):
+            events.append({
+                'slot': int(slot),
+                'event': 'start',
+                'start_ts': float(self.start_ts[slot]),
+                'end_ts': None,
+                'bytes': float(self.bytes[slot]),
+                'duration_s': float(now - self.start_ts[slot]),
+            })
+        return events
+
+
+def synthetic_rates(pods, steps, hz, seed=0):
+    """
+    Rates of `pods` pods over `steps` samples: 0-2 Mbps idle noise, 20-50 Mbps
+    background on a quarter of the pods, and 1-4 transfers of 200-900 Mbps per pod.
+    Returns (rates, number of transfers).
+    """
+    rng = np.random.default_rng(seed)
+    rates = rng.uniform(0, 2, size=(pods, steps))
+    rates[::4] += rng.uniform(20, 50, size=(len(range(0, pods, 4)), 1))
+    transfers = 0
+    for pod in range(pods):
+        t = int(rng.integers(hz, 5 * hz))
+        for _ in range(int(rng.integers(1, 5))):
+            length = int(rng.integers(2 * hz, 10 * hz))
+            if t + length >= steps:
+                break
+            rates[pod, t:t + length] += rng.uniform(200, 900)
+            transfers += 1
+            t += length + int(rng.integers(2 * hz, 6 * hz))
+    return rates, transfers
+
+
+def bench(pods, hz, seconds, seed=0):
+    steps = int(seconds * hz)
+    rates, transfers = synthetic_rates(pods, steps, hz, seed)
+    detector = TransferDetector(max_pods=pods)
+    slots = np.arange(pods)
+    interval = 1.0 / hz
+    starts = ends = 0
+    durations = np.empty(steps)
+    for step in range(steps):
+        begin = time.perf_counter()
+        events = detector.update(slots, step * interval, rates[:, step], interval)
+        durations[step] = time.perf_counter() - begin
+        starts += sum(1 for e in events if e['event'] == 'start')
+        ends += sum(1 for e in events if e['event'] == 'end')
+    print(f"{pods} pods x {hz} Hz x {seconds}s: {steps} updates")
+    print(f"update: mean {durations.mean() * 1e3:.3f} ms, p99 {np.percentile(durations, 99) * 1e3:.3f} ms, "
+          f"budget per tick {interval * 1e3:.0f} ms ({durations.mean() / interval * 100:.2f}% used)")
+    print(f"transfers: {transfers} generated, {starts} starts, {ends} ends detected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized transfer detector")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help="synthetic pods x time benchmark")
+    bench_parser.add_argument("--pods", type=int, default=1000)
+    bench_parser.add_argument("--hz", type=int, default=10)
+    bench_parser.add_argument("--seconds", type=float, default=60)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.pods, args.hz, args.seconds, args.seed)
+
+
+if __name__ == "__main__":
+    main()